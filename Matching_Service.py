@@ -0,0 +1,9 @@
+import sys
+from utils.cli import main
+
+
+# Resident service mode: the published masters are indexed once, and single records or batches are matched against them over HTTP
+# Same as: python Recursive_Masterize_Hospital_Entities.py serve
+if __name__  ==  '__main__':
+
+    sys.exit(main(['serve']+sys.argv[1:]))
@@ -0,0 +1,81 @@
+"""
+    DOCSTRING:  Benchmark of the vectorized normalization (preprocess_dataframe + clean_dataframe_variants) against the previous row-wise functions,
+                on the sample input replicated to the requested number of rows. Verifies that both produce identical dataframes, once the row-wise ones
+                get the compact record-schema which the vectorized functions return (see apply_record_schema()).
+    USAGE:      python benchmarks/benchmark_normalization.py [n_rows ...]
+"""
+import numpy as np, pandas as pd, os, re, string, sys, time
+from contextlib import redirect_stdout
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import *
+from utils.util_functions import preprocess_dataframe, clean_dataframe_variants
+from utils.dtype_schema import apply_record_schema
+
+
+
+def rowwise_preprocess_dataframe(df):
+    """
+        DOCSTRING:  Previous preprocess_dataframe(): a python-lambda per cell.
+    """
+    df_copy=df.copy(deep=True)
+    df_copy.replace(np.nan, '', inplace=True)
+    for colname in df_copy.columns.values:
+        if colname=='COUNTRY':
+            df_copy[colname]=df_copy[colname].apply(lambda x: x.replace(' ','_'))
+        df_copy[colname]=df_copy[colname].astype(str).apply(lambda x: x.strip())
+    return df_copy
+
+
+
+def rowwise_clean_dataframe(df, columns_to_clean=config._COLUMNS_TO_CLEAN, fields_to_concat=config._FIELDS_TO_CONCAT, replace_punctuations=True):
+    """
+        DOCSTRING:  Previous clean_dataframe(): regex-replace per column, and a row-wise apply to concatenate the address fields.
+    """
+    copy_df=df.copy(deep=True)
+    special_chars=re.escape(string.punctuation)
+    for colname in copy_df.columns.values:
+        if colname in columns_to_clean and replace_punctuations:
+            copy_df[colname]=copy_df[colname].replace(r'['+special_chars+']', '', regex=True).str.lower()
+    for colname, cols_to_concat in fields_to_concat.items():
+        copy_df[colname]=copy_df[cols_to_concat].apply(lambda single_row: ''.join(single_row.values), axis=1)
+    copy_df.drop(labels=fields_to_concat['CONCAT_ADDRESS'], axis=1, inplace=True)
+    return copy_df
+
+
+
+def replicate_sample(raw_df, n_rows):
+    """
+        DOCSTRING:  Replicates the sample records up to n_rows, with unique SR_NUMs and a copy-number appended to the site-names.
+    """
+    n_copies=int(np.ceil(n_rows/raw_df.shape[0]))
+    df=pd.concat([raw_df]*n_copies, ignore_index=True).head(n_rows)
+    df['SITE_NAME']=df['SITE_NAME'].astype(str)+' #'+(np.arange(n_rows)//raw_df.shape[0]).astype(str)
+    df.index=pd.RangeIndex(100002, 100002+n_rows, name=raw_df.index.name)
+    return df
+
+
+
+if __name__=='__main__':
+    list_of_n_rows=[int(n_rows) for n_rows in sys.argv[1:]] or [10000, 100000]
+    raw_df=pd.read_csv(config._STATIC_FILE_NAME, index_col=0)
+    print('{:>10} {:>14} {:>14} {:>9}'.format('n_rows', 'row-wise (s)', 'vectorized (s)', 'speed-up'))
+    for n_rows in list_of_n_rows:
+        df=replicate_sample(raw_df, n_rows)
+
+        start=time.perf_counter()
+        expected_df=rowwise_preprocess_dataframe(df)
+        expected_cleaned_df=rowwise_clean_dataframe(expected_df, replace_punctuations=True)
+        expected_display_df=rowwise_clean_dataframe(expected_df, replace_punctuations=False)
+        expected_df, expected_cleaned_df, expected_display_df=[apply_record_schema(expected) for expected in [expected_df, expected_cleaned_df, expected_display_df]]
+        rowwise_seconds=time.perf_counter()-start
+
+        start=time.perf_counter()
+        preprocessed_df=preprocess_dataframe(df)
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            cleaned_df, display_df=clean_dataframe_variants(preprocessed_df)
+        vectorized_seconds=time.perf_counter()-start
+
+        pd.testing.assert_frame_equal(preprocessed_df, expected_df)
+        pd.testing.assert_frame_equal(cleaned_df, expected_cleaned_df)
+        pd.testing.assert_frame_equal(display_df, expected_display_df)
+        print('{:>10} {:>14.3f} {:>14.3f} {:>8.1f}x'.format(n_rows, rowwise_seconds, vectorized_seconds, rowwise_seconds/vectorized_seconds))
@@ -0,0 +1,168 @@
+"""
+    DOCSTRING:  Scaling benchmark of the full pipeline on synthetic hospital-records (see synthetic_records.py), for a list of input sizes.
+                Every size runs in a fresh process within a temporary working-directory, and reports:
+                    a. the wall-clock seconds of each stage: generate, preformat, preprocess-and-clean, masterize, evaluate;
+                    b. the peak RSS of the run (main process and worker-processes), and the number of candidate-pairs scored;
+                    c. the pair-wise precision, recall and F1 of the final cross-reference against the ground-truth clusters.
+                The results are printed and written to a csv, so that _MAXSIZE (or _NODE_MEMORY_BUDGET_MB), blocking, LSH and engine changes can be compared run over run.
+    USAGE:      python benchmarks/benchmark_scaling.py --sizes 1000 10000 100000 --maxsize 2000 --blocking --lsh --workers 4 --output scaling.csv
+"""
+import numpy as np, pandas as pd, os, re, sys, json, time, shutil, argparse, tempfile, subprocess
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import *
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; the peak RSS is not reported there
+    resource = None
+
+
+_STAGES = ['GENERATE', 'PREFORMAT', 'PREPROCESS_AND_CLEAN', 'MASTERIZE', 'EVALUATE']
+
+
+
+def pairwise_precision_recall(predicted_clusters, true_clusters):
+    """
+        DOCSTRING:  Pair-wise precision and recall of a clustering: a pair of records is a true-positive if it shares both its predicted and its true cluster.
+        INPUT:      Array-of-predicted-cluster-ids, Array-of-true-cluster-ids (aligned by record)
+        OUTPUT:     Dict of PRECISION, RECALL and F1 (None where undefined).
+    """
+    def n_pairs(group_sizes):
+        return int((group_sizes*(group_sizes-1)//2).sum())
+    clusters_df=pd.DataFrame({'PREDICTED': predicted_clusters, 'TRUE': true_clusters})
+    n_true_positives=n_pairs(clusters_df.groupby(['PREDICTED', 'TRUE']).size().values)
+    n_predicted_pairs=n_pairs(clusters_df.groupby('PREDICTED').size().values)
+    n_true_pairs=n_pairs(clusters_df.groupby('TRUE').size().values)
+    precision=n_true_positives/n_predicted_pairs if n_predicted_pairs>0 else None
+    recall=n_true_positives/n_true_pairs if n_true_pairs>0 else None
+    f1=2*precision*recall/(precision+recall) if precision and recall else None
+    return {'PRECISION': precision, 'RECALL': recall, 'F1': f1}
+
+
+
+def peak_rss_mb():
+    """
+        DOCSTRING:  Peak resident-set-size of this process and of its terminated worker-processes, in MB (ru_maxrss is in KB on Linux).
+    """
+    if resource is None:
+        return None, None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss/1024
+
+
+
+def run_single_size(n_records, config_assignments, n_workers, seed):
+    """
+        DOCSTRING:  Runs the whole pipeline once on n_records synthetic records, in a temporary working-directory which is removed afterwards.
+                    The config overrides are applied (and exported to the worker-processes) with apply_config_overrides() of the command-line.
+        INPUT:      Number-of-records, List of NAME=VALUE config-overrides, Number-of-worker-processes, Random-seed
+        OUTPUT:     Dict of the measurements.
+    """
+    config_overrides=apply_config_overrides(config_assignments)
+    from utils.preformat import preformat_input_natively
+    from utils.util_functions import preprocess_dataframe, clean_dataframe_variants
+    from utils.recursive_pipeline import masterize_country
+    from synthetic_records import generate_synthetic_records
+
+    measurements={'N_RECORDS': n_records, 'N_WORKERS': n_workers}
+    measurements.update(config_overrides)
+    work_dir=tempfile.mkdtemp(prefix='benchmark_scaling_')
+    original_dir=os.getcwd()
+    os.chdir(work_dir)
+    try:
+        for directory in [config._RAW_SCORES_DIRECTORY, config._CLEANED_SCORES_DIRECTORY, config._STAGING_AREA_DIRECTORY, config._LOGS_DIRECTORY]:
+            os.makedirs(directory, exist_ok=True)
+        log_file=os.path.abspath(os.path.join(config._LOGS_DIRECTORY, 'benchmark.log'))
+
+        with open(log_file, 'a') as log_stream, redirect_stdout(log_stream):
+            start=time.perf_counter()
+            raw_df, ground_truth=generate_synthetic_records(n_records, seed=seed)
+            raw_df.to_csv(config._RAW_STATIC_FILE_NAME, index=False)
+            measurements['GENERATE_SECONDS']=time.perf_counter()-start
+
+            start=time.perf_counter()
+            preformat_input_natively()
+            measurements['PREFORMAT_SECONDS']=time.perf_counter()-start
+
+            start=time.perf_counter()
+            site_master_df=preprocess_dataframe(pd.read_csv(config._STATIC_FILE_NAME, index_col=0))
+            entire_country_df, entire_country_df_copy=clean_dataframe_variants(site_master_df)
+            measurements['PREPROCESS_AND_CLEAN_SECONDS']=time.perf_counter()-start
+
+            start=time.perf_counter()
+            executor=ProcessPoolExecutor(max_workers=n_workers) if n_workers>1 else None
+            try:
+                country_master_df, cross_ref_df=masterize_country(curr_country=config._RAW_COUNTRY, entire_country_df=entire_country_df, entire_country_df_copy=entire_country_df_copy,
+                                                                  n_workers=n_workers, executor=executor, log_file=log_file)
+            finally:
+                if executor is not None:
+                    executor.shutdown()
+            measurements['MASTERIZE_SECONDS']=time.perf_counter()-start
+
+        start=time.perf_counter()
+        account_nums=site_master_df['ACCOUNT_NUM'].astype(np.int64)
+        predicted_clusters=cross_ref_df.set_index('SR_NUM_1')['SR_NUM_2'].reindex(site_master_df.index.values).values
+        measurements.update(pairwise_precision_recall(predicted_clusters, ground_truth.reindex(account_nums.values).values))
+        measurements['EVALUATE_SECONDS']=time.perf_counter()-start
+
+        with open(log_file) as log_stream:
+            measurements['N_PAIRS_SCORED']=sum(int(n_pairs) for n_pairs in re.findall(r'(\d+) candidate-pairs will be scored', log_stream.read()))
+        measurements['N_TRUE_CLUSTERS']=int(ground_truth.nunique())
+        measurements['N_MASTERS']=int(country_master_df.shape[0])
+        measurements['PEAK_RSS_MB'], measurements['PEAK_WORKER_RSS_MB']=peak_rss_mb()
+        return measurements
+    finally:
+        os.chdir(original_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+
+def parse_args():
+    parser=argparse.ArgumentParser(description='Scaling benchmark of the pipeline on synthetic hospital-records.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--maxsize', type=int, default=None, help='static _MAXSIZE, the records per minibatch; without it the minibatches are sized adaptively')
+    parser.add_argument('--node-memory-mb', type=float, default=config._NODE_MEMORY_BUDGET_MB, help='_NODE_MEMORY_BUDGET_MB of the adaptive batch-sizing')
+    parser.add_argument('--blocking', action='store_true', default=config._USE_BLOCKING, help='_USE_BLOCKING with the configured _BLOCKING_PASSES')
+    parser.add_argument('--lsh', action='store_true', default=config._USE_LSH, help='_USE_LSH candidate-pairs, with the whole country in one minibatch (_LSH_SINGLE_PASS)')
+    parser.add_argument('--workers', type=int, default=config._N_WORKERS)
+    parser.add_argument('--seed', type=int, default=config._RANDOM_SEED)
+    parser.add_argument('--output', default='benchmark_scaling.csv', help='csv of the measurements, appended to if it exists')
+    parser.add_argument('--single', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+
+if __name__=='__main__':
+    args=parse_args()
+    config_overrides={'_ADAPTIVE_BATCH_SIZING': args.maxsize is None, '_MAXSIZE': args.maxsize or config._MAXSIZE, '_NODE_MEMORY_BUDGET_MB': args.node_memory_mb,
+                      '_USE_BLOCKING': args.blocking, '_USE_LSH': args.lsh, '_BLOCKING_ESTIMATE_RECALL': False, '_USE_CHECKPOINTS': False}
+    if args.single:
+        # One size in this fresh process, so that the peak RSS belongs to that size alone
+        config_assignments=['{}={!r}'.format(config_name, config_value) for config_name, config_value in config_overrides.items()]
+        print(json.dumps(run_single_size(args.sizes[0], config_assignments, args.workers, args.seed)))
+        sys.exit(0)
+
+    list_of_measurements=list()
+    for n_records in args.sizes:
+        command=[sys.executable, os.path.abspath(__file__), '--single', '--sizes', str(n_records), '--node-memory-mb', str(args.node_memory_mb), '--workers', str(args.workers), '--seed', str(args.seed)]
+        if args.maxsize is not None:
+            command.extend(['--maxsize', str(args.maxsize)])
+        if args.blocking:
+            command.append('--blocking')
+        if args.lsh:
+            command.append('--lsh')
+        completed=subprocess.run(command, stdout=subprocess.PIPE, universal_newlines=True)
+        if completed.returncode!=0:
+            print('Something went wrong while benchmarking {} records.'.format(n_records))
+            continue
+        measurements=json.loads(completed.stdout.strip().splitlines()[-1])
+        list_of_measurements.append(measurements)
+        print('{N_RECORDS:>9} records: masterize {MASTERIZE_SECONDS:8.2f}s, total {total:8.2f}s, pairs {N_PAIRS_SCORED:>12}, peak-RSS {PEAK_RSS_MB} MB, '
+              'precision {PRECISION}, recall {RECALL}'.format(total=sum(measurements[stage+'_SECONDS'] for stage in _STAGES), **measurements))
+
+    if len(list_of_measurements)>0:
+        results_df=pd.DataFrame(list_of_measurements)
+        results_df.insert(0, 'TIMESTAMP', pd.Timestamp.now().isoformat(timespec='seconds'))
+        results_df.to_csv(args.output, index=False, mode='a', header=not os.path.exists(args.output))
+        print('\nWrote the measurements to {}'.format(args.output))
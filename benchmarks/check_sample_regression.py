@@ -0,0 +1,78 @@
+"""
+    DOCSTRING:  Regression check of the pipeline on the repo's sample (Data_Files/hospital_account_info_raw.csv): every config variant must publish the same
+                Master, Raw_Cross_Ref and Cross_Ref_Full_Report as the ones committed in Data_Files/Master_Data. Each variant runs the command-line
+                (Recursive_Masterize_Hospital_Entities.py) in a temporary working-directory, with its config overrides.
+                The outputs are compared cell by cell, with the numbers as numbers, since the compact schema writes the scores as integers.
+    USAGE:      python benchmarks/check_sample_regression.py [-s NAME=VALUE ...]
+"""
+import pandas as pd, os, sys, shutil, argparse, tempfile, subprocess
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import *
+
+
+_REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_OUTPUT_SUFFIXES = ['_Master.csv', '_Raw_Cross_Ref.csv', '_Cross_Ref_Full_Report.csv']
+# Each variant must keep the sample's output unchanged; the extra overrides of the command-line apply to all of them
+_VARIANTS = {'default': [], 'no_exact_duplicates': ['_COLLAPSE_EXACT_DUPLICATES=False'], 'exact_duplicates': ['_COLLAPSE_EXACT_DUPLICATES=True']}
+
+
+
+def read_output(csv_path):
+    """
+        DOCSTRING:  Reads a published csv with every column as a string, then turns the numeric ones into floats, so that 7 and 7.0 compare equal.
+    """
+    output_df=pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+    for colname in output_df.columns:
+        numeric_values=pd.to_numeric(output_df[colname], errors='coerce')
+        if numeric_values.notna().sum()==(output_df[colname]!='').sum():
+            output_df[colname]=numeric_values.astype(float)
+    return output_df
+
+
+
+def run_variant(config_assignments, curr_country=config._RAW_COUNTRY):
+    """
+        DOCSTRING:  Runs the whole pipeline on the sample with the config overrides, in a temporary working-directory which is removed afterwards.
+        INPUT:      List-of-NAME=VALUE-assignments, country-name
+        OUTPUT:     List of the mismatching output files (empty if the outputs equal the committed ones).
+    """
+    work_dir=tempfile.mkdtemp(prefix='sample_regression_')
+    try:
+        for directory in [config._RAW_SCORES_DIRECTORY, config._CLEANED_SCORES_DIRECTORY, config._STAGING_AREA_DIRECTORY, config._LOGS_DIRECTORY]:
+            os.makedirs(os.path.join(work_dir, directory), exist_ok=True)
+        shutil.copy(os.path.join(_REPO_DIR, config._RAW_STATIC_FILE_NAME), os.path.join(work_dir, config._RAW_STATIC_FILE_NAME))
+        command=[sys.executable, os.path.join(_REPO_DIR, 'Recursive_Masterize_Hospital_Entities.py')]
+        for assignment in config_assignments:
+            command.extend(['-s', assignment])
+        completed=subprocess.run(command+['run'], cwd=work_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        if completed.returncode!=0:
+            print(completed.stdout[-2000:])
+            return ['(the run failed)']
+
+        mismatching_outputs=list()
+        for file_suffix in _OUTPUT_SUFFIXES:
+            expected_csv=os.path.join(_REPO_DIR, config._MASTER_DATA_DIRECTORY, curr_country+file_suffix)
+            actual_csv=os.path.join(work_dir, config._MASTER_DATA_DIRECTORY, curr_country+file_suffix)
+            if not os.path.exists(actual_csv) or not read_output(expected_csv).equals(read_output(actual_csv)):
+                mismatching_outputs.append(curr_country+file_suffix)
+        return mismatching_outputs
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+
+def parse_args():
+    parser=argparse.ArgumentParser(description='Checks that the pipeline reproduces the committed outputs of the sample.')
+    parser.add_argument('-s', '--set', dest='config_assignments', action='append', default=[], metavar='NAME=VALUE', help='config override applied to every variant')
+    return parser.parse_args()
+
+
+
+if __name__=='__main__':
+    args=parse_args()
+    n_failures=0
+    for variant_name, variant_assignments in _VARIANTS.items():
+        mismatching_outputs=run_variant(args.config_assignments+variant_assignments)
+        n_failures+=len(mismatching_outputs)>0
+        print('{:<20} {}'.format(variant_name, 'OK' if len(mismatching_outputs)==0 else 'MISMATCH in {}'.format(', '.join(mismatching_outputs))))
+    sys.exit(1 if n_failures>0 else 0)
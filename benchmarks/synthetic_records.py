@@ -0,0 +1,143 @@
+"""
+    DOCSTRING:  Reproducible generator of synthetic hospital-records in the raw schema (the keys of _RAW_TO_STD_COLS), with known duplicate-clusters.
+                Every cluster is a chain: each duplicate is derived from the previous record of its cluster by typos, abbreviations and
+                re-split address-lines, hence the records at both ends of a long chain may only match through the records in between.
+                The 'Account_Num' is unique per record, and the ground-truth maps it to its cluster.
+    USAGE:      python benchmarks/synthetic_records.py n_records target_csv [seed]
+"""
+import numpy as np, pandas as pd, os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import *
+
+
+_STATES = ['AL','AK','AZ','AR','CA','CO','CT','DE','FL','GA','HI','ID','IL','IN','IA','KS','KY','LA','ME','MD','MA','MI','MN','MS','MO',
+           'MT','NE','NV','NH','NJ','NM','NY','NC','ND','OH','OK','OR','PA','RI','SC','SD','TN','TX','UT','VT','VA','WA','WV','WI','WY']
+_SYLLABLES = ['AR','BEL','CAR','DEN','EL','FAIR','GLEN','HAR','IN','JEF','KEN','LAN','MAR','NOR','OAK','PORT','QUIN','RID','SAL','TOR',
+              'VAL','WES','WOOD','FIELD','TON','VILLE','BURG','DALE','MONT','LAKE','HAVEN','CREST']
+_NAME_PREFIXES = ['SAINT', 'MERCY', 'GOOD SAMARITAN', 'NORTH', 'SOUTH', 'COMMUNITY', 'PROVIDENCE', 'BAPTIST', 'METHODIST', 'UNIVERSITY', 'VALLEY', 'MEMORIAL']
+_NAME_SUFFIXES = ['HOSPITAL', 'MEDICAL CENTER', 'REGIONAL MEDICAL CENTER', 'MEMORIAL HOSPITAL', 'HEALTH SYSTEM', 'CHILDRENS HOSPITAL', 'BEHAVIORAL CENTER', 'CLINIC']
+_STREET_TYPES = ['STREET', 'AVENUE', 'BOULEVARD', 'ROAD', 'DRIVE', 'LANE', 'PARKWAY', 'HIGHWAY']
+_ABBREVIATIONS = {'SAINT': 'ST', 'HOSPITAL': 'HOSP', 'MEDICAL CENTER': 'MED CTR', 'CENTER': 'CTR', 'NORTH': 'N', 'SOUTH': 'S', 'MEMORIAL': 'MEM',
+                  'STREET': 'ST', 'AVENUE': 'AVE', 'BOULEVARD': 'BLVD', 'ROAD': 'RD', 'DRIVE': 'DR', 'LANE': 'LN', 'PARKWAY': 'PKWY', 'HIGHWAY': 'HWY'}
+_SITE_TYPES = ['Acute Care Hospitals', 'Critical Access Hospitals', 'Psychiatric', 'Childrens']
+_SITE_OWNERSHIPS = ['Proprietary', 'Voluntary non-profit - Private', 'Voluntary non-profit - Other', 'Government - State', 'Government - Local']
+_ADDRESS_LINE_WIDTH = 10 # The sample raw-file splits the address every 10 chars into Address1/2/3
+
+
+
+def _random_word(random_state, n_syllables):
+    return ''.join(random_state.choice(_SYLLABLES, n_syllables))
+
+
+
+def _split_address(address, width):
+    """
+        DOCSTRING:  Splits an address into the 3 address-lines, every 'width' chars like the sample raw-file; the last line takes the rest.
+    """
+    return [address[:width], address[width:2*width], address[2*width:]]
+
+
+
+def _typo(value, random_state):
+    """
+        DOCSTRING:  One random character-edit: substitution, deletion, insertion or transposition of adjacent chars.
+    """
+    if len(value)<2:
+        return value
+    position=random_state.randint(len(value)-1)
+    edit=random_state.randint(4)
+    char=chr(ord('A')+random_state.randint(26))
+    if edit==0:
+        return value[:position]+char+value[position+1:]
+    elif edit==1:
+        return value[:position]+value[position+1:]
+    elif edit==2:
+        return value[:position]+char+value[position:]
+    return value[:position]+value[position+1]+value[position]+value[position+2:]
+
+
+
+def _abbreviate(value, random_state):
+    """
+        DOCSTRING:  Abbreviates one of the known words of the value (eg. STREET -> ST), if any.
+    """
+    candidates=[word for word in _ABBREVIATIONS if word in value]
+    if len(candidates)==0:
+        return value
+    word=candidates[random_state.randint(len(candidates))]
+    return value.replace(word, _ABBREVIATIONS[word], 1)
+
+
+
+def _derive_duplicate(record, random_state):
+    """
+        DOCSTRING:  Derives a duplicate from a record with 1 or 2 perturbations of its site-name or address, and sometimes re-splits its address-lines.
+    """
+    duplicate=dict(record)
+    for _ in range(1+random_state.randint(2)):
+        field='name' if random_state.rand()<0.5 else 'address'
+        duplicate[field]=_typo(duplicate[field], random_state) if random_state.rand()<0.6 else _abbreviate(duplicate[field], random_state)
+    duplicate['address_line_width']=_ADDRESS_LINE_WIDTH if random_state.rand()<0.7 else _ADDRESS_LINE_WIDTH+random_state.randint(-3, 4)
+    if random_state.rand()<0.05:
+        duplicate['zip_code']=int(str(duplicate['zip_code'])[:-1]+str(random_state.randint(10)))
+    return duplicate
+
+
+
+def generate_synthetic_records(n_records, duplicate_rate=0.3, max_cluster_size=5, seed=config._RANDOM_SEED):
+    """
+        DOCSTRING:  Generates n_records synthetic hospital-records in the raw schema, in shuffled order.
+                    A cluster has duplicates with probability duplicate_rate, and then 2 to max_cluster_size records chained one after another.
+        INPUT:      Number-of-records, Probability-of-a-cluster-with-duplicates, Max-records-per-cluster (chain-depth + 1), Random-seed
+        OUTPUT:     Dataframe-of-raw-records, Series of ground-truth cluster-ids indexed by Account_Num.
+    """
+    random_state=np.random.RandomState(seed)
+    n_locations=max(10, n_records//20)
+    locations=[(_STATES[random_state.randint(len(_STATES))], _random_word(random_state, 2), 10000+random_state.randint(89999), _random_word(random_state, 2))
+               for _ in range(n_locations)]
+
+    records, cluster_ids=list(), list()
+    cluster_id=0
+    while len(records)<n_records:
+        state, city, zip_code, county=locations[random_state.randint(n_locations)]
+        name_words=[_random_word(random_state, 2+random_state.randint(2)) for _ in range(1+random_state.randint(2))]
+        name=' '.join(([random_state.choice(_NAME_PREFIXES)] if random_state.rand()<0.5 else [])+name_words+[random_state.choice(_NAME_SUFFIXES)])
+        address='{} {} {}'.format(random_state.randint(1, 20000), _random_word(random_state, 2+random_state.randint(2)), random_state.choice(_STREET_TYPES))
+        record={'name': name, 'address': address, 'address_line_width': _ADDRESS_LINE_WIDTH, 'state': state, 'city': city, 'zip_code': zip_code, 'county': county,
+                'phone': '({}) {}-{:04d}'.format(random_state.randint(201, 990), random_state.randint(200, 999), random_state.randint(10000)),
+                'site_type': random_state.choice(_SITE_TYPES), 'site_ownership': random_state.choice(_SITE_OWNERSHIPS)}
+        cluster_size=1 if random_state.rand()>=duplicate_rate else random_state.randint(2, max_cluster_size+1)
+        for _ in range(min(cluster_size, n_records-len(records))):
+            records.append(record)
+            cluster_ids.append(cluster_id)
+            record=_derive_duplicate(record, random_state)
+        cluster_id+=1
+
+    account_nums=10000+random_state.permutation(n_records)
+    address_lines=[_split_address(record['address'], record['address_line_width']) for record in records]
+    std_values={
+        'ACCOUNT_NUM': account_nums,
+        'SITE_NAME': [record['name'] for record in records],
+        'ADDRESS_LINE_1': [lines[0] for lines in address_lines],
+        'ADDRESS_LINE_2': [lines[1] for lines in address_lines],
+        'ADDRESS_LINE_3': [lines[2] for lines in address_lines],
+        'CITY': [record['city'] for record in records],
+        'STATE': [record['state'] for record in records],
+        'POSTAL_CODE': [record['zip_code'] for record in records],
+        'COUNTY_NAME': [record['county'] for record in records],
+        'PHONE_NUM': [record['phone'] for record in records],
+        'SITE_TYPE': [record['site_type'] for record in records],
+        'SITE_OWNERSHIP': [record['site_ownership'] for record in records] }
+    raw_df=pd.DataFrame({raw_name: std_values[std_name] for raw_name, std_name in config._RAW_TO_STD_COLS.items()})
+    ground_truth=pd.Series(cluster_ids, index=pd.Index(account_nums, name='ACCOUNT_NUM'), name='CLUSTER_ID')
+    shuffled_positions=random_state.permutation(n_records)
+    return raw_df.iloc[shuffled_positions].reset_index(drop=True), ground_truth
+
+
+
+if __name__=='__main__':
+    n_records, target_csv=int(sys.argv[1]), sys.argv[2]
+    raw_df, ground_truth=generate_synthetic_records(n_records, seed=int(sys.argv[3]) if len(sys.argv)>3 else config._RANDOM_SEED)
+    raw_df.to_csv(target_csv, index=False)
+    ground_truth.to_csv(os.path.splitext(target_csv)[0]+'_ground_truth.csv')
+    print('Generated {} records in {} clusters into {}'.format(n_records, ground_truth.nunique(), target_csv))
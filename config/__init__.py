@@ -1 +1,2 @@
-from .config import *
\ No newline at end of file
+from .config import *
+from .overrides import *
\ No newline at end of file
@@ -5,10 +5,13 @@ _DATA_FILES_DIRECTORY = 'Data_Files'
 _RAW_STATIC_FILE_NAME = os.path.join(_DATA_FILES_DIRECTORY, 'hospital_account_info_raw.csv')
 _STATIC_FILE_NAME = os.path.join(_DATA_FILES_DIRECTORY, 'hospital_account_info.csv')
 #_STATIC_FILE_NAME = os.path.join(_DATA_FILES_DIRECTORY, 'Site_Master_Extract.xlsx')
+_DELTA_STATIC_FILE_NAME = os.path.join(_DATA_FILES_DIRECTORY, 'hospital_account_info_delta.csv') # New records in the format of _STATIC_FILE_NAME, for the incremental mode
 _RAW_SCORES_DIRECTORY = os.path.join(_DATA_FILES_DIRECTORY, 'Raw_Scores')
 _CLEANED_SCORES_DIRECTORY = os.path.join(_DATA_FILES_DIRECTORY, 'Cleaned_Scores')
 _MASTER_DATA_DIRECTORY = os.path.join(_DATA_FILES_DIRECTORY, 'Master_Data')
 _STAGING_AREA_DIRECTORY = os.path.join(_MASTER_DATA_DIRECTORY, 'Recursive_Staging_Area')
+_CHECKPOINT_DIRECTORY = os.path.join(_STAGING_AREA_DIRECTORY, 'Checkpoints')
+_LOGS_DIRECTORY = os.path.join(_DATA_FILES_DIRECTORY, 'Logs')
 
 
 
@@ -40,7 +43,80 @@ _COLUMNS_TO_CLEAN = [
             'ADDRESS_LINE_1','ADDRESS_LINE_2','ADDRESS_LINE_3',
             'SITE_NAME','STATE','CITY','POSTAL_CODE'
             ]
-_MAXSIZE = 2000
+_MAXSIZE = 2000 # Records per minibatch when _ADAPTIVE_BATCH_SIZING is off
+_N_WORKERS = os.cpu_count() or 1 # Worker-processes shared by all countries, for the independent minibatches and merge-pairs at each depth; the R engine runs 1 per country
+_MEMORY_BUDGET_MB = 8000 # Countries are started (largest first) only while their estimated memory fits in this budget
+_MEMORY_OVERHEAD_FACTOR = 6 # Estimated peak memory of a country relative to its raw dataframe: cleaned copies, staged masters and cross-refs
+
+
+
+''' Dtype_Schema Config '''
+_COMPACT_DTYPES = True # Keep the records and cross-refs in the compact dtypes below, instead of a python-object str per cell and float64 scores
+_CATEGORICAL_COLUMNS = ['COUNTRY', 'STATE', 'CITY', 'POSTAL_CODE', 'COUNTY_NAME', 'SITE_TYPE', 'SITE_OWNERSHIP'] # Low-cardinality text columns, stored as categoricals
+_ARROW_STRINGS = True # Other text columns as pyarrow-backed strings, if pyarrow is installed
+_SR_NUM_DTYPE = 'int64' # 'int32' halves the ids, for fewer than 2^31 records
+_SCORE_DTYPE = 'int8' # Comparison-scores and NUM_OF_MATCHES_FOUND; 'float32' if the scores are ever fractional
+
+
+
+''' Staging_Area Config '''
+_MEMORY_STAGING = 'Memory'
+_ARROW_STAGING = 'Arrow' # Arrow IPC files read through a memory-map, requires pyarrow
+_PARQUET_STAGING = 'Parquet' # requires pyarrow
+_CSV_STAGING = 'CSV' # For debugging the intermediate masters; the R engine always stages csv files
+_STAGING_BACKEND = _MEMORY_STAGING
+_WRITE_DEPTH_CROSS_REFS = False # Write the cross-refs of every depth as <country>_d<j>_Raw_Cross_Ref.csv into the staging-area, for debugging
+_USE_CHECKPOINTS = True # Checkpoint every node of the recursive-tree, so that a re-run resumes at the first incomplete node; removed once the country is published
+
+
+
+''' Merge_Schedule Config '''
+_POSITIONAL_MERGES = 'Positional' # The staged masters 2k and 2k+1 of the queue make a merge-pair
+_SIZE_BALANCED_MERGES = 'Size_Balanced' # The two smallest staged masters (by rows) make a merge-pair, then the next two smallest, and so on; an odd largest one waits for the next depth
+_MERGE_SCHEDULE = _POSITIONAL_MERGES
+_FINAL_DEDUP_WHEN_FITS = False # Once the remaining staged masters fit in one minibatch together, deduplicate them in a single last node instead of further depths of merge-pairs
+
+
+
+''' Background_IO Config '''
+_BACKGROUND_WRITES = True # Write the staged masters, cleaned score-features, cross-refs and reports on writer-threads while the scoring carries on
+_WRITER_THREADS = 2 # Writer-threads per process
+_WRITER_QUEUE_SIZE = 8 # Writes queued at most per process; a further write waits for a free slot, so that the queued dataframes stay bounded in memory
+_FSYNC_WRITES = True # fsync every written file, so that a crash never leaves a truncated staged master or output behind
+_PREFETCH_STAGED_MASTERS = True # With a single worker and a disk staging-backend (csv, Arrow or Parquet), read the next merge-pair's staged masters while the current pair is scored; the Memory backend has nothing to read
+
+
+
+''' Spark_Execution Config '''
+_SPARK_EXECUTION = False # Keep the records in Spark, and score the nodes of the recursive-tree of all countries as pandas-UDF tasks across the executors (requires pyspark and pyarrow)
+_SPARK_MASTER = 'local[*]' # eg. 'spark://host:7077' or 'yarn' for a cluster
+_SPARK_APP_NAME = 'Masterize_Hospital_Entities'
+_SPARK_PARTITION_PASS = None # A blocking-pass (see _BLOCKING_PASSES) partitioning the records before the minibatches, eg. [('STATE', 'exact', None)]; records of different partitions are never compared
+_SPARK_OUTPUT_DIRECTORY = os.path.join(_MASTER_DATA_DIRECTORY, 'Spark_Output') # Master and Raw_Cross_Ref as Parquet, partitioned by COUNTRY
+
+
+''' Incremental_Mode Config '''
+_INCREMENTAL_MODE = False # Master only the records of _DELTA_STATIC_FILE_NAME against the published <country>_Master.csv and <country>_Raw_Cross_Ref.csv
+
+
+
+''' Preformat Config '''
+_NATIVE_PREFORMAT = 'Native' # Chunked pandas reader with an external merge-sort, no JVM
+_SPARK_PREFORMAT = 'Spark' # requires pyspark, for inputs which are distributed anyway
+_PREFORMAT_ENGINE = _NATIVE_PREFORMAT
+_PREFORMAT_CHUNK_SIZE = 500000 # Rows of the raw csv held in memory at once; larger inputs are sorted in runs and merged
+_PREFORMAT_SORT_KEYS = ['POSTAL_CODE', 'STATE', 'CITY', 'SITE_NAME', 'ADDRESS_LINE_1'] # SR_NUM is assigned in this order
+
+
+
+''' Instrumentation Config '''
+_JSONL_TRACE = 'jsonl' # One JSON object per line and stage, eg. for pandas.read_json(lines=True)
+_CHROME_TRACE = 'chrome' # Trace-event format, opens in chrome://tracing or https://ui.perfetto.dev
+_STAGE_TRACE_FORMAT = _JSONL_TRACE # None disables the stage instrumentation
+_STAGE_TRACE_FILE_PREFIX = os.path.join(_LOGS_DIRECTORY, 'Stage_Trace') # .jsonl or .json is appended as per the format; replaced at every run
+_PROFILES_DIRECTORY = os.path.join(_LOGS_DIRECTORY, 'Profiles')
+_PROFILE_STAGES = [] # Stages to run under cProfile, eg. ['scoring', 'clean_score_features']; one .prof file per stage-call
+_TRACE_PYTHON_MEMORY = False # Record the tracemalloc peak of the python allocations of every stage; slows the run down considerably
 
 
 
@@ -52,6 +128,28 @@ _LINKAGE_METHOD = 'Linkage'
 
 
 
+''' Scoring_Engine Config '''
+_R_ENGINE = 'R'
+_PYTHON_ENGINE = 'Python'
+_SCORING_ENGINE = _PYTHON_ENGINE # Switch to _R_ENGINE to score the candidate-pairs through the Rscript subprocess and levenshtein binaries
+_PAIR_BATCH_SIZE = 200000 # Number of candidate-pairs scored together in one vectorized NumPy batch
+_BOUNDED_SCORING = True # Threshold-aware scoring: early-exit edit-distances, and pairs abandoned once _TOTAL_MATCHES_THRESHOLD is out of reach; same score-features
+_FACTORIZE_SCORE_COLUMNS = True # Score the low-cardinality columns (eg. STATE, CITY, POSTAL_CODE) once per distinct pair of values, through an LRU similarity-cache shared across minibatches and depths
+_FACTORIZE_MAX_DISTINCT_SHARE = 0.5 # A column is factorized if its distinct values are at most this share of its values
+_SIMILARITY_CACHE_SIZE = 1000000 # Max distinct pairs of values held by the similarity-cache of a process (~200 bytes each)
+_STREAMING_TOP_MATCH = True # Reduce the score-features to the top-match per record while they are scored (or read from the Rscript csv), instead of collecting them all first
+_SCORE_FEATURES_CHUNK_ROWS = 500000 # Rows of the Rscript's Score_Features csv read at once by the streaming top-match
+
+
+
+''' Adaptive_Batch_Sizing Config '''
+_ADAPTIVE_BATCH_SIZING = True # Size the minibatches, batches of pairs and merge-pair chunks of each country from _NODE_MEMORY_BUDGET_MB, instead of the static _MAXSIZE / _PAIR_BATCH_SIZE
+_NODE_MEMORY_BUDGET_MB = 1000 # Memory for scoring one minibatch or merge-pair with the Python engine; up to _N_WORKERS nodes run at once
+_MIN_ADAPTIVE_MAXSIZE = 500 # Floor of the adaptive minibatch-size, for very small budgets or very long fields
+_MAX_ADAPTIVE_MAXSIZE = 2000 # Ceiling of the adaptive minibatch-size (None for none): the pairs of a minibatch grow quadratically, while the following depths only link its masters
+
+
+
 ''' Match_Score_Computation '''
 _BINARIES_NAME = 'levenshtein'
 _BINARIES_EXTENSION = '.dll'
@@ -67,4 +165,49 @@ _THRESHOLDS_DICT = {
         }
 _COLS_FOR_TOTAL_MATCH_CALC = [colname+'_COMPARISON_SCORE' for colname in _THRESHOLDS_DICT]
 _SCALING_FACTOR=3
-_TOTAL_MATCHES_THRESHOLD=4
\ No newline at end of file
+_SCALED_COLUMNS=['CONCAT_ADDRESS'] # Columns whose binary match-score gets scaled up by _SCALING_FACTOR
+_TOTAL_MATCHES_THRESHOLD=4
+
+
+
+''' Blocking Config '''
+_USE_BLOCKING = False # Score only the candidate-pairs that share a block in at least one of the blocking-passes, instead of all pairs
+# Each blocking-pass is a list of (column, key-function, parameter) keys that must all agree; the candidate-pairs of all passes are unioned
+# Key-functions:  'exact' (whole value), 'prefix' (first <parameter> chars), 'soundex' (phonetic code of the value)
+_BLOCKING_PASSES = [
+        [('POSTAL_CODE', 'prefix', 3)],
+        [('STATE', 'exact', None), ('CITY', 'exact', None)],
+        [('SITE_NAME', 'soundex', None)]
+        ]
+_BLOCKING_ESTIMATE_RECALL = False # Score a random sample of the full cross-product to estimate the matches lost to blocking; ~30% more scoring per node, for tuning the passes
+_BLOCKING_RECALL_SAMPLE_SIZE = 20000
+_RANDOM_SEED = 42
+
+
+
+''' Exact_Duplicates Config '''
+_COLLAPSE_EXACT_DUPLICATES = False # Collapse the records identical in every cleaned match-score relevant column into one representative before any scoring; the duplicates get their cross-refs directly
+
+
+
+''' LSH Config '''
+_USE_LSH = False # Score only the candidate-pairs whose MinHash-signatures collide in a band (approximate, for fuzzy matches which the blocking-keys miss); unioned with the blocking-passes if both are on
+_LSH_COLUMNS = ['SITE_NAME', 'CONCAT_ADDRESS'] # Columns shingled and hashed separately; a collision in any band of any column makes a candidate-pair
+_LSH_SHINGLE_SIZE = 3 # Chars per shingle
+_LSH_N_PERMUTATIONS = 48 # MinHash permutations per column
+_LSH_TARGET_SIMILARITY = 0.4 # Jaccard-similarity of the shingle-sets from which a pair becomes a candidate with ~50% probability; sets the bands and rows-per-band
+_LSH_BANDS_AND_ROWS = None # (Bands, Rows-per-band) overriding _LSH_TARGET_SIMILARITY, eg. (16, 3)
+_LSH_SINGLE_PASS = True # With _USE_LSH and the Python engine, deduplicate each country in one minibatch instead of the recursive merge-tree
+
+
+
+''' Matching_Service Config '''
+_SERVICE_HOST = '127.0.0.1'
+_SERVICE_PORT = 8765
+_SERVICE_UNIX_SOCKET = None # eg. '/tmp/masterize_hospital_entities.sock', to serve on a Unix socket instead of _SERVICE_HOST:_SERVICE_PORT
+_SERVICE_COUNTRIES = None # Countries whose published masters are indexed; None indexes every <country>_Master.csv of _MASTER_DATA_DIRECTORY, including the ones published later
+_SERVICE_RELOAD_INTERVAL = 5 # Seconds between checks for a re-published Master / Raw_Cross_Ref, which is re-indexed once its files stopped changing; 0 disables the hot-reload
+_SERVICE_FULL_SCAN_MAX_MASTERS = 2000 # A query is scored against every master of a country up to this many masters; larger countries go through the indexes below
+_SERVICE_BLOCKING_PASSES = _BLOCKING_PASSES # Blocking-keys indexed over the masters; a master sharing any key with the query is a candidate
+_SERVICE_LSH_COLUMNS = _LSH_COLUMNS # Columns whose MinHash band-keys (character n-grams) are indexed over the masters, for the fuzzy matches the blocking-keys miss
+_SERVICE_MAX_BATCH_SIZE = 10000 # Records per /match request
@@ -0,0 +1,49 @@
+import os, ast, json
+from . import config
+
+
+# Environment-variable passing the overrides of the command-line on to the spawned worker-processes, which import the config afresh
+_CONFIG_OVERRIDES_ENV = 'MASTERIZE_CONFIG_OVERRIDES'
+
+
+
+def parse_config_override(assignment):
+    """
+        DOCSTRING:  Parses one NAME=VALUE override of the config, eg. _N_WORKERS=4, _USE_BLOCKING=True, _STAGING_BACKEND=Arrow or _LSH_BANDS_AND_ROWS=(16,3).
+                    The value is read as a python-literal (number, boolean, None, string, list, tuple, dict), else taken as a plain string.
+        INPUT:      String NAME=VALUE
+        OUTPUT:     Config-name, Value. Raises a ValueError for a malformed override or an unknown config-name.
+    """
+    config_name, separator, raw_value=assignment.partition('=')
+    config_name=config_name.strip()
+    if separator=='':
+        raise ValueError('Expected a config-override as NAME=VALUE, got: {}'.format(assignment))
+    if not config_name.startswith('_') or not hasattr(config, config_name):
+        raise ValueError('Unknown config-name: {}'.format(config_name))
+    try:
+        value=ast.literal_eval(raw_value.strip())
+    except (ValueError, SyntaxError):
+        value=raw_value.strip()
+    return config_name, value
+
+
+
+def apply_config_overrides(assignments, export=True):
+    """
+        DOCSTRING:  Overrides config-values without editing config/config.py. The utils modules bind their default-arguments to the config when they are
+                    imported, hence the overrides must be applied before importing them. A config derived from another one (eg. _STATIC_FILE_NAME from
+                    _DATA_FILES_DIRECTORY) is not derived again; override it as well. With export, the spawned worker-processes get the same overrides.
+        INPUT:      List of NAME=VALUE strings, Flag-to-export-to-worker-processes
+        OUTPUT:     Dict of config-name to value.
+    """
+    config_overrides=dict(parse_config_override(assignment) for assignment in assignments)
+    for config_name, value in config_overrides.items():
+        setattr(config, config_name, value)
+    if export and len(config_overrides)>0:
+        os.environ[_CONFIG_OVERRIDES_ENV]=json.dumps(json.loads(os.environ.get(_CONFIG_OVERRIDES_ENV, '[]'))+list(assignments))
+    return config_overrides
+
+
+
+# A worker-process inherits the environment of its parent, hence it applies the parent's overrides as soon as it imports the config
+apply_config_overrides(json.loads(os.environ.get(_CONFIG_OVERRIDES_ENV, '[]')), export=False)
@@ -1 +1,17 @@
-from .util_functions import *
\ No newline at end of file
+import importlib
+
+
+# The submodules are imported at their first use, so that importing one helper (eg. utils.blocking) or the command-line does not load the whole pipeline
+_SUBMODULES = ['util_functions', 'preformat', 'scoring_engine', 'blocking', 'lsh', 'exact_duplicates', 'dtype_schema', 'background_io', 'staging', 'checkpoint',
+               'cross_ref_store', 'batch_sizing', 'instrumentation', 'recursive_pipeline', 'spark_pipeline', 'matching_service', 'cli']
+
+
+
+def __getattr__(name):
+    # utils.<name> resolves like the former star-imports of every submodule, in the same order
+    if not name.startswith('_'):
+        for submodule in _SUBMODULES:
+            module = importlib.import_module('.'+submodule, __name__)
+            if hasattr(module, name):
+                return getattr(module, name)
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
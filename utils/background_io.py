@@ -0,0 +1,127 @@
+import os, sys, threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from config import *
+
+
+
+class BackgroundWriter(object):
+    """
+        DOCSTRING:  Bounded queue of file-writes, run by a few writer-threads while the pipeline carries on scoring:
+                        a. submit() blocks once max_pending writes are queued, so that the dataframes waiting to be written never pile up in memory.
+                        b. The first failed write is raised again in the pipeline, by the next submit(), wait_for() or flush(), instead of being printed and lost.
+                        c. wait_for() waits for the writes of one file (eg. a staged master about to be re-read), and flush() is the barrier for all of them.
+                        d. The prints of a write go to the log-file of the thread which submitted it, when a ThreadLogRouter routes the prints per country.
+                    A dataframe must not be modified once its write is submitted.
+    """
+    def __init__(self, n_threads=config._WRITER_THREADS, max_pending=config._WRITER_QUEUE_SIZE):
+        self.executor=ThreadPoolExecutor(max_workers=n_threads, thread_name_prefix='BackgroundWriter')
+        self.slots=threading.BoundedSemaphore(max_pending)
+        self.lock=threading.Lock()
+        self.pending=dict()
+        self.errors=list()
+
+    def _raise_errors(self):
+        with self.lock:
+            errors, self.errors=self.errors, list()
+        if len(errors)>0:
+            raise IOError('{} background-writes failed, the first one: {}'.format(len(errors), errors[0])) from errors[0]
+
+    def _run(self, write_function, args, log_router, log_stream):
+        try:
+            with log_router.route_to_stream(log_stream) if log_stream is not None else nullcontext():
+                write_function(*args)
+        except Exception as e:
+            with self.lock:
+                self.errors.append(e)
+        finally:
+            self.slots.release()
+
+    def submit(self, abs_path, write_function, *args):
+        # A file is written by one job at a time, in the order of submission
+        self.wait_for(abs_path)
+        self.slots.acquire()
+        # The ThreadLogRouter routes by thread, hence the writer-thread gets the log-file of the submitting thread
+        log_router=sys.stdout
+        log_stream=log_router.current_stream() if hasattr(log_router, 'current_stream') else None
+        future=self.executor.submit(self._run, write_function, args, log_router, log_stream)
+        with self.lock:
+            self.pending[abs_path]=future
+        return future
+
+    def wait_for(self, abs_path):
+        with self.lock:
+            future=self.pending.get(abs_path)
+        if future is not None:
+            future.result()
+            with self.lock:
+                if self.pending.get(abs_path) is future:
+                    del self.pending[abs_path]
+        self._raise_errors()
+
+    def flush(self):
+        with self.lock:
+            futures, self.pending=list(self.pending.values()), dict()
+        for future in futures:
+            future.result()
+        self._raise_errors()
+
+
+
+# One writer per process: the worker-processes of the pool get their own, lazily
+_BACKGROUND_WRITER = None
+_BACKGROUND_WRITER_PID = None
+_BACKGROUND_WRITER_LOCK = threading.Lock()
+
+
+
+def get_background_writer():
+    """
+        DOCSTRING:  The BackgroundWriter of this process, created at its first use.
+    """
+    global _BACKGROUND_WRITER, _BACKGROUND_WRITER_PID
+    with _BACKGROUND_WRITER_LOCK:
+        if _BACKGROUND_WRITER is None or _BACKGROUND_WRITER_PID!=os.getpid():
+            _BACKGROUND_WRITER, _BACKGROUND_WRITER_PID=BackgroundWriter(), os.getpid()
+        return _BACKGROUND_WRITER
+
+
+
+def submit_background_write(abs_path, write_function, *args):
+    """
+        DOCSTRING:  Queues write_function(*args), which writes abs_path, on the BackgroundWriter; runs it right away if _BACKGROUND_WRITES is off.
+        INPUT:      Abs-path-of-file, Function-writing-the-file, Positional-args
+        OUTPUT:     None; a failed write raises here if it ran right away, else at the next submit, wait or flush.
+    """
+    if config._BACKGROUND_WRITES:
+        get_background_writer().submit(abs_path, write_function, *args)
+    else:
+        write_function(*args)
+
+
+
+def wait_for_background_write(abs_path):
+    """
+        DOCSTRING:  Waits until the queued writes of abs_path are on disk, eg. before re-reading a staged master.
+    """
+    if _BACKGROUND_WRITER is not None and _BACKGROUND_WRITER_PID==os.getpid():
+        _BACKGROUND_WRITER.wait_for(abs_path)
+
+
+
+def flush_background_writes():
+    """
+        DOCSTRING:  Barrier: waits until every queued write of this process is on disk, and raises the first failed one.
+    """
+    if _BACKGROUND_WRITER is not None and _BACKGROUND_WRITER_PID==os.getpid():
+        _BACKGROUND_WRITER.flush()
+
+
+
+def fsync_file(file_stream):
+    """
+        DOCSTRING:  Forces a written file to disk if _FSYNC_WRITES is on, so that a crash right after a depth never leaves a truncated staged master or output.
+    """
+    if config._FSYNC_WRITES:
+        file_stream.flush()
+        os.fsync(file_stream.fileno())
@@ -0,0 +1,108 @@
+import numpy as np, pandas as pd
+from config import *
+
+
+# Memory of the Python scoring-engine, measured with tracemalloc on score_candidate_pairs():
+# a batch of pairs holds ~44 bytes per char of the widest score-column (gathered, encoded and DP-row copies) and ~80 fixed bytes per pair
+_PAIR_BYTES_PER_CHAR = 44
+_PAIR_BYTES_FIXED = 80
+# Positional-indexes of the candidate-pairs of a node: two int64 arrays, materialized for the whole node
+_POSITION_BYTES_PER_PAIR = 16
+# Share of the node-budget given to one batch of pairs; the rest holds the positional-indexes
+_PAIR_BATCH_BUDGET_SHARE = 0.25
+# Share of the node-budget left for the dataframes and score-features of the node (a 3135-record minibatch sized for 100 MB peaked at 102 MB without it)
+_NODE_BUDGET_HEADROOM = 0.1
+_MIN_PAIR_BATCH_SIZE = 1000
+_MB = 1024*1024
+
+
+
+def measure_field_widths(df, thresholds_dict=config._THRESHOLDS_DICT):
+    """
+        DOCSTRING:  Longest value of every match-score relevant column. The scoring-engine pads every string of a column to its longest value.
+        INPUT:      Dataframe, Dict-of-column-thresholds
+        OUTPUT:     Dict of column-name to max-length in chars.
+    """
+    return {colname: int(df[colname].fillna('').astype(str).str.len().max()) if df.shape[0]>0 else 0 for colname in thresholds_dict}
+
+
+
+def estimate_pair_bytes(field_widths):
+    """
+        DOCSTRING:  Peak memory per pair of a batch of pairs; the columns are scored one after another, hence only the widest column counts.
+        INPUT:      Dict of column-name to max-length, for one or both datasets
+        OUTPUT:     Bytes per pair.
+    """
+    return _PAIR_BYTES_PER_CHAR*max(list(field_widths.values())+[1])+_PAIR_BYTES_FIXED
+
+
+
+def choose_pair_batch_size(pair_bytes, node_memory_budget_mb=config._NODE_MEMORY_BUDGET_MB, max_pair_batch_size=config._PAIR_BATCH_SIZE):
+    """
+        DOCSTRING:  Largest batch of pairs (up to _PAIR_BATCH_SIZE) which fits in its share of the node-budget.
+        INPUT:      Bytes-per-pair, Node-memory-budget-in-MB, Max-pairs-per-batch
+        OUTPUT:     Number of pairs per batch.
+    """
+    return int(np.clip(_PAIR_BATCH_BUDGET_SHARE*node_memory_budget_mb*_MB//pair_bytes, _MIN_PAIR_BATCH_SIZE, max_pair_batch_size))
+
+
+
+def _position_budget_bytes(pair_batch_size, pair_bytes, node_memory_budget_mb):
+    return max((1-_NODE_BUDGET_HEADROOM)*node_memory_budget_mb*_MB-pair_batch_size*pair_bytes, 0)
+
+
+
+def choose_minibatch_size(country_df, node_memory_budget_mb=config._NODE_MEMORY_BUDGET_MB, min_maxsize=config._MIN_ADAPTIVE_MAXSIZE, thresholds_dict=config._THRESHOLDS_DICT,
+                          max_maxsize=config._MAX_ADAPTIVE_MAXSIZE):
+    """
+        DOCSTRING:  Replaces the static _MAXSIZE: the largest depth-zero minibatch whose n(n-1)/2 candidate-pairs, together with one batch of pairs
+                    of the country's field-widths, fit in the node-budget. Larger minibatches mean fewer merge-pairs and re-scans at the following depths.
+                    The pairs of a minibatch grow quadratically, while the following depths only link its masters, hence the minibatch is never above
+                    max_maxsize. Never below min_maxsize either, nor above the number of records of the country.
+                    The size depends on the records and the config only, never on the number of workers, so that the masters are the same on every machine.
+        INPUT:      Cleaned-dataframe-for-country, Node-memory-budget-in-MB, Min-records-per-minibatch, Dict-of-column-thresholds, Max-records-per-minibatch
+        OUTPUT:     Records per minibatch, Dict of the sizing details.
+    """
+    return choose_minibatch_size_for_widths(measure_field_widths(country_df, thresholds_dict), country_df.shape[0], node_memory_budget_mb, min_maxsize, max_maxsize)
+
+
+
+def choose_minibatch_size_for_widths(field_widths, n_rows, node_memory_budget_mb=config._NODE_MEMORY_BUDGET_MB, min_maxsize=config._MIN_ADAPTIVE_MAXSIZE,
+                                     max_maxsize=config._MAX_ADAPTIVE_MAXSIZE):
+    """
+        DOCSTRING:  choose_minibatch_size() from field-widths measured elsewhere (eg. aggregated by Spark), without the records at hand.
+        INPUT:      Dict of column-name to max-length, Number-of-records, Node-memory-budget-in-MB, Min-records-per-minibatch, Max-records-per-minibatch
+        OUTPUT:     Records per minibatch, Dict of the sizing details.
+    """
+    pair_bytes=estimate_pair_bytes(field_widths)
+    pair_batch_size=choose_pair_batch_size(pair_bytes, node_memory_budget_mb)
+    position_budget=_position_budget_bytes(pair_batch_size, pair_bytes, node_memory_budget_mb)
+    # 8 bytes * n(n-1) <= position_budget
+    budget_maxsize=int((1+np.sqrt(1+4*position_budget/(_POSITION_BYTES_PER_PAIR/2)))/2)
+    maxsize=min(budget_maxsize, max_maxsize) if max_maxsize is not None else budget_maxsize
+    maxsize=max(1, min(max(maxsize, min_maxsize), n_rows))
+    return maxsize, {'PAIR_BYTES': pair_bytes, 'PAIR_BATCH_SIZE': pair_batch_size, 'BUDGET_MAXSIZE': budget_maxsize, 'MAXSIZE': maxsize}
+
+
+
+def plan_node_batches(country_df, country_df2=None, method=config._DEDUP_METHOD, node_memory_budget_mb=config._NODE_MEMORY_BUDGET_MB, thresholds_dict=config._THRESHOLDS_DICT):
+    """
+        DOCSTRING:  Batch-sizes of one scoring node, from its actual row-counts and field-widths:
+                        a. PAIR_BATCH_SIZE:     pairs scored together in one vectorized batch.
+                        b. CHUNK_ROWS:          rows of the first dataset linked against the whole second dataset at once, so that the m*n positional-indexes
+                                                of a merge-pair at a deep level never exceed the node-budget (all rows for a Dedup minibatch).
+        INPUT:      Dataframe, Second-dataframe (Linkage only), Dedup/Linkage-method, Node-memory-budget-in-MB, Dict-of-column-thresholds
+        OUTPUT:     Dict of PAIR_BYTES, PAIR_BATCH_SIZE, CHUNK_ROWS and N_CHUNKS.
+    """
+    field_widths=measure_field_widths(country_df, thresholds_dict)
+    if country_df2 is not None:
+        field_widths_2=measure_field_widths(country_df2, thresholds_dict)
+        field_widths={colname: max(width, field_widths_2[colname]) for colname, width in field_widths.items()}
+    pair_bytes=estimate_pair_bytes(field_widths)
+    pair_batch_size=choose_pair_batch_size(pair_bytes, node_memory_budget_mb)
+    n_rows_1=country_df.shape[0]
+    chunk_rows=n_rows_1
+    if method==config._LINKAGE_METHOD and country_df2 is not None and country_df2.shape[0]>0:
+        chunk_rows=int(_position_budget_bytes(pair_batch_size, pair_bytes, node_memory_budget_mb)//(_POSITION_BYTES_PER_PAIR*country_df2.shape[0]))
+        chunk_rows=max(1, min(chunk_rows, n_rows_1))
+    return {'PAIR_BYTES': pair_bytes, 'PAIR_BATCH_SIZE': pair_batch_size, 'CHUNK_ROWS': chunk_rows, 'N_CHUNKS': int(np.ceil(n_rows_1/chunk_rows)) if n_rows_1>0 else 0}
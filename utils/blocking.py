@@ -0,0 +1,219 @@
+import numpy as np, pandas as pd
+from config import *
+from utils.scoring_engine import generate_dedup_pairs, score_candidate_pairs, _get_score_columns
+
+
+_SOUNDEX_CODES = dict(zip('abcdefghijklmnopqrstuvwxyz', '01230120022455012623010202'))
+
+
+
+def soundex(value):
+    """
+        DOCSTRING:  American-Soundex phonetic code of a string: first letter followed by 3 digits for the following consonant-groups.
+                    Non-alphabetic characters are ignored, 'h' and 'w' do not separate consonants with the same code, vowels do.
+        INPUT:      String
+        OUTPUT:     4-character Soundex code, or '' for a string without any letters.
+    """
+    letters=[char for char in value.lower() if char in _SOUNDEX_CODES]
+    if len(letters)==0:
+        return ''
+    code=letters[0].upper()
+    prev_digit=_SOUNDEX_CODES[letters[0]]
+    for char in letters[1:]:
+        digit=_SOUNDEX_CODES[char]
+        if char in 'hw':
+            continue
+        if digit!='0' and digit!=prev_digit:
+            code+=digit
+            if len(code)==4:
+                break
+        prev_digit=digit
+    return code.ljust(4, '0')
+
+
+
+def compute_blocking_keys(df, blocking_pass):
+    """
+        DOCSTRING:  Computes the blocking-key of every record for one blocking-pass, by concatenating the key of each (column, key-function, parameter).
+                    Records with a blank value in any of the key-columns get a missing key, so that they do not form a giant block of blanks.
+        INPUT:      Dataframe, List-of-(column, key-function, parameter)
+        OUTPUT:     Series of blocking-keys (NaN where the key is missing).
+    """
+    keys=pd.Series('', index=df.index)
+    is_missing=pd.Series(False, index=df.index)
+    for colname, key_function, parameter in blocking_pass:
+        values=df[colname].fillna('').astype(str).str.strip()
+        if key_function=='exact':
+            col_keys=values
+        elif key_function=='prefix':
+            col_keys=values.str[:parameter]
+        elif key_function=='soundex':
+            unique_values=values.unique()
+            col_keys=values.map(dict(zip(unique_values, [soundex(value) for value in unique_values])))
+        else:
+            raise ValueError('Unknown blocking key-function: {}'.format(key_function))
+        is_missing|=(col_keys=='')
+        keys=keys+'|'+col_keys
+    return keys.mask(is_missing)
+
+
+
+def record_blocking_key(record, blocking_pass):
+    """
+        DOCSTRING:  Blocking-key of a single record for one blocking-pass, the same as compute_blocking_keys() gives it; for lookups of a few records,
+                    where the dataframe-wide version costs more than the keys themselves.
+        INPUT:      Dict of column-name to value, List-of-(column, key-function, parameter)
+        OUTPUT:     Blocking-key, or None where the key is missing.
+    """
+    key=''
+    for colname, key_function, parameter in blocking_pass:
+        value=record.get(colname)
+        value='' if value is None or pd.isna(value) else str(value).strip()
+        if key_function=='exact':
+            col_key=value
+        elif key_function=='prefix':
+            col_key=value[:parameter]
+        elif key_function=='soundex':
+            col_key=soundex(value)
+        else:
+            raise ValueError('Unknown blocking key-function: {}'.format(key_function))
+        if col_key=='':
+            return None
+        key+='|'+col_key
+    return key
+
+
+
+def _dedup_pairs_within_blocks(keys):
+    """
+        DOCSTRING:  Generates the (i < j) positional candidate-pairs of records sharing a blocking-key, without a python-loop over the blocks:
+                    all blocks of the same size reuse one upper-triangle of pair-offsets.
+        INPUT:      Series-of-blocking-keys
+        OUTPUT:     Array-of-positions-of-first-record, Array-of-positions-of-second-record
+    """
+    codes, _=pd.factorize(keys)
+    valid_positions=np.flatnonzero(codes>=0)
+    sorted_positions=valid_positions[np.argsort(codes[valid_positions], kind='stable')]
+    block_sizes=np.bincount(codes[valid_positions]) if valid_positions.size else np.zeros(0, dtype=np.int64)
+    block_starts=np.concatenate([[0], np.cumsum(block_sizes)[:-1]]).astype(np.int64)
+
+    positions_1, positions_2=[np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+    for block_size in np.unique(block_sizes[block_sizes>1]):
+        offsets_1, offsets_2=generate_dedup_pairs(block_size)
+        starts=block_starts[block_sizes==block_size][:, None]
+        positions_1.append(sorted_positions[(starts+offsets_1).ravel()])
+        positions_2.append(sorted_positions[(starts+offsets_2).ravel()])
+    positions_1, positions_2=np.concatenate(positions_1), np.concatenate(positions_2)
+    return np.minimum(positions_1, positions_2), np.maximum(positions_1, positions_2)
+
+
+
+def _linkage_pairs_within_blocks(keys_1, keys_2):
+    """
+        DOCSTRING:  Generates the positional candidate-pairs between two datasets of records sharing a blocking-key.
+        INPUT:      Series-of-blocking-keys-of-first-dataset, Series-of-blocking-keys-of-second-dataset
+        OUTPUT:     Array-of-positions-in-first-dataset, Array-of-positions-in-second-dataset
+    """
+    left=pd.DataFrame({'KEY': keys_1.values, 'POSITION_1': np.arange(len(keys_1))}).dropna(subset=['KEY'])
+    right=pd.DataFrame({'KEY': keys_2.values, 'POSITION_2': np.arange(len(keys_2))}).dropna(subset=['KEY'])
+    pairs=left.merge(right, on='KEY', how='inner')
+    return pairs['POSITION_1'].values.astype(np.int64), pairs['POSITION_2'].values.astype(np.int64)
+
+
+
+def _sample_pairs(n_rows_1, n_rows_2, method, sample_size, random_state):
+    """
+        DOCSTRING:  Draws a uniform random sample of candidate-pairs from the full cross-product (Dedup pairs are ordered i < j).
+        INPUT:      Number-of-records-in-first-dataset, Number-of-records-in-second-dataset, Dedup/Linkage-method, Sample-size, Random-state
+        OUTPUT:     Array-of-positions-in-first-dataset, Array-of-positions-in-second-dataset
+    """
+    positions_1=random_state.randint(0, n_rows_1, size=sample_size)
+    positions_2=random_state.randint(0, n_rows_2, size=sample_size)
+    if method==config._DEDUP_METHOD:
+        is_pair=(positions_1!=positions_2)
+        positions_1, positions_2=positions_1[is_pair], positions_2[is_pair]
+        positions_1, positions_2=np.minimum(positions_1, positions_2), np.maximum(positions_1, positions_2)
+    return positions_1, positions_2
+
+
+
+def estimate_blocking_recall_loss(country_df, country_df2, candidate_codes, method, sample_size=config._BLOCKING_RECALL_SAMPLE_SIZE, total_matches_threshold=config._TOTAL_MATCHES_THRESHOLD):
+    """
+        DOCSTRING:  Scores a random sample of the full cross-product, and finds the fraction of its potential-matches that fall outside the candidate-pairs.
+                    If the full cross-product is not larger than the sample-size, every pair is scored and the recall-loss is exact.
+        INPUT:      Dataframe, Second-dataframe, Sorted-array-of-encoded-candidate-pairs, Dedup/Linkage-method, Sample-size, Total-matches-threshold
+        OUTPUT:     Dict of sampled-pairs, sampled-matches, sampled-matches-missed and estimated-recall-loss (None if the sample has no matches).
+    """
+    n_rows_1, n_rows_2=country_df.shape[0], country_df2.shape[0]
+    n_total_pairs=n_rows_1*(n_rows_1-1)//2 if method==config._DEDUP_METHOD else n_rows_1*n_rows_2
+    if n_total_pairs<=sample_size:
+        if method==config._DEDUP_METHOD:
+            positions_1, positions_2=generate_dedup_pairs(n_rows_1)
+        else:
+            positions_1, positions_2=np.divmod(np.arange(n_total_pairs), n_rows_2)
+    else:
+        positions_1, positions_2=_sample_pairs(n_rows_1, n_rows_2, method, sample_size, np.random.RandomState(config._RANDOM_SEED))
+
+    _, total_scores=score_candidate_pairs(_get_score_columns(country_df, config._THRESHOLDS_DICT), _get_score_columns(country_df2, config._THRESHOLDS_DICT), positions_1, positions_2,
+                                          total_matches_threshold=total_matches_threshold if config._BOUNDED_SCORING else None)
+    is_match=(total_scores>=total_matches_threshold)
+    sampled_codes=positions_1[is_match].astype(np.int64)*n_rows_2+positions_2[is_match]
+    n_missed=int((~np.isin(sampled_codes, candidate_codes)).sum())
+    n_matches=int(is_match.sum())
+    return {
+        'N_SAMPLED_PAIRS': len(positions_1),
+        'N_SAMPLED_MATCHES': n_matches,
+        'N_SAMPLED_MATCHES_MISSED': n_missed,
+        'ESTIMATED_RECALL_LOSS': (n_missed/n_matches) if n_matches>0 else None }
+
+
+
+def generate_candidate_pairs(country_df, country_df2=None, method=config._DEDUP_METHOD, blocking_passes=config._BLOCKING_PASSES, estimate_recall=config._BLOCKING_ESTIMATE_RECALL):
+    """
+        DOCSTRING:  Blocking-stage before scoring: only the pairs which share a blocking-key in at least one blocking-pass become candidate-pairs.
+                    The candidate-pairs of all blocking-passes are unioned, and a report of the pruned pairs (and the estimated recall-loss) is printed.
+        INPUT:      Dataframe, Second-dataframe (Linkage only), Dedup/Linkage-method, List-of-blocking-passes, Flag-to-estimate-recall-loss
+        OUTPUT:     (Array-of-positions-in-first-dataset, Array-of-positions-in-second-dataset) in the same convention as generate_dedup_pairs() / generate_linkage_pairs(),
+                    Dict-of-blocking-report.
+    """
+    try:
+        if method==config._DEDUP_METHOD:
+            country_df2=country_df
+        n_rows_1, n_rows_2=country_df.shape[0], country_df2.shape[0]
+
+        candidate_codes=[np.zeros(0, dtype=np.int64)]
+        for blocking_pass in blocking_passes:
+            if method==config._DEDUP_METHOD:
+                positions_1, positions_2=_dedup_pairs_within_blocks(compute_blocking_keys(country_df, blocking_pass))
+            else:
+                positions_1, positions_2=_linkage_pairs_within_blocks(compute_blocking_keys(country_df, blocking_pass), compute_blocking_keys(country_df2, blocking_pass))
+            candidate_codes.append(positions_1*n_rows_2+positions_2)
+        # Encode each pair as a single integer to union the blocking-passes
+        candidate_codes=np.unique(np.concatenate(candidate_codes))
+        positions_1, positions_2=np.divmod(candidate_codes, n_rows_2)
+
+        n_total_pairs=n_rows_1*(n_rows_1-1)//2 if method==config._DEDUP_METHOD else n_rows_1*n_rows_2
+        blocking_report={
+            'METHOD': method,
+            'N_TOTAL_PAIRS': n_total_pairs,
+            'N_CANDIDATE_PAIRS': len(candidate_codes),
+            'N_PRUNED_PAIRS': n_total_pairs-len(candidate_codes),
+            'PRUNED_RATIO': (1-len(candidate_codes)/n_total_pairs) if n_total_pairs>0 else 0.0 }
+        if estimate_recall:
+            blocking_report.update(estimate_blocking_recall_loss(country_df, country_df2, candidate_codes, method))
+        print('\nBlocking report: {}'.format(blocking_report))
+        return (positions_1, positions_2), blocking_report
+    except Exception:
+        print('\nSomething went wrong while generating the candidate-pairs using the blocking-passes.')
+        raise
+
+
+
+def union_candidate_pairs(list_of_candidate_pairs, n_rows_2):
+    """
+        DOCSTRING:  Unions the candidate-pairs of several candidate-sources (eg. the blocking-passes and the LSH) of the same node.
+        INPUT:      List of (Array-of-positions-in-first-dataset, Array-of-positions-in-second-dataset), Number-of-records-in-second-dataset (the first one for Dedup)
+        OUTPUT:     (Array-of-positions-in-first-dataset, Array-of-positions-in-second-dataset), sorted and without repeated pairs.
+    """
+    candidate_codes=np.unique(np.concatenate([np.zeros(0, dtype=np.int64)]+[positions_1*n_rows_2+positions_2 for positions_1, positions_2 in list_of_candidate_pairs]))
+    return np.divmod(candidate_codes, n_rows_2)
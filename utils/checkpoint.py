@@ -0,0 +1,152 @@
+import pandas as pd, os, json, hashlib
+from config import *
+
+
+# Config values which change the masters and cross-refs; a change in any of them invalidates the checkpoints of a run
+_FINGERPRINT_CONFIG_NAMES = ['_MAXSIZE', '_COLUMNS_TO_CLEAN', '_FIELDS_TO_CONCAT', '_THRESHOLDS_DICT', '_SCALING_FACTOR', '_SCALED_COLUMNS', '_TOTAL_MATCHES_THRESHOLD',
+                             '_SCORING_ENGINE', '_USE_BLOCKING', '_BLOCKING_PASSES', '_ADAPTIVE_BATCH_SIZING', '_NODE_MEMORY_BUDGET_MB', '_MIN_ADAPTIVE_MAXSIZE',
+                             '_COLLAPSE_EXACT_DUPLICATES', '_MERGE_SCHEDULE', '_FINAL_DEDUP_WHEN_FITS', '_USE_LSH', '_LSH_SINGLE_PASS', '_LSH_COLUMNS',
+                             '_LSH_SHINGLE_SIZE', '_LSH_N_PERMUTATIONS', '_LSH_TARGET_SIMILARITY', '_LSH_BANDS_AND_ROWS']
+# Config values which change the standardized file; a change in any of them invalidates the preformatted file
+_PREFORMAT_FINGERPRINT_CONFIG_NAMES = ['_RAW_TO_STD_COLS', '_STD_COLS_ORDER', '_PREFORMAT_SORT_KEYS', '_RAW_COUNTRY']
+_FILE_CHECKSUM_BLOCK_BYTES = 1024*1024
+
+
+
+def compute_run_fingerprint(*dfs, node_plan=None):
+    """
+        DOCSTRING:  Checksum of a run: the relevant config values, the effective node-plan of the recursive-tree (eg. the minibatch-size and number of minibatches
+                    actually chosen), and the contents (values and SR_NUM index) of the input dataframes.
+                    The node-plan covers whichever setting decides the layout of the nodes, hence a node is never resumed into a tree of another layout.
+        INPUT:      Dataframes, Dict-of-the-node-plan (optional)
+        OUTPUT:     Hex-digest string.
+    """
+    checksum=hashlib.sha256()
+    config_values={config_name: getattr(config, config_name, None) for config_name in _FINGERPRINT_CONFIG_NAMES}
+    checksum.update(json.dumps(config_values, sort_keys=True, default=str).encode())
+    checksum.update(json.dumps(node_plan, sort_keys=True, default=str).encode())
+    for df in dfs:
+        checksum.update(json.dumps(list(map(str, df.columns))).encode())
+        checksum.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return checksum.hexdigest()
+
+
+
+def compute_file_checksum(file_name):
+    """
+        DOCSTRING:  Checksum of the contents of a file, read block by block.
+        INPUT:      Path-of-file
+        OUTPUT:     Hex-digest string. Raises a FileNotFoundError if the file does not exist.
+    """
+    checksum=hashlib.sha256()
+    with open(file_name, 'rb') as input_file:
+        for block in iter(lambda: input_file.read(_FILE_CHECKSUM_BLOCK_BYTES), b''):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+
+def compute_preformat_fingerprint(raw_file_name):
+    """
+        DOCSTRING:  Checksum of a pre-formatting: the config values which shape the standardized file, and the contents of the raw file.
+                    Unlike the modification-times, it survives a git checkout or a copy, and it changes with the column-mapping, sort-keys or country.
+        INPUT:      Path-of-raw-file
+        OUTPUT:     Hex-digest string.
+    """
+    checksum=hashlib.sha256()
+    config_values={config_name: getattr(config, config_name, None) for config_name in _PREFORMAT_FINGERPRINT_CONFIG_NAMES}
+    checksum.update(json.dumps(config_values, sort_keys=True, default=str).encode())
+    checksum.update(compute_file_checksum(raw_file_name).encode())
+    return checksum.hexdigest()
+
+
+
+def _preformat_manifest_path(target_file_name, root_dir):
+    return os.path.join(root_dir, os.path.basename(target_file_name)+'_Preformat_Manifest.json')
+
+
+
+def is_preformat_complete(fingerprint, target_file_name, root_dir=config._CHECKPOINT_DIRECTORY):
+    """
+        DOCSTRING:  Whether the standardized file was written by a pre-formatting of this fingerprint, and is unchanged since (see record_preformat()).
+        INPUT:      Fingerprint-of-the-preformatting, Path-of-standardized-file, Directory-of-the-manifest
+        OUTPUT:     Boolean.
+    """
+    manifest_path=_preformat_manifest_path(target_file_name, root_dir)
+    if not os.path.exists(manifest_path) or not os.path.exists(target_file_name):
+        return False
+    with open(manifest_path) as manifest_file:
+        manifest=json.load(manifest_file)
+    return manifest['FINGERPRINT']==fingerprint and manifest['TARGET_CHECKSUM']==compute_file_checksum(target_file_name)
+
+
+
+def record_preformat(fingerprint, target_file_name, root_dir=config._CHECKPOINT_DIRECTORY):
+    """
+        DOCSTRING:  Records the fingerprint of a completed pre-formatting and the checksum of its standardized file, in a manifest replaced atomically.
+        INPUT:      Fingerprint-of-the-preformatting, Path-of-standardized-file, Directory-of-the-manifest
+        OUTPUT:     None.
+    """
+    os.makedirs(root_dir, exist_ok=True)
+    manifest_path=_preformat_manifest_path(target_file_name, root_dir)
+    with open(manifest_path+'.tmp', 'w') as manifest_file:
+        json.dump({'TARGET_FILE': target_file_name, 'FINGERPRINT': fingerprint, 'TARGET_CHECKSUM': compute_file_checksum(target_file_name)}, manifest_file, indent=2)
+    os.replace(manifest_path+'.tmp', manifest_path)
+
+
+
+class RunManifest(object):
+    """
+        DOCSTRING:  Checkpoints of the recursive-tree of one country, kept in the staging-area:
+                        a. <country>_Run_Manifest.json lists the fingerprint of the run and the completed nodes ('<i>' for minibatch i, 'd<j>_<i>' for merge-pair i at depth j).
+                        b. Every completed node keeps its master-dataset and cross-refs as pickle files, which preserve the dtypes.
+                    A manifest with another fingerprint belongs to a stale run, hence its checkpoints are removed.
+                    Only the parent-process writes the manifest, and it is replaced atomically so that a crash never leaves a half-written manifest.
+    """
+    def __init__(self, curr_country, fingerprint, root_dir=config._CHECKPOINT_DIRECTORY):
+        self.curr_country=curr_country
+        self.fingerprint=fingerprint
+        self.root_dir=root_dir
+        self.manifest_path=os.path.join(root_dir, curr_country+'_Run_Manifest.json')
+        self.completed_nodes=dict()
+        os.makedirs(root_dir, exist_ok=True)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as manifest_file:
+                manifest=json.load(manifest_file)
+            if manifest['FINGERPRINT']==fingerprint:
+                self.completed_nodes=manifest['COMPLETED_NODES']
+                print('\nResuming {} from its run-manifest: {} nodes of the recursive-tree are already complete.'.format(curr_country, len(self.completed_nodes)))
+            else:
+                print('\nThe config or input of {} changed since its last run. Discarding its stale checkpoints.'.format(curr_country))
+                self.completed_nodes=manifest['COMPLETED_NODES']
+                self.clear()
+
+    def _node_path(self, node_name, kind):
+        return os.path.join(self.root_dir, '{}_{}_{}.pkl'.format(self.curr_country, node_name, kind))
+
+    def _write_manifest(self):
+        temp_path=self.manifest_path+'.tmp'
+        with open(temp_path, 'w') as manifest_file:
+            json.dump({'COUNTRY': self.curr_country, 'FINGERPRINT': self.fingerprint, 'COMPLETED_NODES': self.completed_nodes}, manifest_file, indent=2)
+        os.replace(temp_path, self.manifest_path)
+
+    def is_complete(self, node_name):
+        return node_name in self.completed_nodes
+
+    def record_node(self, node_name, master_df, cross_ref_df):
+        master_df.to_pickle(self._node_path(node_name, 'Master'))
+        cross_ref_df.to_pickle(self._node_path(node_name, 'Cross_Ref'))
+        self.completed_nodes[node_name]={'N_MASTERS': int(master_df.shape[0]), 'N_CROSS_REFS': int(cross_ref_df.shape[0])}
+        self._write_manifest()
+
+    def load_node(self, node_name):
+        return pd.read_pickle(self._node_path(node_name, 'Master')), pd.read_pickle(self._node_path(node_name, 'Cross_Ref'))
+
+    def clear(self):
+        for node_name in self.completed_nodes:
+            for kind in ['Master', 'Cross_Ref']:
+                if os.path.exists(self._node_path(node_name, kind)):
+                    os.remove(self._node_path(node_name, kind))
+        self.completed_nodes=dict()
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
@@ -0,0 +1,254 @@
+import os, sys, argparse
+from config import *
+
+# Only the config is imported up-front: pandas, the pipeline, and pyspark or the Rscript where configured, are imported by the stages which use them,
+# after the config-overrides are applied, since the utils modules bind their default-arguments to the config when they are imported.
+
+
+
+def preformat(engine=None, force=False):
+    """
+        DOCSTRING:  Stage 'preformat': standardizes the raw input (_RAW_STATIC_FILE_NAME) into _STATIC_FILE_NAME with the native or the Spark preformatter.
+                    With _USE_CHECKPOINTS, the standardized file is reused, unless forced, if it was written from the same raw file and preformat-config
+                    (see compute_preformat_fingerprint()) and is unchanged since.
+        INPUT:      _NATIVE_PREFORMAT/_SPARK_PREFORMAT (default _PREFORMAT_ENGINE), Flag-to-force-the-preformatting
+        OUTPUT:     Path-of-standardized-file. The errors of the preformatter are raised to the caller, hence run() never masterizes a stale file.
+    """
+    from utils.instrumentation import stage
+    from utils.checkpoint import compute_preformat_fingerprint, is_preformat_complete, record_preformat
+    engine=engine or config._PREFORMAT_ENGINE
+    fingerprint=compute_preformat_fingerprint(config._RAW_STATIC_FILE_NAME) if config._USE_CHECKPOINTS else None
+    if not force and fingerprint is not None and is_preformat_complete(fingerprint, config._STATIC_FILE_NAME, root_dir=config._CHECKPOINT_DIRECTORY):
+        # A resumed run reuses the formatted file, unless the raw file or the preformat-config changed since
+        print('\n{} was formatted from the current {} and config. Skipping the pre-formatting.'.format(config._STATIC_FILE_NAME, config._RAW_STATIC_FILE_NAME))
+        return config._STATIC_FILE_NAME
+    if engine==config._SPARK_PREFORMAT:
+        from utils.util_functions import preformat_input_using_sparksql
+        with stage('preformat', engine=engine):
+            preformat_input_using_sparksql()
+        print('\nFormatted the {} file into {} using PySpark successfully.'.format(config._RAW_STATIC_FILE_NAME, config._STATIC_FILE_NAME))
+    else:
+        from utils.preformat import preformat_input_natively
+        with stage('preformat', engine=engine):
+            preformat_input_natively()
+        print('\nFormatted the {} file into {} with the native chunked preformatter.'.format(config._RAW_STATIC_FILE_NAME, config._STATIC_FILE_NAME))
+    if fingerprint is not None:
+        record_preformat(fingerprint, config._STATIC_FILE_NAME, root_dir=config._CHECKPOINT_DIRECTORY)
+    return config._STATIC_FILE_NAME
+
+
+
+def read_source_records(source_file_name):
+    """
+        DOCSTRING:  Reads a standardized csv/xlsx file of records, and preprocesses it (see preprocess_dataframe()).
+        INPUT:      Path-of-standardized-file
+        OUTPUT:     Preprocessed-dataframe-of-all-countries. Raises a FileNotFoundError if the file does not exist yet.
+    """
+    import pandas as pd
+    from utils.instrumentation import stage
+    from utils.util_functions import preprocess_dataframe
+    if not os.path.exists(source_file_name):
+        raise FileNotFoundError('{} does not exist. Run the preformat stage first.'.format(source_file_name))
+    with stage('read_source') as stage_event:
+        if '.xlsx' in source_file_name.lower():
+            site_master_df=pd.read_excel(source_file_name, index_col=0)
+        else:
+            site_master_df=pd.read_csv(source_file_name, index_col=0)
+        stage_event['OUTPUT_ROWS']=site_master_df.shape[0]
+    print('\nFinished reading the Source-file {}'.format(source_file_name))
+
+    with stage('preprocess', input_rows=site_master_df.shape[0]):
+        site_master_df=preprocess_dataframe(df=site_master_df)
+    print('\nColumns: {}\n'.format(site_master_df.columns.values))
+    return site_master_df
+
+
+
+def _select_countries(available_countries, countries):
+    # All the available countries by default; a requested country without records is an error rather than a silent no-op
+    if countries is None:
+        return list(available_countries)
+    unknown_countries=[curr_country for curr_country in countries if curr_country not in set(available_countries)]
+    if len(unknown_countries)>0:
+        raise ValueError('No records found for the countries: {}'.format(unknown_countries))
+    return list(countries)
+
+
+
+def masterize(countries=None, incremental=False, max_depth=None, source_file_name=None):
+    """
+        DOCSTRING:  Stage 'masterize' (alias 'dedup'): deduplicates the records of the chosen countries of the standardized file through the recursive-tree,
+                    and publishes their Master, Raw-Cross-Ref and Cross-Ref-Full-Report. If incremental, masters the new records of _DELTA_STATIC_FILE_NAME
+                    against the published masters instead. With max_depth, stops after that depth of the recursive-tree; the next run resumes from the checkpoints.
+                    With _SPARK_EXECUTION (and not incremental), the countries are masterized on Spark.
+        INPUT:      List-of-country-names (default all), Flag-for-incremental-mastering, Last-depth-to-run (optional), Path-of-standardized-file (optional)
+        OUTPUT:     Dict of country-name to (Master-Dataframe, Dataframe-of-cross-references) (see masterize_countries()); None on Spark.
+    """
+    source_file_name=source_file_name or (config._DELTA_STATIC_FILE_NAME if incremental else config._STATIC_FILE_NAME)
+    if config._SPARK_EXECUTION and not incremental:
+        if max_depth is not None:
+            raise ValueError('The Spark execution runs every depth of the recursive-tree in one job; max_depth is not supported.')
+        from utils.spark_pipeline import get_spark_session, prepare_records_spark, masterize_countries_spark
+        # The records stay in Spark from the standardized csv to the Parquet outputs; the incremental mode always runs in pandas
+        spark=get_spark_session()
+        try:
+            records_sdf=prepare_records_spark(spark, source_file_name)
+            if countries is not None:
+                records_sdf=records_sdf.filter(records_sdf['COUNTRY'].isin(list(countries)))
+            masterize_countries_spark(spark=spark, records_sdf=records_sdf, output_dir=config._SPARK_OUTPUT_DIRECTORY)
+        finally:
+            spark.stop()
+        return None
+
+    from utils.recursive_pipeline import masterize_countries
+    from utils.background_io import flush_background_writes
+    site_master_df=read_source_records(source_file_name)
+    countries=_select_countries(site_master_df['COUNTRY'].unique(), countries)
+    print('\nCountries identified are: {}'.format(countries))
+
+    # Masterize the countries concurrently (largest first) under one worker and memory budget; each country logs into /Logs/<country>.log
+    country_results=masterize_countries(site_master_df=site_master_df, countries=countries, n_workers=config._N_WORKERS, memory_budget_mb=config._MEMORY_BUDGET_MB,
+                                        log_dir=config._LOGS_DIRECTORY, incremental=incremental, max_depth=max_depth)
+    # Final barrier: every background-write is on disk before the stage reports completion
+    flush_background_writes()
+    return country_results
+
+
+
+def report(countries=None, source_file_name=None):
+    """
+        DOCSTRING:  Stage 'report': re-generates the Cross-Ref-Full-Report of published countries from their Master and Raw-Cross-Ref, with the original-info
+                    of the standardized file; the records mastered incrementally from other files get the original-info of their Master, if they are masters.
+        INPUT:      List-of-country-names (default every published country), Path-of-standardized-file (optional)
+        OUTPUT:     List of the countries reported.
+    """
+    import pandas as pd
+    from utils.instrumentation import stage
+    from utils.util_functions import clean_dataframe_variants, generate_cross_ref_report
+    from utils.recursive_pipeline import load_persisted_master
+    from utils.matching_service import find_published_countries
+    from utils.background_io import flush_background_writes
+    site_master_df=read_source_records(source_file_name or config._STATIC_FILE_NAME)
+    countries=_select_countries(find_published_countries(config._MASTER_DATA_DIRECTORY), countries)
+    for curr_country in countries:
+        master_df, cross_ref_df=load_persisted_master(curr_country, master_dir=config._MASTER_DATA_DIRECTORY)
+        with stage('clean', country=curr_country):
+            entire_country_df, entire_country_df_copy=clean_dataframe_variants(site_master_df[site_master_df['COUNTRY']==curr_country])
+        country_df=pd.concat([entire_country_df_copy, master_df.loc[master_df.index.difference(entire_country_df_copy.index)]])
+        with stage('report_writing', country=curr_country, input_rows=cross_ref_df.shape[0]):
+            generate_cross_ref_report(cross_ref_df=cross_ref_df, country_df=country_df, curr_country=curr_country, target_dir=config._MASTER_DATA_DIRECTORY)
+    flush_background_writes()
+    print('\nRe-generated the Cross-Ref-Full-Report of: {}'.format(countries))
+    return countries
+
+
+
+def run(countries=None, incremental=False, max_depth=None, preformat_engine=None):
+    """
+        DOCSTRING:  The whole pipeline, the default command: preformat (skipped in the incremental mode, whose new records are already standardized), then masterize.
+        INPUT:      List-of-country-names (default all), Flag-for-incremental-mastering, Last-depth-to-run (optional), Preformat-engine (optional)
+        OUTPUT:     Dict of country-name to (Master-Dataframe, Dataframe-of-cross-references); None on Spark.
+    """
+    source_file_name=config._DELTA_STATIC_FILE_NAME if incremental else preformat(engine=preformat_engine)
+    return masterize(countries=countries, incremental=incremental, max_depth=max_depth, source_file_name=source_file_name)
+
+
+
+def serve(countries=None, host=None, port=None, unix_socket=None):
+    """
+        DOCSTRING:  Command 'serve': the resident matching service over the published masters (see serve_matching_service()).
+        INPUT:      List-of-country-names (default _SERVICE_COUNTRIES), Host, Port, Path-of-Unix-socket (defaults from the Matching_Service config)
+        OUTPUT:     None, once interrupted.
+    """
+    from utils.matching_service import serve_matching_service
+    serve_matching_service(countries=countries if countries is not None else config._SERVICE_COUNTRIES, master_dir=config._MASTER_DATA_DIRECTORY,
+                           host=host or config._SERVICE_HOST, port=port if port is not None else config._SERVICE_PORT,
+                           unix_socket=unix_socket or config._SERVICE_UNIX_SOCKET, reload_interval=config._SERVICE_RELOAD_INTERVAL)
+
+
+
+def build_parser():
+    """
+        DOCSTRING:  Command-line of the pipeline: a command per stage, and -s/--set NAME=VALUE config-overrides before the command.
+    """
+    parser=argparse.ArgumentParser(prog='Recursive_Masterize_Hospital_Entities.py', description='Masterize hospital-entities by text-similarity. Runs the whole pipeline without a command.')
+    parser.add_argument('-s', '--set', dest='config_overrides', action='append', default=[], metavar='NAME=VALUE',
+                        help='override a value of config/config.py for this run, eg. -s _N_WORKERS=4 -s _STAGING_BACKEND=Arrow (repeatable)')
+    parser.set_defaults(command='run', countries=None, incremental=False, max_depth=None, engine=None)
+    subparsers=parser.add_subparsers(dest='command', metavar='command')
+
+    def add_masterize_arguments(subparser):
+        subparser.add_argument('-c', '--countries', nargs='+', metavar='COUNTRY', help='masterize only these countries (default all)')
+        subparser.add_argument('--incremental', action='store_true', help='master the new records of _DELTA_STATIC_FILE_NAME against the published masters (_INCREMENTAL_MODE)')
+        subparser.add_argument('--max-depth', type=int, metavar='DEPTH', help='stop after this depth of the recursive-tree (0 for the minibatches only); re-run to resume from the checkpoints')
+
+    run_parser=subparsers.add_parser('run', help='preformat and masterize (default)')
+    add_masterize_arguments(run_parser)
+    run_parser.add_argument('--engine', choices=[config._NATIVE_PREFORMAT, config._SPARK_PREFORMAT], help='preformat engine (default _PREFORMAT_ENGINE)')
+
+    preformat_parser=subparsers.add_parser('preformat', help='standardize the raw input into _STATIC_FILE_NAME')
+    preformat_parser.add_argument('--engine', choices=[config._NATIVE_PREFORMAT, config._SPARK_PREFORMAT], help='preformat engine (default _PREFORMAT_ENGINE)')
+    preformat_parser.add_argument('--force', action='store_true', help='preformat even if the standardized file was formatted from the current raw file and config')
+
+    masterize_parser=subparsers.add_parser('masterize', aliases=['dedup'], help='deduplicate the countries of the standardized file, or up to a depth of their recursive-tree')
+    add_masterize_arguments(masterize_parser)
+    masterize_parser.add_argument('--source', help='standardized file (default _STATIC_FILE_NAME, or _DELTA_STATIC_FILE_NAME if incremental)')
+
+    report_parser=subparsers.add_parser('report', help='re-generate the Cross-Ref-Full-Report of published countries')
+    report_parser.add_argument('-c', '--countries', nargs='+', metavar='COUNTRY', help='report only these countries (default every published country)')
+    report_parser.add_argument('--source', help='standardized file with the original-info (default _STATIC_FILE_NAME)')
+
+    serve_parser=subparsers.add_parser('serve', help='resident matching service over the published masters')
+    serve_parser.add_argument('-c', '--countries', nargs='+', metavar='COUNTRY', help='index only these countries (default _SERVICE_COUNTRIES)')
+    serve_parser.add_argument('--host', help='default _SERVICE_HOST')
+    serve_parser.add_argument('--port', type=int, help='default _SERVICE_PORT')
+    serve_parser.add_argument('--unix-socket', help='serve on this Unix socket instead (default _SERVICE_UNIX_SOCKET)')
+    return parser
+
+
+
+def main(argv=None):
+    """
+        DOCSTRING:  Entry point of the command-line, eg.:
+                        python Recursive_Masterize_Hospital_Entities.py                                  the whole pipeline, as configured
+                        python Recursive_Masterize_Hospital_Entities.py preformat --engine Native
+                        python Recursive_Masterize_Hospital_Entities.py -s _N_WORKERS=8 dedup -c USA --max-depth 2
+                        python Recursive_Masterize_Hospital_Entities.py report -c USA
+                        python Recursive_Masterize_Hospital_Entities.py serve --port 8765
+        INPUT:      List of command-line arguments (default sys.argv[1:])
+        OUTPUT:     Exit-code.
+    """
+    parser=build_parser()
+    args=parser.parse_args(argv)
+    try:
+        apply_config_overrides(args.config_overrides)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.max_depth is not None and (args.max_depth<0 or not config._USE_CHECKPOINTS):
+        parser.error('--max-depth needs a depth >= 0 and _USE_CHECKPOINTS, so that the next run resumes from the completed depths')
+
+    if args.command=='serve':
+        serve(countries=args.countries, host=args.host, port=args.port, unix_socket=args.unix_socket)
+        return 0
+
+    from utils.instrumentation import start_stage_trace, read_stage_trace, summarize_stage_trace
+    # Every stage of this run (and of its worker-processes) is appended to the stage-trace
+    stage_trace_file=start_stage_trace()
+    incremental=args.incremental or config._INCREMENTAL_MODE
+    try:
+        if args.command=='preformat':
+            preformat(engine=args.engine, force=args.force)
+        elif args.command in ('masterize', 'dedup'):
+            masterize(countries=args.countries, incremental=incremental, max_depth=args.max_depth, source_file_name=args.source)
+        elif args.command=='report':
+            report(countries=args.countries, source_file_name=args.source)
+        else:
+            run(countries=args.countries, incremental=incremental, max_depth=args.max_depth, preformat_engine=args.engine)
+    except (FileNotFoundError, ValueError) as e:
+        print('\n{}'.format(e), file=sys.stderr)
+        return 1
+
+    if stage_trace_file is not None:
+        print('\nTime and memory of each stage (details of every batch and depth at {}):\n{}'.format(stage_trace_file, summarize_stage_trace(read_stage_trace()).to_string()))
+    print('\n\n\nPipeline completed execution{}...'.format(' on Spark' if config._SPARK_EXECUTION and not incremental and args.command!='preformat' else ''))
+    return 0
@@ -0,0 +1,79 @@
+import numpy as np, pandas as pd
+from config import *
+from utils.dtype_schema import apply_cross_ref_schema
+
+
+
+class CrossRefStore(object):
+    """
+        DOCSTRING:  Array-backed cross-references of one country, replacing the appends to and update() of the entire cross-ref dataframe at every depth:
+                        a. SR_NUM_1 and SR_NUM_2 (its master) are integer arrays, and every other column (scores, COUNTRY) is an array of its own.
+                        b. append() only collects the cross-refs of a node; they are concatenated once, at the first re-point or at the end.
+                        c. repoint() applies the merges of a depth with a vectorized look-up, instead of set_index/update/reset_index of the whole country.
+                        d. to_dataframe() materializes the cross-ref dataframe once, in the order the cross-refs were appended, with the cross-ref-schema.
+    """
+    def __init__(self):
+        self.columns=None
+        self.sr_nums=np.zeros(0, dtype=np.int64)
+        self.masters=np.zeros(0, dtype=np.int64)
+        self.values=dict()
+        self._pending_dfs=list()
+        self._position_index=pd.Index(self.sr_nums)
+
+    def __len__(self):
+        return self.sr_nums.shape[0]+sum(df.shape[0] for df in self._pending_dfs)
+
+    def append(self, cross_ref_df):
+        if self.columns is None:
+            self.columns=list(cross_ref_df.columns)
+        self._pending_dfs.append(cross_ref_df)
+
+    def _consolidate(self):
+        if len(self._pending_dfs)==0:
+            return
+        pending_df=pd.concat(self._pending_dfs, ignore_index=True)
+        self._pending_dfs=list()
+        self.sr_nums=np.concatenate([self.sr_nums, pending_df['SR_NUM_1'].values.astype(np.int64)])
+        self.masters=np.concatenate([self.masters, pending_df['SR_NUM_2'].values.astype(np.int64)])
+        for colname in self.columns:
+            if colname not in ('SR_NUM_1', 'SR_NUM_2'):
+                self.values[colname]=pending_df[colname].to_numpy(copy=True) if colname not in self.values else np.concatenate([self.values[colname], pending_df[colname].to_numpy()])
+        self._position_index=pd.Index(self.sr_nums)
+
+    def repoint(self, depth_cross_ref_df):
+        """
+            DOCSTRING:  Applies the merges observed at a new depth: every master which got merged into another master takes the cross-ref of that link,
+                        and its children (the records pointing to it) are re-pointed to the new master, keeping their own scores.
+            INPUT:      Dataframe-of-cross-references-at-new-depth
+            OUTPUT:     Number of merged masters.
+        """
+        self._consolidate()
+        merged_df=depth_cross_ref_df[depth_cross_ref_df['SR_NUM_1']!=depth_cross_ref_df['SR_NUM_2']]
+        if merged_df.shape[0]==0:
+            return 0
+        merged_masters=merged_df['SR_NUM_1'].values.astype(np.int64)
+        new_masters=merged_df['SR_NUM_2'].values.astype(np.int64)
+
+        # Children of the merged masters follow them
+        merged_positions=pd.Index(merged_masters).get_indexer(self.masters)
+        is_child=(merged_positions>=0)
+        self.masters[is_child]=new_masters[merged_positions[is_child]]
+
+        # The merged masters take the cross-ref of their link to the new master
+        positions=self._position_index.get_indexer(merged_masters)
+        if (positions<0).any():
+            raise KeyError('The merged masters {} are missing in the cross-reference.'.format(merged_masters[positions<0][:10]))
+        self.masters[positions]=new_masters
+        for colname in self.values:
+            if colname in merged_df.columns:
+                self.values[colname][positions]=merged_df[colname].to_numpy()
+        return merged_masters.shape[0]
+
+    def to_dataframe(self):
+        self._consolidate()
+        if self.columns is None:
+            return pd.DataFrame()
+        cross_ref_df=pd.DataFrame(self.values)
+        cross_ref_df.insert(0, 'SR_NUM_1', self.sr_nums)
+        cross_ref_df.insert(1, 'SR_NUM_2', self.masters)
+        return apply_cross_ref_schema(cross_ref_df[self.columns])
@@ -0,0 +1,70 @@
+import numpy as np, pandas as pd
+from config import *
+
+
+_SR_NUM_COLUMNS = ['SR_NUM', 'SR_NUM_1', 'SR_NUM_2']
+_CROSS_REF_SCORE_COLUMNS = config._COLS_FOR_TOTAL_MATCH_CALC + ['NUM_OF_MATCHES_FOUND']
+
+
+
+def text_dtype(arrow_strings=config._ARROW_STRINGS):
+    """
+        DOCSTRING:  Dtype of the high-cardinality text columns: pyarrow-backed strings (one contiguous buffer instead of a python-object per cell)
+                    if pyarrow is installed and pandas supports them (pandas>=1.3), else python-object strings.
+        INPUT:      Flag-for-arrow-strings
+        OUTPUT:     Pandas-dtype.
+    """
+    if arrow_strings:
+        try:
+            import pyarrow
+            return pd.StringDtype('pyarrow')
+        except (ImportError, TypeError):
+            # An older pandas rejects the storage argument of StringDtype with a TypeError
+            pass
+    return object
+
+
+
+def apply_record_schema(df, categorical_columns=config._CATEGORICAL_COLUMNS, sr_num_dtype=config._SR_NUM_DTYPE):
+    """
+        DOCSTRING:  Compact dtypes of the records (raw, cleaned or masters), instead of a python-object str per cell:
+                        a. SR_NUM (index or column) as sr_num_dtype.
+                        b. The low-cardinality text columns (COUNTRY, STATE, CITY, POSTAL_CODE, ...) as categoricals.
+                        c. The other text columns (SITE_NAME, CONCAT_ADDRESS, ...) as arrow-strings, see text_dtype().
+                    Blank cells become '' first, as after preprocess_dataframe(), so that the text columns never hold NaN. Numeric columns are kept as they are.
+                    A no-op if _COMPACT_DTYPES is off.
+        INPUT:      Dataframe, List-of-categorical-columns, Dtype-of-SR_NUM
+        OUTPUT:     Dataframe with the compact dtypes.
+    """
+    if not config._COMPACT_DTYPES:
+        return df
+    df=df.copy()
+    if df.index.name in _SR_NUM_COLUMNS:
+        df.index=df.index.astype(sr_num_dtype)
+    string_dtype=text_dtype()
+    for colname in df.columns:
+        if colname in _SR_NUM_COLUMNS:
+            df[colname]=df[colname].astype(sr_num_dtype)
+        elif colname in categorical_columns:
+            if not isinstance(df[colname].dtype, pd.CategoricalDtype):
+                df[colname]=df[colname].astype(object).fillna('').astype(str).astype('category')
+        elif not pd.api.types.is_numeric_dtype(df[colname].dtype) and df[colname].dtype!=string_dtype:
+            df[colname]=df[colname].astype(object).fillna('').astype(str).astype(string_dtype)
+    return df
+
+
+
+def apply_cross_ref_schema(cross_ref_df, sr_num_dtype=config._SR_NUM_DTYPE, score_dtype=config._SCORE_DTYPE):
+    """
+        DOCSTRING:  Compact dtypes of the cross-references (and normalized-duplicates): SR_NUM_1 and SR_NUM_2 as sr_num_dtype, the comparison-scores
+                    (0/1, or _SCALING_FACTOR) and NUM_OF_MATCHES_FOUND as score_dtype, and COUNTRY as a categorical, instead of float64 and python-objects.
+                    A no-op if _COMPACT_DTYPES is off.
+        INPUT:      Dataframe-of-cross-references, Dtype-of-SR_NUM, Dtype-of-scores
+        OUTPUT:     Dataframe-of-cross-references with the compact dtypes.
+    """
+    if not config._COMPACT_DTYPES:
+        return cross_ref_df
+    column_dtypes={colname: sr_num_dtype for colname in _SR_NUM_COLUMNS[1:]}
+    column_dtypes.update({colname: score_dtype for colname in _CROSS_REF_SCORE_COLUMNS})
+    column_dtypes['COUNTRY']='category'
+    return cross_ref_df.astype({colname: dtype for colname, dtype in column_dtypes.items() if colname in cross_ref_df.columns})
@@ -0,0 +1,70 @@
+import numpy as np, pandas as pd
+from config import *
+from utils.util_functions import generate_dummy_cross_refs_for_masters
+from utils.dtype_schema import apply_cross_ref_schema
+
+
+
+def hash_normalized_records(country_df, thresholds_dict=config._THRESHOLDS_DICT):
+    """
+        DOCSTRING:  64-bit hash of every record over its normalized match-score relevant columns; records which clean_dataframe() made identical hash alike.
+        INPUT:      Cleaned-dataframe, Dict-of-column-thresholds
+        OUTPUT:     Array of uint64 hashes, aligned by record.
+    """
+    return pd.util.hash_pandas_object(country_df[list(thresholds_dict)], index=False).values
+
+
+
+def find_exact_duplicates(country_df, thresholds_dict=config._THRESHOLDS_DICT, scaling_factor=config._SCALING_FACTOR, scaled_columns=config._SCALED_COLUMNS,
+                          total_matches_threshold=config._TOTAL_MATCHES_THRESHOLD):
+    """
+        DOCSTRING:  Hash-based pass finding the records whose normalized match-score relevant columns are all equal to those of an earlier record (its representative):
+                        a. The records are grouped by hash_normalized_records(); the first record of a group is its representative.
+                        b. A record is compared to its representative column by column, so that a hash-collision never merges two different records.
+                        c. Blank cells score 0 like in the scoring-engine, hence a duplicate is only collapsed if its non-blank columns reach the total-threshold.
+                    The scores of a duplicate are the ones the scoring-engine would give it against its representative: every non-blank column matches exactly.
+        INPUT:      Cleaned-dataframe, Dict-of-column-thresholds, Scaling-factor, Columns-to-scale, Total-matches-threshold
+        OUTPUT:     Array of the representative-position of every record (its own position if it is not a duplicate), Dict of score-colname to array-of-scores,
+                    Array-of-total-scores (NUM_OF_MATCHES_FOUND).
+    """
+    n_rows=country_df.shape[0]
+    positions=np.arange(n_rows)
+    codes, uniques=pd.factorize(hash_normalized_records(country_df, thresholds_dict))
+    # factorize() numbers the hashes by first appearance, hence the first index of every code is the earliest record of its group
+    representatives=np.unique(codes, return_index=True)[1][codes]
+
+    scores=dict()
+    total_scores=np.zeros(n_rows, dtype=np.int64)
+    for colname in thresholds_dict:
+        values=country_df[colname].fillna('').astype(str).values
+        is_collision=(values!=values[representatives])
+        representatives[is_collision]=positions[is_collision]
+        scores[colname+'_COMPARISON_SCORE']=np.where(values!='', scaling_factor if colname in scaled_columns else 1, 0)
+        total_scores+=scores[colname+'_COMPARISON_SCORE']
+    is_below_threshold=(total_scores<total_matches_threshold)
+    representatives[is_below_threshold]=positions[is_below_threshold]
+    return representatives, scores, total_scores
+
+
+
+def collapse_exact_duplicates(country_df, curr_country, thresholds_dict=config._THRESHOLDS_DICT):
+    """
+        DOCSTRING:  Pre-pass of the recursive-tree: collapses the exact duplicates (see find_exact_duplicates()) into their representative before any candidate-pairs
+                    are generated, and emits their cross-references directly, in the format of generate_final_cross_refs(): SR_NUM_1 is the duplicate and
+                    SR_NUM_2 its representative. Only the representatives are scored; a duplicate follows its representative into whichever master it merges.
+        INPUT:      Cleaned-dataframe-for-country, country-name, Dict-of-column-thresholds
+        OUTPUT:     Array-of-positions-of-the-representatives (ascending), Dataframe-of-cross-references of the duplicates.
+    """
+    representatives, scores, total_scores=find_exact_duplicates(country_df, thresholds_dict)
+    positions=np.arange(country_df.shape[0])
+    is_duplicate=(representatives!=positions)
+    sr_nums=country_df.index.values
+
+    exact_cross_ref_df=generate_dummy_cross_refs_for_masters(master_record_ids=sr_nums[is_duplicate], curr_country=curr_country)
+    exact_cross_ref_df['SR_NUM_2']=sr_nums[representatives[is_duplicate]]
+    for colname, col_scores in scores.items():
+        exact_cross_ref_df[colname]=col_scores[is_duplicate]
+    exact_cross_ref_df['NUM_OF_MATCHES_FOUND']=total_scores[is_duplicate]
+    print('\n{} exact duplicates of {} collapse into {} representatives; {} records remain to be scored.'.format(
+        int(is_duplicate.sum()), curr_country, np.unique(representatives[is_duplicate]).shape[0], int((~is_duplicate).sum())))
+    return positions[~is_duplicate], apply_cross_ref_schema(exact_cross_ref_df)
@@ -0,0 +1,192 @@
+import pandas as pd, os, json, time, threading, cProfile, tracemalloc
+from contextlib import contextmanager
+from config import *
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; the peak RSS is not recorded there
+    resource = None
+
+
+# Keys which the nested stages of a thread inherit from their enclosing stage
+_INHERITED_STAGE_KEYS = ['COUNTRY', 'NODE', 'DEPTH']
+_STAGE_STACKS = threading.local()
+_MB = 1024*1024
+
+
+
+def stage_trace_file_name(trace_format=config._STAGE_TRACE_FORMAT, trace_file_prefix=config._STAGE_TRACE_FILE_PREFIX):
+    return trace_file_prefix+('.json' if trace_format==config._CHROME_TRACE else '.jsonl')
+
+
+
+def start_stage_trace(trace_format=config._STAGE_TRACE_FORMAT, trace_file_prefix=config._STAGE_TRACE_FILE_PREFIX):
+    """
+        DOCSTRING:  Starts a new stage-trace file for a run, replacing the one of the previous run. The Chrome-trace is a JSON array whose closing ']' is optional,
+                    hence the stages of the parent and the worker-processes can all be appended to it as they complete.
+        INPUT:      'jsonl'/'chrome' (None if the instrumentation is disabled), Abs-path-of-trace-file without extension
+        OUTPUT:     Abs-path-of-trace-file, or None.
+    """
+    if trace_format is None:
+        return None
+    trace_file_name=stage_trace_file_name(trace_format, trace_file_prefix)
+    os.makedirs(os.path.dirname(trace_file_name) or '.', exist_ok=True)
+    with open(trace_file_name, 'w') as trace_stream:
+        if trace_format==config._CHROME_TRACE:
+            trace_stream.write('[\n')
+    return trace_file_name
+
+
+
+def _write_stage_event(stage_event, trace_format, trace_file_prefix):
+    """
+        DOCSTRING:  Appends one stage as a single line, so that the lines of concurrent processes never interleave.
+    """
+    if trace_format==config._CHROME_TRACE:
+        args={key: value for key, value in stage_event.items() if key not in ('STAGE', 'START', 'WALL_SECONDS', 'PID', 'THREAD')}
+        stage_event={'name': stage_event['STAGE'], 'cat': stage_event.get('COUNTRY') or 'pipeline', 'ph': 'X', 'ts': int(stage_event['START']*1e6),
+                     'dur': int(stage_event['WALL_SECONDS']*1e6), 'pid': stage_event['PID'], 'tid': stage_event['THREAD'], 'args': args}
+        line=json.dumps(stage_event, default=str)+',\n'
+    else:
+        line=json.dumps(stage_event, default=str)+'\n'
+    with open(stage_trace_file_name(trace_format, trace_file_prefix), 'a') as trace_stream:
+        trace_stream.write(line)
+
+
+
+def _peak_rss_mb():
+    """
+        DOCSTRING:  High-water mark of the resident-set-size of this process, in MB (ru_maxrss is in KB on Linux).
+    """
+    return None if resource is None else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+
+
+def _profile_file_name(stage_event, profiles_dir):
+    node='_'.join(str(stage_event[key]) for key in ('COUNTRY', 'NODE') if stage_event.get(key) is not None)
+    return os.path.join(profiles_dir, '{}_{}_{}.prof'.format(stage_event['STAGE'], node or 'main', stage_event['PID']))
+
+
+
+@contextmanager
+def stage(stage_name, **attributes):
+    """
+        DOCSTRING:  Instruments one stage of the pipeline, and appends it to the stage-trace of the run once it completes (or fails):
+                        a. WALL_SECONDS, CPU_SECONDS of the thread, CHILD_CPU_SECONDS of the subprocesses waited for (the Rscript), and the PEAK_RSS_MB of the process.
+                           WALL_SECONDS minus both CPU-times is the time spent waiting, mostly for disk I/O or for the Rscript to start.
+                        b. The attributes (eg. input_rows) in upper-case; the stage can add more (eg. CANDIDATE_PAIRS) into the yielded dict while it runs.
+                        c. COUNTRY, NODE and DEPTH are inherited from the enclosing stage of the same thread.
+                    Stages listed in _PROFILE_STAGES are run under cProfile into <_PROFILES_DIRECTORY>/<stage>_<country>_<node>_<pid>.prof,
+                    and _TRACE_PYTHON_MEMORY adds the tracemalloc peak of the python allocations (of the whole process) as PY_PEAK_MB.
+        INPUT:      Name-of-stage, Attributes-of-stage
+        OUTPUT:     Dict of the stage-event, to which the stage can add its own counts.
+    """
+    stage_event={key.upper(): value for key, value in attributes.items()}
+    trace_format=config._STAGE_TRACE_FORMAT
+    if trace_format is None:
+        yield stage_event
+        return
+
+    stage_stack=getattr(_STAGE_STACKS, 'stack', None)
+    if stage_stack is None:
+        stage_stack=_STAGE_STACKS.stack=list()
+    if len(stage_stack)>0:
+        for key in _INHERITED_STAGE_KEYS:
+            if key not in stage_event and stage_stack[-1]['event'].get(key) is not None:
+                stage_event[key]=stage_stack[-1]['event'][key]
+    stage_frame={'event': stage_event, 'py_peak': 0}
+    stage_stack.append(stage_frame)
+
+    profiler=None
+    if stage_name in config._PROFILE_STAGES and not any(frame.get('profiled') for frame in stage_stack):
+        # A thread can only have one active profiler, hence the stages nested in a profiled stage are not profiled separately
+        profiler=cProfile.Profile()
+        stage_frame['profiled']=True
+    if config._TRACE_PYTHON_MEMORY:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+
+    status='OK'
+    start, start_cpu, start_times=time.time(), time.thread_time(), os.times()
+    start_counter=time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield stage_event
+    except BaseException:
+        status='FAILED'
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        end_counter, end_cpu, end_times=time.perf_counter(), time.thread_time(), os.times()
+        stage_stack.pop()
+        stage_event.update({
+            'STAGE': stage_name,
+            'STATUS': status,
+            'START': start,
+            'WALL_SECONDS': end_counter-start_counter,
+            'CPU_SECONDS': end_cpu-start_cpu,
+            'CHILD_CPU_SECONDS': (end_times.children_user-start_times.children_user)+(end_times.children_system-start_times.children_system),
+            'PEAK_RSS_MB': _peak_rss_mb(),
+            'PID': os.getpid(),
+            'THREAD': threading.current_thread().name })
+        if config._TRACE_PYTHON_MEMORY:
+            # The nested stages reset the peak, hence their own peaks count towards this stage as well
+            py_peak=max(tracemalloc.get_traced_memory()[1], stage_frame['py_peak'])
+            stage_event['PY_PEAK_MB']=py_peak/_MB
+            if len(stage_stack)>0:
+                stage_stack[-1]['py_peak']=max(stage_stack[-1]['py_peak'], py_peak)
+        try:
+            if profiler is not None:
+                os.makedirs(config._PROFILES_DIRECTORY, exist_ok=True)
+                profiler.dump_stats(_profile_file_name(stage_event, config._PROFILES_DIRECTORY))
+            _write_stage_event(stage_event, trace_format, config._STAGE_TRACE_FILE_PREFIX)
+        except Exception as e:
+            # The instrumentation must never fail the pipeline
+            print('\nSomething went wrong while writing the stage-trace of {}.'.format(stage_name))
+            print(e)
+
+
+
+def read_stage_trace(trace_format=config._STAGE_TRACE_FORMAT, trace_file_prefix=config._STAGE_TRACE_FILE_PREFIX):
+    """
+        DOCSTRING:  Reads the stage-trace of a run (JSON-lines or Chrome-trace) back into a dataframe, with one row per stage.
+        INPUT:      'jsonl'/'chrome', Abs-path-of-trace-file without extension
+        OUTPUT:     Dataframe of the stage-events.
+    """
+    with open(stage_trace_file_name(trace_format, trace_file_prefix)) as trace_stream:
+        content=trace_stream.read()
+    if trace_format==config._CHROME_TRACE:
+        trace_events=json.loads(content.rstrip().rstrip(',').rstrip(']')+']')
+        stage_events=[dict(trace_event['args'], STAGE=trace_event['name'], START=trace_event['ts']/1e6, WALL_SECONDS=trace_event['dur']/1e6,
+                           PID=trace_event['pid'], THREAD=trace_event['tid']) for trace_event in trace_events]
+    else:
+        stage_events=[json.loads(line) for line in content.splitlines() if line.strip()]
+    return pd.DataFrame(stage_events)
+
+
+
+def _sum_if_any(values):
+    # Counts which a stage does not record stay missing, instead of summing up to 0
+    return pd.to_numeric(values).sum(min_count=1)
+
+
+
+def summarize_stage_trace(stage_events_df):
+    """
+        DOCSTRING:  Totals of each stage over all countries, batches and depths: where the run spent its time (CPU in python/pandas, CPU of the Rscript,
+                    or waiting on disk I/O), and its largest memory high-water mark. The totals of nested stages include their inner stages.
+        INPUT:      Dataframe of the stage-events
+        OUTPUT:     Dataframe indexed by STAGE, slowest stage first.
+    """
+    stage_events_df=stage_events_df.copy()
+    for colname in ['CHILD_CPU_SECONDS', 'INPUT_ROWS', 'CANDIDATE_PAIRS', 'PEAK_RSS_MB']:
+        if colname not in stage_events_df.columns:
+            stage_events_df[colname]=None
+    stage_events_df['WAIT_SECONDS']=(stage_events_df['WALL_SECONDS']-stage_events_df['CPU_SECONDS']-stage_events_df['CHILD_CPU_SECONDS'].fillna(0)).clip(lower=0)
+    summary_df=stage_events_df.groupby('STAGE').agg(
+        N_CALLS=('WALL_SECONDS', 'size'), WALL_SECONDS=('WALL_SECONDS', 'sum'), CPU_SECONDS=('CPU_SECONDS', 'sum'), CHILD_CPU_SECONDS=('CHILD_CPU_SECONDS', 'sum'),
+        WAIT_SECONDS=('WAIT_SECONDS', 'sum'), INPUT_ROWS=('INPUT_ROWS', _sum_if_any), CANDIDATE_PAIRS=('CANDIDATE_PAIRS', _sum_if_any), PEAK_RSS_MB=('PEAK_RSS_MB', 'max'))
+    return summary_df.sort_values('WALL_SECONDS', ascending=False)
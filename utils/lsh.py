@@ -0,0 +1,152 @@
+import numpy as np, pandas as pd, zlib
+from config import *
+from utils.blocking import _dedup_pairs_within_blocks, _linkage_pairs_within_blocks, estimate_blocking_recall_loss
+
+
+# MinHash permutations are h(x) = (a*x + b) mod p over the 32-bit shingle-hashes, with the Mersenne-prime p = 2^31 - 1
+_MERSENNE_PRIME = np.uint64((1<<31)-1)
+# Max (shingles x permutations) held at once while hashing; the unique values are hashed in chunks below it
+_MAX_HASHES_PER_CHUNK = 1<<22
+# Multiplier folding the rows of a band into one 64-bit band-key (wraps around modulo 2^64)
+_BAND_KEY_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+
+def shingle_hashes(value, shingle_size=config._LSH_SHINGLE_SIZE):
+    """
+        DOCSTRING:  Set of the character n-gram shingles of a value, as stable 32-bit hashes (crc32, hence the same in every process and run).
+                    A value shorter than the shingle-size is a single shingle.
+        INPUT:      String, Chars-per-shingle
+        OUTPUT:     Array of unique shingle-hashes (empty for a blank value).
+    """
+    if value=='':
+        return np.zeros(0, dtype=np.uint64)
+    shingles={value[k : k+shingle_size] for k in range(max(len(value)-shingle_size+1, 1))}
+    return np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+
+
+
+def minhash_signatures(values, n_permutations=config._LSH_N_PERMUTATIONS, shingle_size=config._LSH_SHINGLE_SIZE, seed=config._RANDOM_SEED):
+    """
+        DOCSTRING:  MinHash-signatures of the shingle-sets of an array of strings: the probability that two signatures agree on a permutation
+                    is the Jaccard-similarity of their shingle-sets. Each distinct value is hashed once, in vectorized chunks of values.
+        INPUT:      Array-of-strings, Number-of-permutations, Chars-per-shingle, Random-seed (the permutations must be the same for both datasets of a Linkage)
+        OUTPUT:     2D-array of signatures (n_values x n_permutations), Boolean-array of the blank values (whose signature is meaningless).
+    """
+    random_state=np.random.RandomState(seed)
+    coefficients_a=random_state.randint(1, int(_MERSENNE_PRIME), size=n_permutations).astype(np.uint64)
+    coefficients_b=random_state.randint(0, int(_MERSENNE_PRIME), size=n_permutations).astype(np.uint64)
+
+    codes, uniques=pd.factorize(np.asarray(values, dtype=str))
+    list_of_hashes=[shingle_hashes(value, shingle_size) for value in uniques]
+    n_shingles=np.array([hashes.shape[0] for hashes in list_of_hashes], dtype=np.int64)
+    unique_signatures=np.full((len(uniques), n_permutations), _MERSENNE_PRIME, dtype=np.uint64)
+    start=0
+    while start<len(uniques):
+        # As many values as fit in _MAX_HASHES_PER_CHUNK, but at least one
+        n_cumulative=np.cumsum(n_shingles[start:])
+        stop=start+max(int(np.searchsorted(n_cumulative, _MAX_HASHES_PER_CHUNK//n_permutations, side='right')), 1)
+        non_blank=start+np.flatnonzero(n_shingles[start:stop]>0)
+        if non_blank.shape[0]>0:
+            hashes=np.concatenate([list_of_hashes[k] for k in non_blank])
+            permuted=(hashes[:, None]*coefficients_a+coefficients_b)%_MERSENNE_PRIME
+            offsets=np.concatenate([[0], np.cumsum(n_shingles[non_blank])[:-1]])
+            unique_signatures[non_blank]=np.minimum.reduceat(permuted, offsets, axis=0)
+        start=stop
+    return unique_signatures[codes], (n_shingles==0)[codes]
+
+
+
+def choose_lsh_bands(n_permutations=config._LSH_N_PERMUTATIONS, target_similarity=config._LSH_TARGET_SIMILARITY):
+    """
+        DOCSTRING:  Bands and rows-per-band of the LSH, such that bands*rows <= n_permutations and the similarity at which a pair becomes
+                    a candidate with 50% probability, roughly (1/bands)^(1/rows), is closest to the target-similarity.
+                    The probability that a pair of Jaccard-similarity s collides in at least one band is 1 - (1 - s^rows)^bands.
+        INPUT:      Number-of-permutations, Target-Jaccard-similarity
+        OUTPUT:     Number-of-bands, Rows-per-band.
+    """
+    def threshold(n_rows):
+        return (1/(n_permutations//n_rows))**(1/n_rows)
+    n_rows=min(range(1, n_permutations+1), key=lambda n_rows: abs(threshold(n_rows)-target_similarity))
+    return n_permutations//n_rows, n_rows
+
+
+
+def fold_band_keys(signatures, n_bands, n_rows):
+    """
+        DOCSTRING:  Folds the rows of every band of the signatures into one 64-bit key per record and band.
+        INPUT:      2D-array-of-signatures, Number-of-bands, Rows-per-band
+        OUTPUT:     2D-array of int64 band-keys (n_values x n_bands).
+    """
+    keys=np.zeros((signatures.shape[0], n_bands), dtype=np.uint64)
+    for band in range(n_bands):
+        for row in range(band*n_rows, (band+1)*n_rows):
+            keys[:, band]=keys[:, band]*_BAND_KEY_MULTIPLIER+signatures[:, row]
+    return keys.view(np.int64)
+
+
+
+def compute_band_keys(signatures, is_blank, n_bands, n_rows):
+    """
+        DOCSTRING:  Band-keys of the signatures (see fold_band_keys()); the blank values get a missing key, so that they do not all collide with each other.
+        INPUT:      2D-array-of-signatures, Boolean-array-of-blank-values, Number-of-bands, Rows-per-band
+        OUTPUT:     List of one Series of band-keys (nullable Int64) per band.
+    """
+    keys=fold_band_keys(signatures, n_bands, n_rows)
+    return [pd.Series(keys[:, band], dtype='Int64').mask(is_blank) for band in range(n_bands)]
+
+
+
+def generate_lsh_candidate_pairs(country_df, country_df2=None, method=config._DEDUP_METHOD, lsh_columns=config._LSH_COLUMNS, n_permutations=config._LSH_N_PERMUTATIONS,
+                                 target_similarity=config._LSH_TARGET_SIMILARITY, bands_and_rows=config._LSH_BANDS_AND_ROWS, shingle_size=config._LSH_SHINGLE_SIZE,
+                                 estimate_recall=config._BLOCKING_ESTIMATE_RECALL):
+    """
+        DOCSTRING:  Approximate candidate-generation before scoring, for the fuzzy matches which exact blocking-keys miss (eg. a mistyped POSTAL_CODE or CITY):
+                        a. The values of every LSH-column are shingled into character n-grams, and MinHashed.
+                        b. The signatures are cut into bands; the records whose band-keys agree in any band of any LSH-column become candidate-pairs.
+                    Pairs of similar values collide with high probability, and the cost grows with the candidate-pairs instead of n(n-1)/2 or m*n.
+                    The candidate-pairs and the report have the same format as those of generate_candidate_pairs(), hence both can be unioned.
+        INPUT:      Dataframe, Second-dataframe (Linkage only), Dedup/Linkage-method, List-of-LSH-columns, Number-of-permutations,
+                    Target-Jaccard-similarity, (Bands, Rows-per-band) overriding the target-similarity (optional), Chars-per-shingle, Flag-to-estimate-recall-loss
+        OUTPUT:     (Array-of-positions-in-first-dataset, Array-of-positions-in-second-dataset) in the same convention as generate_dedup_pairs() / generate_linkage_pairs(),
+                    Dict-of-LSH-report.
+    """
+    try:
+        if method==config._DEDUP_METHOD:
+            country_df2=country_df
+        n_rows_1, n_rows_2=country_df.shape[0], country_df2.shape[0]
+        n_bands, n_rows=bands_and_rows if bands_and_rows is not None else choose_lsh_bands(n_permutations, target_similarity)
+
+        candidate_codes=[np.zeros(0, dtype=np.int64)]
+        for colname in lsh_columns:
+            band_keys_1=compute_band_keys(*minhash_signatures(country_df[colname].fillna('').astype(str).str.strip().values, n_bands*n_rows, shingle_size), n_bands, n_rows)
+            if method==config._DEDUP_METHOD:
+                for keys in band_keys_1:
+                    positions_1, positions_2=_dedup_pairs_within_blocks(keys)
+                    candidate_codes.append(positions_1*n_rows_2+positions_2)
+            else:
+                band_keys_2=compute_band_keys(*minhash_signatures(country_df2[colname].fillna('').astype(str).str.strip().values, n_bands*n_rows, shingle_size), n_bands, n_rows)
+                for keys_1, keys_2 in zip(band_keys_1, band_keys_2):
+                    positions_1, positions_2=_linkage_pairs_within_blocks(keys_1, keys_2)
+                    candidate_codes.append(positions_1*n_rows_2+positions_2)
+            # Keep the union compact while going through the bands of the next columns
+            candidate_codes=[np.unique(np.concatenate(candidate_codes))]
+        candidate_codes=candidate_codes[0]
+        positions_1, positions_2=np.divmod(candidate_codes, n_rows_2)
+
+        n_total_pairs=n_rows_1*(n_rows_1-1)//2 if method==config._DEDUP_METHOD else n_rows_1*n_rows_2
+        lsh_report={
+            'METHOD': method,
+            'N_BANDS': n_bands,
+            'N_ROWS_PER_BAND': n_rows,
+            'N_TOTAL_PAIRS': n_total_pairs,
+            'N_CANDIDATE_PAIRS': len(candidate_codes),
+            'N_PRUNED_PAIRS': n_total_pairs-len(candidate_codes),
+            'PRUNED_RATIO': (1-len(candidate_codes)/n_total_pairs) if n_total_pairs>0 else 0.0 }
+        if estimate_recall:
+            lsh_report.update(estimate_blocking_recall_loss(country_df, country_df2, candidate_codes, method))
+        print('\nLSH report: {}'.format(lsh_report))
+        return (positions_1, positions_2), lsh_report
+    except Exception:
+        print('\nSomething went wrong while generating the candidate-pairs using the LSH.')
+        raise
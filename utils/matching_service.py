@@ -0,0 +1,401 @@
+import numpy as np, pandas as pd, os, glob, json, time, socketserver, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from config import *
+from utils.util_functions import _PUNCTUATION_TRANSLATE_TABLE
+from utils.scoring_engine import score_candidate_pairs, _get_score_columns
+from utils.blocking import compute_blocking_keys, record_blocking_key
+from utils.lsh import minhash_signatures, choose_lsh_bands, compute_band_keys, fold_band_keys
+from utils.recursive_pipeline import load_persisted_master, clean_master_score_columns
+
+
+
+def _build_postings(keys):
+    """
+        DOCSTRING:  Inverted index of a Series of keys (NaN/NA where the key is missing): key to the ascending positions of the records holding it.
+        INPUT:      Series-of-keys, aligned by position
+        OUTPUT:     Dict of key to array-of-positions.
+    """
+    keys=keys.reset_index(drop=True).dropna()
+    codes, uniques=pd.factorize(keys)
+    order=np.argsort(codes, kind='stable')
+    boundaries=np.flatnonzero(np.diff(codes[order]))+1
+    return dict(zip(uniques.tolist(), np.split(keys.index.values[order], boundaries)))
+
+
+
+class MasterIndex(object):
+    """
+        DOCSTRING:  Read-only index over the published Master and Raw-Cross-Ref of one country, built once per publication:
+                        a. The cleaned match-score relevant columns of the masters, as scored by the scoring-engine.
+                        b. One inverted index per blocking-pass (see compute_blocking_keys()), and one per band of the MinHash-signatures of each
+                           LSH-column (character n-grams, see minhash_signatures()); their union gives the candidate masters of a query.
+                        c. The cross-references by SR_NUM_1, to look up the master of an already-mastered record.
+                    A country of at most full_scan_max_masters masters is scored in full, without the indexes, hence exactly as the batch Linkage would.
+                    Queries are scored with the same _THRESHOLDS_DICT rules; the best master is the one with the highest NUM_OF_MATCHES_FOUND, reaching
+                    _TOTAL_MATCHES_THRESHOLD, and the earliest master on a tie.
+    """
+    def __init__(self, curr_country, master_df, cross_ref_df, blocking_passes=config._SERVICE_BLOCKING_PASSES, lsh_columns=config._SERVICE_LSH_COLUMNS,
+                 full_scan_max_masters=config._SERVICE_FULL_SCAN_MAX_MASTERS, thresholds_dict=config._THRESHOLDS_DICT):
+        self.curr_country=curr_country
+        self.master_df=master_df
+        self.cross_ref_df=cross_ref_df.set_index('SR_NUM_1')
+        self.sr_nums=master_df.index.values
+        self.thresholds_dict=thresholds_dict
+        cleaned_master_df=clean_master_score_columns(master_df, thresholds_dict)
+        # Plain object-arrays, so that the candidates of a query are gathered without going through pandas
+        self.columns={colname: np.asarray(values, dtype=object) for colname, values in _get_score_columns(cleaned_master_df, thresholds_dict).items()}
+        self.full_scan=(master_df.shape[0]<=full_scan_max_masters)
+        self.blocking_passes=blocking_passes
+        self.lsh_columns=lsh_columns
+        self.n_bands, self.n_rows=choose_lsh_bands() if config._LSH_BANDS_AND_ROWS is None else config._LSH_BANDS_AND_ROWS
+        self.postings=list()
+        if not self.full_scan:
+            self.postings=[_build_postings(keys) for keys in self._index_keys(cleaned_master_df)]
+        self.loaded_at=time.strftime('%Y-%m-%dT%H:%M:%S')
+
+    def _index_keys(self, cleaned_df):
+        # One Series of keys per index: the blocking-passes, then the bands of every LSH-column
+        list_of_keys=[compute_blocking_keys(cleaned_df, blocking_pass) for blocking_pass in self.blocking_passes]
+        for colname in self.lsh_columns:
+            signatures, is_blank=minhash_signatures(cleaned_df[colname].fillna('').astype(str).str.strip().values)
+            list_of_keys+=compute_band_keys(signatures, is_blank, self.n_bands, self.n_rows)
+        return list_of_keys
+
+    def _query_keys(self, cleaned_query_df):
+        # The same keys as _index_keys(), record by record; one list per query with None for the missing keys
+        records=cleaned_query_df.to_dict('records')
+        list_of_keys=[[record_blocking_key(record, blocking_pass) for blocking_pass in self.blocking_passes] for record in records]
+        for colname in self.lsh_columns:
+            signatures, is_blank=minhash_signatures(cleaned_query_df[colname].to_numpy(dtype=str))
+            band_keys=fold_band_keys(signatures, self.n_bands, self.n_rows).tolist()
+            for k in range(len(records)):
+                list_of_keys[k]+=[None]*self.n_bands if is_blank[k] else band_keys[k]
+        return list_of_keys
+
+    def candidate_pairs(self, cleaned_query_df):
+        """
+            DOCSTRING:  (query, master) candidate-pairs of a batch of cleaned queries: every master, or the masters sharing a key with the query in any index.
+            INPUT:      Cleaned-dataframe-of-queries
+            OUTPUT:     Array-of-positions-of-queries, Array-of-positions-of-masters.
+        """
+        n_queries, n_masters=cleaned_query_df.shape[0], self.sr_nums.shape[0]
+        if self.full_scan:
+            return np.repeat(np.arange(n_queries), n_masters), np.tile(np.arange(n_masters), n_queries)
+        empty=np.zeros(0, dtype=np.int64)
+        list_of_positions=list()
+        for query_keys in self._query_keys(cleaned_query_df):
+            hits=[postings.get(key, empty) for postings, key in zip(self.postings, query_keys) if key is not None]
+            list_of_positions.append(np.unique(np.concatenate(hits)) if len(hits)>0 else empty)
+        n_candidates=np.array([positions.shape[0] for positions in list_of_positions], dtype=np.int64)
+        return np.repeat(np.arange(n_queries), n_candidates), np.concatenate(list_of_positions+[empty]).astype(np.int64)
+
+    def match(self, cleaned_query_df, total_matches_threshold=config._TOTAL_MATCHES_THRESHOLD):
+        """
+            DOCSTRING:  Best master and scores of every query of a batch, scored in one vectorized call of the scoring-engine.
+            INPUT:      Cleaned-dataframe-of-queries, Total-matches-threshold
+            OUTPUT:     List of one dict per query: IS_MATCH, MASTER_SR_NUM, the comparison-scores and NUM_OF_MATCHES_FOUND of the best master (None without a match),
+                        N_CANDIDATES scored, and the original-info of the best master.
+        """
+        n_queries=cleaned_query_df.shape[0]
+        positions_1, positions_2=self.candidate_pairs(cleaned_query_df)
+        # Only the candidate masters are handed to the scoring-engine, which sizes its edit-distances by the longest value of each column
+        candidate_positions, local_positions_2=np.unique(positions_2, return_inverse=True)
+        candidate_columns={colname: values[candidate_positions] for colname, values in self.columns.items()}
+        query_columns={colname: cleaned_query_df[colname].to_numpy(dtype=object) for colname in self.thresholds_dict}
+        scores, total_scores=score_candidate_pairs(query_columns, candidate_columns, positions_1, local_positions_2, self.thresholds_dict,
+                                                   total_matches_threshold=total_matches_threshold if config._BOUNDED_SCORING else None)
+        # Highest total-score first, then the earliest master; the first pair of every query is its best one
+        order=np.lexsort((positions_2, -total_scores, positions_1))
+        first_pairs=order[np.flatnonzero(np.diff(positions_1[order], prepend=-1))]
+        best_pairs=np.full(n_queries, -1, dtype=np.int64)
+        best_pairs[positions_1[first_pairs]]=first_pairs
+        n_candidates=np.bincount(positions_1, minlength=n_queries)
+
+        list_of_matches=list()
+        for k in range(n_queries):
+            best_pair=best_pairs[k]
+            is_match=bool(best_pair>=0 and total_scores[best_pair]>=total_matches_threshold)
+            query_match={'IS_MATCH': is_match, 'MASTER_SR_NUM': int(self.sr_nums[positions_2[best_pair]]) if is_match else None}
+            for colname, col_scores in scores.items():
+                query_match[colname]=int(col_scores[best_pair]) if is_match else None
+            query_match['NUM_OF_MATCHES_FOUND']=int(total_scores[best_pair]) if is_match else None
+            query_match['N_CANDIDATES']=int(n_candidates[k])
+            query_match['MASTER']=self.master_record(positions_2[best_pair]) if is_match else None
+            list_of_matches.append(query_match)
+        return list_of_matches
+
+    def master_record(self, position):
+        # Original-info of a master, as JSON-serializable strings
+        return {colname: ('' if pd.isna(value) else str(value)) for colname, value in self.master_df.iloc[position].items()}
+
+    def lookup(self, sr_num):
+        """
+            DOCSTRING:  Master of an already-mastered record, from the Raw-Cross-Ref.
+            INPUT:      SR_NUM of the record
+            OUTPUT:     Dict of its cross-reference and the original-info of its master, or None if the record is unknown.
+        """
+        if sr_num not in self.cross_ref_df.index:
+            return None
+        cross_ref=self.cross_ref_df.loc[sr_num]
+        master_sr_num=int(cross_ref['SR_NUM_2'])
+        record_lookup={'SR_NUM': int(sr_num), 'MASTER_SR_NUM': master_sr_num}
+        record_lookup.update({colname: int(cross_ref[colname]) for colname in config._COLS_FOR_TOTAL_MATCH_CALC+['NUM_OF_MATCHES_FOUND'] if colname in cross_ref.index})
+        master_position=self.master_df.index.get_indexer([master_sr_num])[0]
+        record_lookup['MASTER']=self.master_record(master_position) if master_position>=0 else None
+        return record_lookup
+
+
+
+def prepare_query_records(records, fields_to_concat=config._FIELDS_TO_CONCAT, columns_to_clean=config._COLUMNS_TO_CLEAN, default_country=config._RAW_COUNTRY):
+    """
+        DOCSTRING:  Turns a batch of query records (dicts in the standardized columns of _STD_COLS_ORDER, plus COUNTRY) into the cleaned form the masters are scored in.
+                    Applies the steps of preprocess_dataframe() and clean_dataframe() value by value, which is much cheaper than the dataframe-wide versions
+                    for a handful of records: strip (and '_' for the spaces of COUNTRY), delete the special-chars and lowercase, then concatenate the address-fields.
+                    Missing fields are blank; a missing COUNTRY is default_country.
+        INPUT:      List-of-dicts, address-fields-to-concat, columns-to-clean, Default-country-name
+        OUTPUT:     Cleaned-dataframe-of-queries (one row per record, in order).
+    """
+    list_of_rows=list()
+    for record in records:
+        row=dict()
+        for colname in config._STD_COLS_ORDER+['COUNTRY']:
+            value=record.get(colname, default_country if colname=='COUNTRY' else None)
+            value='' if value is None or pd.isna(value) else str(value)
+            value=value.replace(' ','_').strip() if colname=='COUNTRY' else value.strip()
+            row[colname]=value.translate(_PUNCTUATION_TRANSLATE_TABLE).lower() if colname in columns_to_clean else value
+        for colname, cols_to_concat in fields_to_concat.items():
+            row[colname]=''.join(row.pop(field) for field in cols_to_concat)
+        list_of_rows.append(row)
+    return pd.DataFrame(list_of_rows, dtype=object)
+
+
+
+def find_published_countries(master_dir=config._MASTER_DATA_DIRECTORY):
+    """
+        DOCSTRING:  Countries with both a <country>_Master.csv and a <country>_Raw_Cross_Ref.csv in the Master-Data directory.
+    """
+    master_csvs=glob.glob(os.path.join(master_dir, '*_Master.csv'))
+    countries=[os.path.basename(master_csv)[:-len('_Master.csv')] for master_csv in master_csvs]
+    return sorted(curr_country for curr_country in countries if os.path.exists(os.path.join(master_dir, curr_country+'_Raw_Cross_Ref.csv')))
+
+
+
+class MatchingService(object):
+    """
+        DOCSTRING:  Resident matcher over the published masters of several countries, for lookups of single records or small batches without re-running the pipeline.
+                    The MasterIndex of each country is built once; a watcher-thread checks the Master and Raw-Cross-Ref every reload_interval seconds, and a
+                    re-published country is re-indexed in the background once both files stopped changing, then swapped in. The queries in flight keep the
+                    index they started with, and a publication which fails to load keeps the previous index serving.
+    """
+    def __init__(self, countries=config._SERVICE_COUNTRIES, master_dir=config._MASTER_DATA_DIRECTORY, reload_interval=config._SERVICE_RELOAD_INTERVAL):
+        self.countries=countries
+        self.master_dir=master_dir
+        self.reload_interval=reload_interval
+        self.indexes=dict()
+        self.file_stamps=dict()
+        self.lock=threading.Lock()
+        self.reload_lock=threading.Lock()
+        self.stop_event=threading.Event()
+        self.watcher=None
+        self.reload()
+
+    def _file_stamps(self, curr_country):
+        stamps=list()
+        for file_suffix in ('_Master.csv', '_Raw_Cross_Ref.csv'):
+            abs_path=os.path.join(self.master_dir, curr_country+file_suffix)
+            stamps.append((os.stat(abs_path).st_mtime_ns, os.stat(abs_path).st_size) if os.path.exists(abs_path) else None)
+        return tuple(stamps)
+
+    def reload(self, settled_stamps=None):
+        """
+            DOCSTRING:  (Re-)indexes the countries whose files changed since they were indexed. With settled_stamps (the stamps of the previous check),
+                        a country is only re-indexed once its stamps equal them, ie. its files are not being written anymore.
+            INPUT:      Dict of country-name to file-stamps of the previous check (optional)
+            OUTPUT:     Dict of country-name to file-stamps of this check.
+        """
+        with self.reload_lock:
+            return self._reload(settled_stamps)
+
+    def _reload(self, settled_stamps):
+        countries=self.countries if self.countries is not None else find_published_countries(self.master_dir)
+        current_stamps={curr_country: self._file_stamps(curr_country) for curr_country in countries}
+        for curr_country, stamps in current_stamps.items():
+            if None in stamps or stamps==self.file_stamps.get(curr_country):
+                continue
+            if settled_stamps is not None and stamps!=settled_stamps.get(curr_country):
+                continue
+            try:
+                start_time=time.time()
+                master_df, cross_ref_df=load_persisted_master(curr_country, master_dir=self.master_dir)
+                master_index=MasterIndex(curr_country, master_df, cross_ref_df)
+            except Exception as e:
+                print('\nSomething went wrong while indexing the published master of {}; the previous index keeps serving.'.format(curr_country))
+                print(e)
+                continue
+            with self.lock:
+                self.indexes={**self.indexes, curr_country: master_index}
+                self.file_stamps[curr_country]=stamps
+            print('\nIndexed {} masters and {} cross-refs of {} in {:.2f} seconds ({}).'.format(master_df.shape[0], cross_ref_df.shape[0], curr_country, time.time()-start_time,
+                                                                                              'full scan' if master_index.full_scan else 'blocking and n-gram indexes'))
+        return current_stamps
+
+    def _watch(self):
+        settled_stamps=None
+        while not self.stop_event.wait(self.reload_interval):
+            settled_stamps=self.reload(settled_stamps)
+
+    def start_watcher(self):
+        if self.reload_interval and self.watcher is None:
+            self.watcher=threading.Thread(target=self._watch, name='MasterWatcher', daemon=True)
+            self.watcher.start()
+
+    def stop_watcher(self):
+        self.stop_event.set()
+
+    def status(self):
+        indexes=self.indexes
+        return {curr_country: {'MASTERS': master_index.sr_nums.shape[0], 'CROSS_REFS': master_index.cross_ref_df.shape[0], 'FULL_SCAN': master_index.full_scan,
+                               'LOADED_AT': master_index.loaded_at} for curr_country, master_index in indexes.items()}
+
+    def match(self, records):
+        """
+            DOCSTRING:  Best master and scores for every record of a batch; the records are grouped by COUNTRY and each group is scored in one call.
+            INPUT:      List-of-dicts of query records
+            OUTPUT:     List of one dict per record, in order (see MasterIndex.match()); an ERROR for a country without a published master.
+        """
+        if len(records)==0:
+            return list()
+        indexes=self.indexes
+        cleaned_query_df=prepare_query_records(records)
+        list_of_matches=[None]*len(records)
+        for curr_country, country_queries in cleaned_query_df.groupby('COUNTRY', sort=False):
+            positions=country_queries.index.values
+            if curr_country not in indexes:
+                country_matches=[{'ERROR': 'No published master for {}'.format(curr_country)}]*len(positions)
+            else:
+                country_matches=indexes[curr_country].match(country_queries)
+            for position, query_match in zip(positions, country_matches):
+                list_of_matches[position]={'QUERY_ID': records[position].get('SR_NUM', int(position)), 'COUNTRY': curr_country, **query_match}
+        return list_of_matches
+
+    def lookup(self, curr_country, sr_num):
+        indexes=self.indexes
+        if curr_country not in indexes:
+            return None
+        return indexes[curr_country].lookup(sr_num)
+
+
+
+class MatchingRequestHandler(BaseHTTPRequestHandler):
+    """
+        DOCSTRING:  JSON endpoints of the MatchingService (self.server.matching_service):
+                        GET  /health                            countries indexed, with their number of masters and time of indexing.
+                        POST /match                             a record, or {"records": [...]}; the best master and scores of each.
+                        GET  /lookup?country=USA&sr_num=123      master of an already-mastered record.
+                        POST /reload                            re-indexes the re-published countries right away.
+    """
+    def _send_json(self, status_code, body):
+        payload=json.dumps(body).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def address_string(self):
+        # Requests over a Unix socket have no client-address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix-socket'
+
+    def do_GET(self):
+        matching_service=self.server.matching_service
+        url=urlparse(self.path)
+        if url.path=='/health':
+            return self._send_json(200, {'COUNTRIES': matching_service.status()})
+        if url.path=='/lookup':
+            params=parse_qs(url.query)
+            try:
+                curr_country, sr_num=params['country'][0], int(params['sr_num'][0])
+            except (KeyError, ValueError):
+                return self._send_json(400, {'ERROR': 'Expected /lookup?country=<country>&sr_num=<integer>'})
+            record_lookup=matching_service.lookup(curr_country, sr_num)
+            if record_lookup is None:
+                return self._send_json(404, {'ERROR': 'SR_NUM {} is not mastered for {}'.format(sr_num, curr_country)})
+            return self._send_json(200, record_lookup)
+        self._send_json(404, {'ERROR': 'Unknown endpoint {}'.format(url.path)})
+
+    def do_POST(self):
+        matching_service=self.server.matching_service
+        url=urlparse(self.path)
+        if url.path=='/reload':
+            matching_service.reload()
+            return self._send_json(200, {'COUNTRIES': matching_service.status()})
+        if url.path!='/match':
+            return self._send_json(404, {'ERROR': 'Unknown endpoint {}'.format(url.path)})
+        try:
+            body=json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            records=body['records'] if isinstance(body, dict) and 'records' in body else [body]
+            if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+                raise ValueError('Expected a record, or {"records": [...]}')
+        except (ValueError, KeyError) as e:
+            return self._send_json(400, {'ERROR': str(e)})
+        if len(records)>config._SERVICE_MAX_BATCH_SIZE:
+            return self._send_json(413, {'ERROR': 'At most {} records per request'.format(config._SERVICE_MAX_BATCH_SIZE)})
+        try:
+            start_time=time.time()
+            list_of_matches=matching_service.match(records)
+        except Exception as e:
+            print('\nSomething went wrong while matching a batch of {} records.'.format(len(records)))
+            print(e)
+            return self._send_json(500, {'ERROR': str(e)})
+        self._send_json(200, {'MATCHES': list_of_matches, 'ELAPSED_MS': round(1000*(time.time()-start_time), 3)})
+
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+        DOCSTRING:  ThreadingHTTPServer over a Unix socket, for callers on the same machine.
+    """
+    daemon_threads=True
+
+
+
+def create_matching_server(matching_service, host=config._SERVICE_HOST, port=config._SERVICE_PORT, unix_socket=config._SERVICE_UNIX_SOCKET):
+    """
+        DOCSTRING:  HTTP server of the MatchingService, on a Unix socket if one is given, else on host:port. Each request is handled in its own thread.
+        INPUT:      MatchingService, Host, Port, Path-of-Unix-socket (optional)
+        OUTPUT:     Server object; serve_forever() starts serving.
+    """
+    if unix_socket is not None:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server=ThreadingUnixHTTPServer(unix_socket, MatchingRequestHandler)
+    else:
+        server=ThreadingHTTPServer((host, port), MatchingRequestHandler)
+    server.matching_service=matching_service
+    return server
+
+
+
+def serve_matching_service(countries=config._SERVICE_COUNTRIES, master_dir=config._MASTER_DATA_DIRECTORY, host=config._SERVICE_HOST, port=config._SERVICE_PORT,
+                           unix_socket=config._SERVICE_UNIX_SOCKET, reload_interval=config._SERVICE_RELOAD_INTERVAL):
+    """
+        DOCSTRING:  Service mode: indexes the published masters once, and answers the matching queries until interrupted, re-indexing a country whenever it is re-published.
+        INPUT:      List-of-country-names (None for every published country), Master-Data directory, Host, Port, Path-of-Unix-socket (optional), Seconds-between-reload-checks
+        OUTPUT:     None
+    """
+    matching_service=MatchingService(countries=countries, master_dir=master_dir, reload_interval=reload_interval)
+    if len(matching_service.indexes)==0:
+        print('\nNo published masters found in {} yet; they are indexed once published.'.format(master_dir))
+    matching_service.start_watcher()
+    server=create_matching_server(matching_service, host=host, port=port, unix_socket=unix_socket)
+    print('\nMatching service listening on {}'.format(unix_socket if unix_socket is not None else 'http://{}:{}'.format(host, port)))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        matching_service.stop_watcher()
+        server.server_close()
+        if unix_socket is not None and os.path.exists(unix_socket):
+            os.remove(unix_socket)
@@ -0,0 +1,171 @@
+import numpy as np, pandas as pd, os, re, heapq, shutil, tempfile
+from config import *
+
+
+_INTEGER_PATTERN = re.compile(r'^[+-]?\d+$')
+
+
+
+def _read_raw_chunks(raw_file_name, chunk_size, usecols=None):
+    """
+        DOCSTRING:  Reads the raw csv in chunks of strings. Like the Spark csv-reader, only empty fields are missing values (not 'NA', 'null', ...).
+        INPUT:      Abs-path-of-raw-csv, Rows-per-chunk, Columns-to-read
+        OUTPUT:     Iterator of dataframes of strings.
+    """
+    return pd.read_csv(raw_file_name, usecols=usecols, dtype=str, keep_default_na=False, na_values=[''], chunksize=chunk_size)
+
+
+
+def infer_column_types(raw_file_name, raw_columns, chunk_size=config._PREFORMAT_CHUNK_SIZE):
+    """
+        DOCSTRING:  Equivalent of inferSchema=True of the Spark csv-reader, in one streaming pass over the raw csv:
+                    a column is 'int' if all its non-missing values are integers, 'float' if they are all numbers, else 'str'.
+        INPUT:      Abs-path-of-raw-csv, Raw-column-names, Rows-per-chunk
+        OUTPUT:     Dict of raw-column-name to 'int', 'float' or 'str'.
+    """
+    column_types={colname: 'int' for colname in raw_columns}
+    for chunk in _read_raw_chunks(raw_file_name, chunk_size, usecols=raw_columns):
+        for colname in raw_columns:
+            if column_types[colname]=='str':
+                continue
+            values=pd.Series(chunk[colname].dropna().unique(), dtype=object)
+            try:
+                # Fails at the first non-numeric value, hence text columns are rejected early
+                pd.to_numeric(values)
+            except (ValueError, TypeError):
+                column_types[colname]='str'
+                continue
+            if column_types[colname]=='int' and not values.str.match(_INTEGER_PATTERN).all():
+                column_types[colname]='float'
+    return column_types
+
+
+
+def _apply_column_types(df, column_types):
+    """
+        DOCSTRING:  Converts the columns of strings to their inferred types; integer columns keep their missing values with the nullable Int64 dtype.
+        INPUT:      Dataframe-of-strings, Dict-of-column-types
+        OUTPUT:     Typed dataframe.
+    """
+    for colname, column_type in column_types.items():
+        if column_type=='int':
+            df[colname]=pd.to_numeric(df[colname]).astype('Int64')
+        elif column_type=='float':
+            df[colname]=pd.to_numeric(df[colname]).astype(np.float64)
+    return df
+
+
+
+def _sort_key_function(key_positions):
+    """
+        DOCSTRING:  Key of a row-tuple for the k-way merge, in the order of Spark's ORDER BY ... ASC: missing values first, then ascending values.
+        INPUT:      Positions-of-sort-keys-in-row
+        OUTPUT:     Function of row-tuple to sort-key.
+    """
+    def sort_key(row):
+        return tuple((False, 0) if pd.isna(row[position]) else (True, row[position]) for position in key_positions)
+    return sort_key
+
+
+
+def _spill_sorted_run(sorted_chunk, run_dir, i):
+    """
+        DOCSTRING:  Writes a sorted chunk as a sorted-run into the spill-directory.
+        INPUT:      Sorted-dataframe, Spill-directory, Run-number
+        OUTPUT:     Abs-path-of-spill-file.
+    """
+    run_file_name=os.path.join(run_dir, 'run_{}.csv'.format(i))
+    sorted_chunk.to_csv(run_file_name, index=False)
+    return run_file_name
+
+
+
+def _iterate_sorted_run(run_file_name, column_types, block_size):
+    """
+        DOCSTRING:  Streams the row-tuples of a sorted-run back from its spill-file, one block of rows at a time.
+        INPUT:      Abs-path-of-spill-file, Dict-of-column-types, Rows-per-block
+        OUTPUT:     Iterator of row-tuples.
+    """
+    for block in _read_raw_chunks(run_file_name, block_size):
+        yield from _apply_column_types(block, column_types).itertuples(index=False, name=None)
+
+
+
+def _write_standardized_chunk(sorted_df, target_file_name, first_row_number, header):
+    """
+        DOCSTRING:  Numbers a chunk of sorted rows with SR_NUM = 100001+ROW_NUMBER(), adds the COUNTRY, and writes (header=True) or appends it to the standardized csv.
+        INPUT:      Sorted-dataframe-of-standardized-columns, Abs-path-of-standardized-csv, ROW_NUMBER-of-first-row, Flag-for-new-file-with-header
+        OUTPUT:     Dataframe csv at target-directory.
+    """
+    output_df=sorted_df.copy()
+    output_df.insert(0, 'COUNTRY', config._RAW_COUNTRY)
+    output_df.insert(0, 'SR_NUM', np.arange(100001+first_row_number, 100001+first_row_number+sorted_df.shape[0]))
+    output_df.to_csv(target_file_name, index=False, header=header, mode='w' if header else 'a')
+
+
+
+def preformat_input_natively(raw_file_name=config._RAW_STATIC_FILE_NAME, target_file_name=config._STATIC_FILE_NAME, chunk_size=config._PREFORMAT_CHUNK_SIZE,
+                             sort_keys=config._PREFORMAT_SORT_KEYS, temp_dir=config._STAGING_AREA_DIRECTORY):
+    """
+        DOCSTRING:  Same standardized file as preformat_input_using_sparksql(), without starting a Spark JVM and without holding the whole input in memory:
+                        a. Infers the column-types of the raw csv in one streaming pass.
+                        b. Renames the columns as per _RAW_TO_STD_COLS, sorts each chunk by the sort-keys, and spills it as a sorted-run.
+                        c. K-way merges the sorted-runs (an external merge-sort), numbers the merged rows with SR_NUM = 100001+ROW_NUMBER(),
+                           and streams them into the target csv chunk by chunk.
+                    An input of a single chunk is sorted in memory, without any spill-files.
+                    The rows are written to a temporary file next to the target, which replaces the target only once complete.
+        INPUT:      Abs-path-of-raw-csv, Abs-path-of-standardized-csv, Rows-per-chunk, Sort-keys, Directory-for-spill-files
+        OUTPUT:     Dataframe csv at target-directory. Re-raises any error, leaving the previous target (if any) untouched.
+    """
+    run_dir, partial_file_name=None, None
+    try:
+        raw_columns=list(config._RAW_TO_STD_COLS.keys())
+        column_types={config._RAW_TO_STD_COLS[colname]: column_type for colname, column_type in infer_column_types(raw_file_name, raw_columns, chunk_size).items()}
+        print('\nInferred column-types: {}'.format(column_types))
+
+        run_file_names=list()
+        first_sorted_chunk=None
+        for i, chunk in enumerate(_read_raw_chunks(raw_file_name, chunk_size, usecols=raw_columns)):
+            chunk=_apply_column_types(chunk.rename(columns=config._RAW_TO_STD_COLS)[config._STD_COLS_ORDER], column_types)
+            sorted_chunk=chunk.sort_values(by=sort_keys, na_position='first', kind='mergesort')
+            if i==0:
+                # Kept in memory until a second chunk shows that the input needs an external merge-sort
+                first_sorted_chunk=sorted_chunk
+                continue
+            if i==1:
+                os.makedirs(temp_dir, exist_ok=True)
+                run_dir=tempfile.mkdtemp(prefix='preformat_runs_', dir=temp_dir)
+                run_file_names.append(_spill_sorted_run(first_sorted_chunk, run_dir, 0))
+                first_sorted_chunk=None
+            run_file_names.append(_spill_sorted_run(sorted_chunk, run_dir, i))
+
+        file_descriptor, partial_file_name=tempfile.mkstemp(prefix='.preformat_', suffix='.csv', dir=os.path.dirname(os.path.abspath(target_file_name)))
+        os.close(file_descriptor)
+        if len(run_file_names)==0:
+            # A single chunk: no merge needed
+            n_rows=0 if first_sorted_chunk is None else first_sorted_chunk.shape[0]
+            _write_standardized_chunk(pd.DataFrame(columns=config._STD_COLS_ORDER) if first_sorted_chunk is None else first_sorted_chunk, partial_file_name, first_row_number=1, header=True)
+        else:
+            print('Merging {} sorted-runs of up to {} rows...'.format(len(run_file_names), chunk_size))
+            block_size=max(1, chunk_size//len(run_file_names))
+            sorted_runs=[_iterate_sorted_run(run_file_name, column_types, block_size) for run_file_name in run_file_names]
+            sorted_rows=heapq.merge(*sorted_runs, key=_sort_key_function([config._STD_COLS_ORDER.index(colname) for colname in sort_keys]))
+            n_rows=0
+            while True:
+                rows=[row for _, row in zip(range(chunk_size), sorted_rows)]
+                if len(rows)==0:
+                    break
+                output_df=_apply_column_types(pd.DataFrame(rows, columns=config._STD_COLS_ORDER), column_types)
+                _write_standardized_chunk(output_df, partial_file_name, first_row_number=n_rows+1, header=(n_rows==0))
+                n_rows+=len(rows)
+        os.replace(partial_file_name, target_file_name)
+        partial_file_name=None
+        print('\nSuccessfully created \\{} with {} records!'.format(target_file_name, n_rows))
+    except Exception:
+        print('\nSomething went wrong while pre-formatting the input data. Please check if the file is currently in use.')
+        raise
+    finally:
+        if run_dir is not None:
+            shutil.rmtree(run_dir, ignore_errors=True)
+        if partial_file_name is not None and os.path.exists(partial_file_name):
+            os.remove(partial_file_name)
@@ -0,0 +1,763 @@
+import numpy as np, pandas as pd, os, sys, threading, multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, redirect_stdout
+from config import *
+from utils.util_functions import *
+from utils.scoring_engine import *
+from utils.scoring_engine import _SCORE_FEATURES_COLUMNS
+from utils.blocking import *
+from utils.lsh import *
+from utils.exact_duplicates import *
+from utils.staging import *
+from utils.checkpoint import *
+from utils.dtype_schema import *
+from utils.cross_ref_store import *
+from utils.batch_sizing import *
+from utils.instrumentation import *
+from utils.background_io import *
+
+
+
+class ThreadLogRouter(object):
+    """
+        DOCSTRING:  Replacement for sys.stdout which routes the prints of each thread to its own log-file, so that the logs of countries
+                    processed concurrently do not get interleaved. Threads without a log-file print to the original stream.
+                    A writer-thread takes over the log-file of the thread which submitted its write (see BackgroundWriter.submit()).
+    """
+    def __init__(self, default_stream):
+        self.default_stream=default_stream
+        self.local=threading.local()
+
+    def current_stream(self):
+        return getattr(self.local, 'stream', None)
+
+    def _stream(self):
+        stream=self.current_stream()
+        # A log-file closed meanwhile (eg. a late background-write of a finished country) falls back to the original stream
+        return self.default_stream if stream is None or stream.closed else stream
+
+    def write(self, text):
+        return self._stream().write(text)
+
+    def flush(self):
+        self._stream().flush()
+
+    @contextmanager
+    def route_to_stream(self, log_stream):
+        previous_stream=self.current_stream()
+        self.local.stream=log_stream
+        try:
+            yield log_stream
+        finally:
+            self.local.stream=previous_stream
+
+    @contextmanager
+    def route_to(self, log_file):
+        with open(log_file, 'a') as log_stream, self.route_to_stream(log_stream):
+            yield log_stream
+
+
+
+class MemoryBudget(object):
+    """
+        DOCSTRING:  Global memory-budget (in MB) shared by the countries processed concurrently.
+                    A reservation larger than the whole budget is granted only when nothing else is reserved, so that the largest country can never starve.
+    """
+    def __init__(self, budget_mb):
+        self.budget_mb=budget_mb
+        self.reserved_mb=0
+        self.condition=threading.Condition()
+
+    def acquire(self, amount_mb):
+        amount_mb=min(amount_mb, self.budget_mb)
+        with self.condition:
+            while self.reserved_mb+amount_mb>self.budget_mb:
+                self.condition.wait()
+            self.reserved_mb+=amount_mb
+        return amount_mb
+
+    def release(self, amount_mb):
+        with self.condition:
+            self.reserved_mb-=amount_mb
+            self.condition.notify_all()
+
+
+
+def _run_task_with_log(log_file, task_function, *task_args):
+    """
+        DOCSTRING:  Runs a task in a worker-process with its prints appended to the log-file of its country.
+        INPUT:      Abs-path-of-log-file, Function-to-run, Positional-args
+        OUTPUT:     Result of the task.
+    """
+    with open(log_file, 'a') as log_stream, redirect_stdout(log_stream):
+        return task_function(*task_args)
+
+
+
+def _run_task_and_flush(task_function, *task_args):
+    """
+        DOCSTRING:  Runs a task in a worker-process, and waits for its background-writes (eg. its staged master), since the task reading them may run in another process.
+        INPUT:      Function-to-run, Positional-args
+        OUTPUT:     Result of the task.
+    """
+    result=task_function(*task_args)
+    flush_background_writes()
+    return result
+
+
+
+def run_tasks(task_function, list_of_task_args, n_workers=config._N_WORKERS, executor=None, log_file=None, on_result=None):
+    """
+        DOCSTRING:  Runs independent tasks on a process-pool of n_workers, and collects their results in the same order as the tasks were submitted.
+                    If a shared executor is passed, the tasks are submitted to it instead (one at a time for a single worker), so that all countries share one pool.
+                    Falls back to a sequential loop for a single worker or a single task, to avoid the process start-up cost.
+                    If on_result is passed, it is called in the calling process with (position, result) as soon as each result is collected.
+                    A task run by a worker-process flushes its background-writes before returning its result.
+        INPUT:      Function-to-run, List-of-tuples-of-positional-args, Number-of-worker-processes, Shared-process-pool (optional), Abs-path-of-log-file (optional),
+                    Callback-for-each-result (optional)
+        OUTPUT:     List of results of each task, in the order of list_of_task_args.
+    """
+    if executor is not None or (n_workers>1 and len(list_of_task_args)>1):
+        list_of_task_args=[(task_function,)+tuple(task_args) for task_args in list_of_task_args]
+        task_function=_run_task_and_flush
+    if log_file is not None:
+        list_of_task_args=[(log_file, task_function)+tuple(task_args) for task_args in list_of_task_args]
+        task_function=_run_task_with_log
+    results=list()
+    def collect(result):
+        if on_result is not None:
+            on_result(len(results), result)
+        results.append(result)
+
+    if executor is not None:
+        if n_workers<=1:
+            for task_args in list_of_task_args:
+                collect(executor.submit(task_function, *task_args).result())
+            return results
+        futures=[executor.submit(task_function, *task_args) for task_args in list_of_task_args]
+        for future in futures:
+            collect(future.result())
+        return results
+    if n_workers<=1 or len(list_of_task_args)<=1:
+        for task_args in list_of_task_args:
+            collect(task_function(*task_args))
+        return results
+    with ProcessPoolExecutor(max_workers=min(n_workers, len(list_of_task_args))) as executor:
+        futures=[executor.submit(task_function, *task_args) for task_args in list_of_task_args]
+        for future in futures:
+            collect(future.result())
+        return results
+
+
+
+def run_checkpointed_nodes(task_function, node_names, list_of_task_args, curr_country, staging_backend, run_manifest=None, n_workers=config._N_WORKERS, executor=None, log_file=None):
+    """
+        DOCSTRING:  Runs the nodes of one depth of the recursive-tree with run_tasks(), skipping the nodes which the run-manifest lists as complete:
+                    their checkpointed master is staged again, and their checkpointed cross-refs are reused.
+                    Every newly completed node is checkpointed as soon as its result is collected, hence a crash loses at most the nodes still running.
+        INPUT:      Function-to-run, List-of-node-names, List-of-tuples-of-positional-args, country-name, Staging-backend, Run-manifest (None to disable checkpoints),
+                    Number-of-worker-processes, Shared-process-pool (optional), Abs-path-of-log-file (optional)
+        OUTPUT:     List of (Handle-of-staged-master, Dataframe-of-cross-references) of each node, in the order of node_names.
+    """
+    results = [None]*len(node_names)
+    pending_positions = list()
+    for k, node_name in enumerate(node_names):
+        if run_manifest is not None and run_manifest.is_complete(node_name):
+            master_df, cross_ref_df = run_manifest.load_node(node_name)
+            results[k] = (staging_backend.stage(df = master_df, curr_country = curr_country, file_suffix = '_{}_Master'.format(node_name)), cross_ref_df)
+        else:
+            pending_positions.append(k)
+    if len(pending_positions) < len(node_names):
+        print('Skipping {} nodes completed by an earlier run.'.format(len(node_names)-len(pending_positions)))
+
+    def record_node(position, result):
+        staged_master, cross_ref_df = result
+        run_manifest.record_node(node_names[pending_positions[position]], staging_backend.load(staged_master), cross_ref_df)
+
+    pending_results = run_tasks(task_function, [list_of_task_args[k] for k in pending_positions], n_workers = n_workers, executor = executor, log_file = log_file,
+                                on_result = record_node if run_manifest is not None else None)
+    for k, result in zip(pending_positions, pending_results):
+        results[k] = result
+    return results
+
+
+
+def score_and_normalize_duplicates(country_df, curr_country, file_prefix, method=config._DEDUP_METHOD, country_df2=None, master_csv_1=None, master_csv_2=None,
+                                   collapsed_child_scores=None):
+    """
+        DOCSTRING:  Generates the raw score-features of a minibatch (Dedup) or of two master-datasets (Linkage) using the configured scoring-engine,
+                    and cleans them into the normalized-duplicates.
+        INPUT:      Dataframe, country-name, Prefix-of-intermediate-files, Dedup/Linkage-method, Second-dataframe, Abs-paths-of-master-csvs (R Linkage only),
+                    Series-of-best-collapsed-child-score-by-representative-SR_NUM (optional, see collapse_exact_duplicates())
+        OUTPUT:     Dataframe of cleaned-normalized-score-features. Raises a RuntimeError if the scoring failed, so that the node is never checkpointed.
+    """
+    score_features, top_match_reducer = None, None
+    n_rows_1 = country_df.shape[0]
+    n_total_pairs = n_rows_1*(n_rows_1-1)//2 if method  ==  config._DEDUP_METHOD else n_rows_1*country_df2.shape[0]
+    if config._SCORING_ENGINE  ==  config._PYTHON_ENGINE:
+        # Score the candidate-pairs in-process and keep the score_features in memory
+        if config._ADAPTIVE_BATCH_SIZING:
+            node_plan = plan_node_batches(country_df = country_df, country_df2 = country_df2, method = method, node_memory_budget_mb = config._NODE_MEMORY_BUDGET_MB)
+        else:
+            node_plan = {'PAIR_BATCH_SIZE': config._PAIR_BATCH_SIZE, 'CHUNK_ROWS': max(n_rows_1, 1), 'N_CHUNKS': 1}
+        if node_plan['N_CHUNKS'] > 1:
+            # Chunks of the first dataset keep the row-major order of the pairs, hence the score_features are the same as in one go
+            print('\nLinking {} in {} chunks of {} records, to fit in {} MB.'.format(file_prefix, node_plan['N_CHUNKS'], node_plan['CHUNK_ROWS'], config._NODE_MEMORY_BUDGET_MB))
+        list_of_score_features = list()
+        # The streaming top-match keeps one row per record of the node across all the chunks, instead of all their potential matches
+        top_match_reducer = TopMatchReducer(child_column = 'SR_NUM_1', score_key_column = 'NUM_OF_MATCHES_FOUND', columns = _SCORE_FEATURES_COLUMNS) if config._STREAMING_TOP_MATCH else None
+        for start in range(0, max(n_rows_1, 1), node_plan['CHUNK_ROWS']):
+            chunk_df = country_df if node_plan['N_CHUNKS']  ==  1 else country_df.iloc[start : start+node_plan['CHUNK_ROWS']]
+            n_chunk_pairs = n_total_pairs if node_plan['N_CHUNKS']  ==  1 else chunk_df.shape[0]*country_df2.shape[0]
+            candidate_pairs = None
+            list_of_candidate_pairs = list()
+            if config._USE_BLOCKING:
+                with stage('blocking', input_rows = chunk_df.shape[0] if country_df2 is None else chunk_df.shape[0]+country_df2.shape[0]) as stage_event:
+                    blocking_pairs, blocking_report  =  generate_candidate_pairs(country_df = chunk_df, country_df2 = country_df2, method = method, estimate_recall = config._BLOCKING_ESTIMATE_RECALL)
+                    stage_event['CANDIDATE_PAIRS'] = blocking_report['N_CANDIDATE_PAIRS']
+                list_of_candidate_pairs.append(blocking_pairs)
+            if config._USE_LSH:
+                with stage('lsh', input_rows = chunk_df.shape[0] if country_df2 is None else chunk_df.shape[0]+country_df2.shape[0]) as stage_event:
+                    lsh_pairs, lsh_report  =  generate_lsh_candidate_pairs(country_df = chunk_df, country_df2 = country_df2, method = method, estimate_recall = config._BLOCKING_ESTIMATE_RECALL)
+                    stage_event['CANDIDATE_PAIRS'] = lsh_report['N_CANDIDATE_PAIRS']
+                list_of_candidate_pairs.append(lsh_pairs)
+            if len(list_of_candidate_pairs) > 0:
+                # A pair is scored if any of the candidate-sources proposes it
+                candidate_pairs = list_of_candidate_pairs[0] if len(list_of_candidate_pairs)  ==  1 else union_candidate_pairs(list_of_candidate_pairs, chunk_df.shape[0] if country_df2 is None else country_df2.shape[0])
+            with stage('scoring', engine = config._SCORING_ENGINE, method = method, candidate_pairs = n_chunk_pairs if candidate_pairs is None else len(candidate_pairs[0]),
+                       pair_batch_size = node_plan['PAIR_BATCH_SIZE']) as stage_event:
+                n_reduced_pairs = None if top_match_reducer is None else top_match_reducer.n_pairs
+                chunk_score_features  =  compute_score_features(country_df = chunk_df, country_df2 = country_df2, method = method, candidate_pairs = candidate_pairs, pair_batch_size = node_plan['PAIR_BATCH_SIZE'],
+                                                                top_match_reducer = top_match_reducer)
+                if chunk_score_features is None:
+                    raise RuntimeError('Could not compute the score-features of {}.'.format(file_prefix))
+                stage_event['OUTPUT_ROWS'] = chunk_score_features.shape[0] if top_match_reducer is None else top_match_reducer.n_pairs-n_reduced_pairs
+            if top_match_reducer is None:
+                list_of_score_features.append(chunk_score_features)
+        if top_match_reducer is None:
+            # The empty score_features of chunks without any potential match have object-dtypes, hence they are left out
+            list_of_score_features = [chunk_score_features for chunk_score_features in list_of_score_features if chunk_score_features.shape[0] > 0] or list_of_score_features[:1]
+            score_features = list_of_score_features[0] if len(list_of_score_features)  ==  1 else pd.concat(list_of_score_features, ignore_index = True)
+    elif method  ==  config._DEDUP_METHOD:
+        with stage('scoring', engine = config._SCORING_ENGINE, method = method, candidate_pairs = n_total_pairs):
+            # Invoke the Rscript and generate the Raw_score_features csv file for each minibatch
+            write_df_to_csv(df = country_df[config._THRESHOLDS_DICT.keys()], curr_country = curr_country, file_suffix = '_country_df.csv', index_flag = True)
+            args = '{} {} {} {} {} {} {} {} {} NA NA'.format(
+                config._BINARIES_NAME, config._BINARIES_EXTENSION, config._THRESHOLD_FOR_INDIVIDUAL, config._THRESHOLD_FOR_ADDRESS_COMBINED, config._SCALING_FACTOR,
+                curr_country, config._RAW_SCORES_DIRECTORY, config._TOTAL_MATCHES_THRESHOLD, config._DEDUP_METHOD
+                )
+            if not deduplicate_dataset_R( rscript_command = config._RSCRIPT_CMD,  script_name = config._SCRIPT_NAME, args = args ):
+                # The Score_Features csv would be missing, or stale from the previous node
+                raise RuntimeError('The Rscript failed for {}.'.format(file_prefix))
+    else:
+        with stage('scoring', engine = config._SCORING_ENGINE, method = method, candidate_pairs = n_total_pairs):
+            # Invoke the Rscript and generate the Raw_score_features csv file
+            args = '{} {} {} {} {} {} {} {} {} {} {}'.format(
+                config._BINARIES_NAME, config._BINARIES_EXTENSION, config._THRESHOLD_FOR_INDIVIDUAL, config._THRESHOLD_FOR_ADDRESS_COMBINED, config._SCALING_FACTOR,
+                curr_country, config._RAW_SCORES_DIRECTORY, config._TOTAL_MATCHES_THRESHOLD, config._LINKAGE_METHOD, master_csv_1, master_csv_2
+                )
+            if not deduplicate_dataset_R( rscript_command = config._RSCRIPT_CMD,  script_name = config._SCRIPT_NAME, args = args ):
+                # The Score_Features csv would be missing, or stale from the previous node
+                raise RuntimeError('The Rscript failed for {}.'.format(file_prefix))
+
+    combined_df = country_df if country_df2 is None else pd.concat([country_df, country_df2])
+    # Clean and normalize the score features
+    with stage('clean_score_features', input_rows = top_match_reducer.n_pairs if top_match_reducer is not None else None if score_features is None else score_features.shape[0]) as stage_event:
+        normalized_duplicates = clean_score_features(curr_country = curr_country, country_df = combined_df, source_dir = config._RAW_SCORES_DIRECTORY, target_dir = config._CLEANED_SCORES_DIRECTORY, verbose = False,
+                                                     score_features = score_features, file_prefix = file_prefix, top_match_reducer = top_match_reducer, streaming_top_match = config._STREAMING_TOP_MATCH,
+                                                     collapsed_child_scores = collapsed_child_scores)
+        if normalized_duplicates is None:
+            raise RuntimeError('Could not clean the score-features of {}.'.format(file_prefix))
+        stage_event['OUTPUT_ROWS'] = normalized_duplicates.shape[0]
+    return normalized_duplicates
+
+
+
+def build_master_and_cross_refs(country_df, curr_country, file_prefix, normalized_duplicates=None, report_country_df=None):
+    """
+        DOCSTRING:  Generates the master-dataset and the cross-references of a node of the recursive-tree, from its normalized-duplicates.
+                    Without any normalized-duplicates, every record is its own master.
+        INPUT:      Dataframe, country-name, Prefix-of-intermediate-files, Dataframe-of-cleaned-normalized-score-features, Dataframe-for-the-cross-ref-report
+        OUTPUT:     Master-Dataframe, Dataframe-of-cross-references.
+    """
+    if normalized_duplicates is not None and normalized_duplicates.shape[0] != 0:
+        print('\n\nFound potential duplicates. Processing their master and cross-reference...\n')
+        with stage('master_generation', input_rows = country_df.shape[0]) as stage_event:
+            # Get the unique set of master-record-ids
+            master_record_ids  =  get_deduplicated_master_records(normalized_duplicates = normalized_duplicates, country_df = country_df)
+            # Get the country-master-df
+            country_master_df  =  generate_deduplicated_master(country_df = country_df, master_record_ids = list(master_record_ids), curr_country = curr_country, target_dir = config._STAGING_AREA_DIRECTORY, write_csv = False)
+            # Create a dummy set of cross-refs for masters
+            cross_ref_df  =  generate_dummy_cross_refs_for_masters(master_record_ids = master_record_ids, curr_country = curr_country)
+            # Create full set of cross-refs for country-df
+            cross_ref_df  =  generate_final_cross_refs(cross_ref_df = cross_ref_df, normalized_duplicates = normalized_duplicates, curr_country = curr_country, target_dir = config._STAGING_AREA_DIRECTORY, write_csv = False)
+            stage_event['OUTPUT_ROWS'] = country_master_df.shape[0]
+        with stage('report_writing', input_rows = cross_ref_df.shape[0]):
+            # Create the csv for the cross-ref report
+            generate_cross_ref_report(cross_ref_df = cross_ref_df, country_df = (country_df if report_country_df is None else report_country_df).copy(), curr_country = file_prefix, target_dir = config._STAGING_AREA_DIRECTORY)
+    else:
+        print('\n\nGet the unique set of all record-ids since there aren\'t any potential duplicates.\n')
+        with stage('master_generation', input_rows = country_df.shape[0]) as stage_event:
+            # Get the unique set of all-record-ids since there aren't any potential duplicates
+            master_record_ids  =  country_df.index.values.astype(list)
+            # Get the country-master-df
+            country_master_df  =  generate_deduplicated_master(country_df = country_df, master_record_ids = master_record_ids, curr_country = curr_country, target_dir = config._STAGING_AREA_DIRECTORY, write_csv = False)
+            # Create a dummy set of cross-refs for masters
+            cross_ref_df  =  generate_dummy_cross_refs_for_masters(master_record_ids = master_record_ids, curr_country = curr_country)
+            stage_event['OUTPUT_ROWS'] = country_master_df.shape[0]
+    return country_master_df, cross_ref_df
+
+
+
+def process_minibatch(i, country_df, country_df_copy, curr_country, staging_backend, collapsed_child_scores=None):
+    """
+        DOCSTRING:  Depth-zero node of the recursive-tree: deduplicates one minibatch, and stages its master-dataset.
+                    Independent of every other minibatch, hence safe to run in a worker-process.
+                    The representatives of collapsed exact duplicates pass the score of their best duplicate, which the cyclic-dependency step counts as a child-link.
+        INPUT:      Minibatch-number, Cleaned-minibatch-dataframe, Minibatch-dataframe-with-original-info, country-name, Staging-backend,
+                    Series-of-best-collapsed-child-score-by-representative-SR_NUM (optional)
+        OUTPUT:     Handle-of-staged-master, Dataframe-of-cross-references.
+    """
+    print('\n\nStarting Batch[{}]...'.format(i))
+    file_prefix = '{}_{}'.format(curr_country, i)
+    with stage('minibatch', country = curr_country, node = '{}'.format(i), depth = 0, input_rows = country_df.shape[0]):
+        normalized_duplicates = None
+        if country_df.shape[0]>1:
+            print('\n{} has {} records.\n\nInvoking the {} scoring engine now...'.format(file_prefix, country_df.shape[0], config._SCORING_ENGINE))
+            normalized_duplicates  =  score_and_normalize_duplicates(country_df = country_df, curr_country = curr_country, file_prefix = file_prefix, method = config._DEDUP_METHOD,
+                                                                     collapsed_child_scores = collapsed_child_scores)
+        else:
+            print('\n\nGet the unique set of all record-ids, since Layer-zero cannot create mastered mini-batches.\n')
+        country_master_df, cross_ref_df  =  build_master_and_cross_refs(country_df = country_df, curr_country = curr_country, file_prefix = file_prefix, normalized_duplicates = normalized_duplicates, report_country_df = country_df_copy)
+
+        # Stage the current master dataset for the next depth
+        with stage('staging', input_rows = country_master_df.shape[0], backend = staging_backend.__class__.__name__):
+            staged_master = staging_backend.stage(df = country_master_df, curr_country = curr_country, file_suffix = '_{}_Master'.format(i))
+    return staged_master, cross_ref_df
+
+
+
+def schedule_merge_depth(master_sizes, maxsize, merge_schedule=config._MERGE_SCHEDULE, final_dedup=config._FINAL_DEDUP_WHEN_FITS):
+    """
+        DOCSTRING:  Groups the staged masters of the queue into the nodes of the next depth of the recursive-tree:
+                        a. _POSITIONAL_MERGES pairs the masters 2k and 2k+1 of the queue.
+                        b. _SIZE_BALANCED_MERGES pairs the smallest master with the next-smallest one, and so on (ties in queue-order), like the Huffman-merges of
+                           the smallest files first. The Linkage of two masters of m and n rows scores up to m x n pairs, hence the masters are linked while they
+                           are small, and an odd master left over is the largest one, which waits for the next depth instead of being linked now.
+                        c. With final_dedup, once more than two masters remain and their rows fit in one minibatch together, they make a single Dedup node.
+                    A group of a single master is carried over to the next depth as it is. The groups depend on the row counts only, hence on the config and input.
+        INPUT:      List-of-row-counts-of-the-staged-masters (in queue-order), Minibatch-size, Merge-schedule, Flag-for-a-final-Dedup-node
+        OUTPUT:     List of tuples of queue-positions, one per group, in the order of their first position; the next queue follows this order.
+    """
+    n_masters = len(master_sizes)
+    if final_dedup and n_masters > 2 and sum(master_sizes) <= maxsize:
+        return [tuple(range(n_masters))]
+    if merge_schedule  ==  config._SIZE_BALANCED_MERGES:
+        order = sorted(range(n_masters), key = lambda k: (master_sizes[k], k))
+    elif merge_schedule  ==  config._POSITIONAL_MERGES:
+        order = list(range(n_masters))
+    else:
+        raise ValueError('Unknown merge-schedule: {}'.format(merge_schedule))
+    groups = [tuple(sorted(order[k : k+2])) for k in range(0, n_masters-1, 2)]
+    if n_masters % 2  ==  1:
+        groups.append((order[-1],))
+    return sorted(groups)
+
+
+
+def process_final_dedup(j, i, staged_masters, curr_country, staging_backend):
+    """
+        DOCSTRING:  Last node of the recursive-tree with _FINAL_DEDUP_WHEN_FITS: the remaining staged masters fit in one minibatch together,
+                    hence they are deduplicated in one Dedup call instead of further depths of merge-pairs; and the merged master-dataset is staged.
+        INPUT:      Depth, Position-in-queue, List-of-handles-of-staged-masters, country-name, Staging-backend
+        OUTPUT:     Handle-of-staged-master, Dataframe-of-cross-references.
+    """
+    file_prefix = '{}_d{}_{}'.format(curr_country, j, i)
+    with stage('final_dedup', country = curr_country, node = 'd{}_{}'.format(j, i), depth = j) as final_dedup_event:
+        with stage('load_staged_masters', backend = staging_backend.__class__.__name__) as stage_event:
+            # The categoricals of the masters differ, hence the concatenation gets the schema again
+            country_df = apply_record_schema(pd.concat([staging_backend.load(staged_master) for staged_master in staged_masters]))
+            final_dedup_event['INPUT_ROWS'] = stage_event['OUTPUT_ROWS'] = country_df.shape[0]
+        print('\n{} staged masters have {} records together.\n\nInvoking the {} scoring engine now...'.format(len(staged_masters), country_df.shape[0], config._SCORING_ENGINE))
+        normalized_duplicates  =  score_and_normalize_duplicates(country_df = country_df, curr_country = curr_country, file_prefix = file_prefix, method = config._DEDUP_METHOD)
+        country_master_df, cross_ref_df  =  build_master_and_cross_refs(country_df = country_df, curr_country = curr_country, file_prefix = file_prefix, normalized_duplicates = normalized_duplicates)
+
+        # Stage the final master dataset
+        with stage('staging', input_rows = country_master_df.shape[0], backend = staging_backend.__class__.__name__):
+            staged_master = staging_backend.stage(df = country_master_df, curr_country = curr_country, file_suffix = '_d{}_{}_Master'.format(j,i))
+    return staged_master, cross_ref_df
+
+
+
+def process_merge_pair(j, i, staged_master_1, staged_master_2, curr_country, staging_backend, next_staged_masters=()):
+    """
+        DOCSTRING:  Depth-j node of the recursive-tree: links two staged master-datasets (or carries over a single one), and stages the merged master-dataset.
+                    Independent of every other pair at the same depth, hence safe to run in a worker-process.
+                    The staged masters of the next merge-pair, if passed, are read ahead while this pair is scored (see prefetch() of the staging-backends).
+        INPUT:      Depth, Position-in-queue, Handle-of-first-staged-master, Handle-of-second-staged-master (None if there isn't one), country-name, Staging-backend,
+                    Handles-of-next-staged-masters (only when the pairs run one after another in this process)
+        OUTPUT:     Handle-of-staged-master, Dataframe-of-cross-references.
+    """
+    file_prefix = '{}_d{}_{}'.format(curr_country, j, i)
+    with stage('merge_pair', country = curr_country, node = 'd{}_{}'.format(j, i), depth = j) as merge_pair_event:
+        with stage('load_staged_masters', backend = staging_backend.__class__.__name__) as stage_event:
+            master_df_1 = staging_backend.load(staged_master_1)
+            master_df_2 = staging_backend.load(staged_master_2) if staged_master_2 is not None else None
+            merge_pair_event['INPUT_ROWS'] = stage_event['OUTPUT_ROWS'] = master_df_1.shape[0]+(0 if master_df_2 is None else master_df_2.shape[0])
+        for next_staged_master in next_staged_masters:
+            staging_backend.prefetch(next_staged_master)
+
+        if master_df_2 is not None:
+            print('\n{} has {} records, and {} has {} records.\n\nInvoking the {} scoring engine now...\n'.format(staged_master_1, master_df_1.shape[0], staged_master_2, master_df_2.shape[0], config._SCORING_ENGINE))
+            # The R scoring-engine reads the masters from the csv staging-area itself
+            master_csv_1, master_csv_2 = (staging_backend.abs_path(staged_master_1), staging_backend.abs_path(staged_master_2)) if config._SCORING_ENGINE  ==  config._R_ENGINE else (None, None)
+            normalized_duplicates  =  score_and_normalize_duplicates(country_df = master_df_1, country_df2 = master_df_2, curr_country = curr_country, file_prefix = file_prefix, method = config._LINKAGE_METHOD, master_csv_1 = master_csv_1, master_csv_2 = master_csv_2)
+            # The categoricals of both masters differ, hence the concatenation gets the schema again
+            country_master_df, cross_ref_df  =  build_master_and_cross_refs(country_df = apply_record_schema(pd.concat([master_df_1, master_df_2])), curr_country = curr_country, file_prefix = file_prefix, normalized_duplicates = normalized_duplicates)
+        else:
+            print('\n\nGet the unique set of all record-ids since there isn\'t a second file to compare.\n')
+            country_master_df, cross_ref_df  =  build_master_and_cross_refs(country_df = master_df_1, curr_country = curr_country, file_prefix = file_prefix)
+
+        # Stage the current master dataset for the next depth
+        with stage('staging', input_rows = country_master_df.shape[0], backend = staging_backend.__class__.__name__):
+            staged_master = staging_backend.stage(df = country_master_df, curr_country = curr_country, file_suffix = '_d{}_{}_Master'.format(j,i))
+    return staged_master, cross_ref_df
+
+
+
+def masterize_country(curr_country, entire_country_df, entire_country_df_copy, n_workers=config._N_WORKERS, executor=None, log_file=None, staging_backend_name=config._STAGING_BACKEND, write_outputs=True,
+                      max_depth=None):
+    """
+        DOCSTRING:  Recursively masterizes the records of one country:
+                        a. Deduplicates the minibatches at depth-zero, concurrently on n_workers processes. A minibatch has _MAXSIZE records,
+                           or with _ADAPTIVE_BATCH_SIZING as many as fit in _NODE_MEMORY_BUDGET_MB for the field-widths of the country
+                           (up to _MAX_ADAPTIVE_MAXSIZE),
+                           or with _USE_LSH and _LSH_SINGLE_PASS all the records of the country. With _COLLAPSE_EXACT_DUPLICATES, the records identical
+                           in every match-score relevant column are collapsed into one representative first (see collapse_exact_duplicates()),
+                           hence only the representatives enter the minibatches, and their duplicates follow them.
+                        b. Links the staged master-datasets pair-wise at each following depth, concurrently on n_workers processes, until one master-dataset remains.
+                           The pairs of each depth are scheduled by schedule_merge_depth() from the row counts of the staged masters (see _MERGE_SCHEDULE),
+                           and with _FINAL_DEDUP_WHEN_FITS the last few masters are deduplicated in one node once they fit in a minibatch together.
+                        c. Writes the final Master, Raw-Cross-Ref and Cross-Ref-Full-Report in the Master-Data directory, unless write_outputs is False.
+                    The results of each depth are collected in the order of the queue, so the outputs do not depend on the number of workers.
+                    The intermediate master-datasets are kept by the staging-backend (in-memory, Arrow/Parquet spill files or csv files).
+                    With _USE_CHECKPOINTS, every node is checkpointed in the run-manifest of the country, and a re-run with the same config and input
+                    resumes at the first incomplete node of the recursive-tree. With max_depth, the run stops after that depth (0 for the minibatches only),
+                    so that the depths can be run one invocation at a time, each resuming from the checkpoints of the previous one.
+        INPUT:      country-name, Cleaned-dataframe-for-country, Dataframe-for-country-with-original-info, Number-of-worker-processes,
+                    Shared-process-pool (optional), Abs-path-of-country-log-file for the worker-processes (optional), Name-of-staging-backend, Flag-to-write-outputs,
+                    Last-depth-to-run (optional)
+        OUTPUT:     Master-Dataframe, Dataframe-of-cross-references; or None if the run stopped at max_depth.
+    """
+    if config._SCORING_ENGINE  ==  config._R_ENGINE and n_workers > 1:
+        # The Rscript reads and writes country-specific csv files, hence concurrent calls for the same country would overwrite each other
+        print('\nThe R scoring engine shares intermediate csv files within a country. Running with a single worker.')
+        n_workers = 1
+    if config._SCORING_ENGINE  ==  config._R_ENGINE and staging_backend_name  !=  config._CSV_STAGING:
+        # The Rscript reads the staged masters from csv files
+        print('\nThe R scoring engine reads the staged masters from csv files. Using the {} staging-backend.'.format(config._CSV_STAGING))
+        staging_backend_name = config._CSV_STAGING
+    staging_backend = get_staging_backend(staging_backend_name)
+
+    # The records going through the recursive-tree, and their original-info
+    tree_country_df, tree_country_df_copy = entire_country_df, entire_country_df_copy
+    exact_cross_ref_df, collapsed_child_scores = None, None
+    if config._COLLAPSE_EXACT_DUPLICATES and entire_country_df.shape[0] > 1:
+        with stage('exact_duplicates', country = curr_country, input_rows = entire_country_df.shape[0]) as stage_event:
+            representative_positions, exact_cross_ref_df  =  collapse_exact_duplicates(country_df = entire_country_df, curr_country = curr_country)
+            stage_event['OUTPUT_ROWS'] = representative_positions.shape[0]
+        if exact_cross_ref_df.shape[0] > 0:
+            tree_country_df, tree_country_df_copy = entire_country_df.iloc[representative_positions], entire_country_df_copy.iloc[representative_positions]
+            # The link of a duplicate to its representative would have been a child-link of the representative, had the duplicate been scored
+            collapsed_child_scores = exact_cross_ref_df.groupby('SR_NUM_2', observed = True)['NUM_OF_MATCHES_FOUND'].max()
+
+    nrows = tree_country_df.shape[0]
+    maxsize = config._MAXSIZE
+    if config._USE_LSH and config._LSH_SINGLE_PASS and config._SCORING_ENGINE  ==  config._PYTHON_ENGINE and nrows > 0:
+        # The LSH candidate-pairs grow sub-quadratically, hence the whole country is deduplicated in one minibatch, without any merge-pairs
+        maxsize = nrows
+        print('\nLSH single-pass for {}: one minibatch of {} records.'.format(curr_country, nrows))
+    elif config._ADAPTIVE_BATCH_SIZING and config._SCORING_ENGINE  ==  config._PYTHON_ENGINE and nrows > 0:
+        # As large as the node-budget allows for this country's field-widths; the memory-model is the one of the Python engine
+        maxsize, sizing_report = choose_minibatch_size(country_df = tree_country_df, node_memory_budget_mb = config._NODE_MEMORY_BUDGET_MB, min_maxsize = config._MIN_ADAPTIVE_MAXSIZE,
+                                                       max_maxsize = config._MAX_ADAPTIVE_MAXSIZE)
+        print('\nAdaptive batch-sizing for {} within {} MB per node: {}'.format(curr_country, config._NODE_MEMORY_BUDGET_MB, sizing_report))
+    m = int(np.ceil(np.divide(nrows, maxsize)))
+    print('\nThere will be {} batches since incoming dataset-size = {} and minibatch-size = {}'.format(m, nrows, maxsize))
+
+    run_manifest = RunManifest(curr_country, compute_run_fingerprint(entire_country_df, entire_country_df_copy, node_plan = {'MAXSIZE': maxsize, 'N_MINIBATCHES': m})) if config._USE_CHECKPOINTS else None
+    if max_depth is not None and run_manifest is None:
+        print('\nWithout _USE_CHECKPOINTS, the depths run before stopping at depth[{}] cannot be resumed.'.format(max_depth))
+
+    list_of_task_args = [(i, tree_country_df.iloc[i*maxsize : (i+1)*maxsize], tree_country_df_copy.iloc[i*maxsize : (i+1)*maxsize], curr_country, staging_backend,
+                          None if collapsed_child_scores is None else collapsed_child_scores[collapsed_child_scores.index.isin(tree_country_df.index[i*maxsize : (i+1)*maxsize])]) for i in range(m)]
+    results = run_checkpointed_nodes(process_minibatch, ['{}'.format(i) for i in range(m)], list_of_task_args, curr_country, staging_backend, run_manifest = run_manifest,
+                                     n_workers = n_workers, executor = executor, log_file = log_file)
+    # Add the staged masters to the queue, and append the generated cross-refs to the entire cross-ref
+    queue_of_masters = [staged_master for staged_master, cross_ref_df in results]
+    entire_country_cross_ref = CrossRefStore()
+    for staged_master, cross_ref_df in results:
+        entire_country_cross_ref.append(cross_ref_df)
+    if exact_cross_ref_df is not None and exact_cross_ref_df.shape[0] > 0:
+        # The duplicates point to their representatives, hence they follow the representatives merged at depth-zero, and then at every depth like any child
+        entire_country_cross_ref.append(exact_cross_ref_df)
+        with stage('cross_ref_update', country = curr_country, depth = 0, input_rows = exact_cross_ref_df.shape[0]):
+            for staged_master, cross_ref_df in results:
+                entire_country_cross_ref.repoint(cross_ref_df)
+    print('{} masters staged are: {}'.format(len(queue_of_masters), queue_of_masters))
+
+
+    # Number of levels for the recursive computations with merge-pairs; the loop itself follows the staged masters remaining in the queue
+    d = int(np.ceil(np.log2(m))) if m > 1 else 0
+    print('\nMax-depth for {} will be {}'.format(curr_country, d))
+
+    j = 0
+    while len(queue_of_masters) > 1:
+        if max_depth is not None and j+1 > max_depth:
+            break
+        j += 1
+        n_masters_to_read = len(queue_of_masters)
+        print('{} staged masters need to be processed: {}'.format(n_masters_to_read, queue_of_masters))
+        groups = schedule_merge_depth(master_sizes = [staging_backend.row_count(staged_master) for staged_master in queue_of_masters], maxsize = maxsize,
+                                      merge_schedule = config._MERGE_SCHEDULE, final_dedup = config._FINAL_DEDUP_WHEN_FITS)
+        merge_groups = [group for group in groups if len(group) > 1]
+        if len(merge_groups)  ==  1 and len(merge_groups[0]) > 2:
+            print('The {} staged masters fit in one minibatch: deduplicating them in a single node.'.format(n_masters_to_read))
+            task_function = process_final_dedup
+            list_of_task_args = [(j, 0, [queue_of_masters[k] for k in merge_groups[0]], curr_country, staging_backend)]
+        else:
+            # Sequential pairs read the next pair's masters ahead (a no-op for the Memory backend); a worker-process would read them for nothing,
+            # since the pool decides which pair it runs next
+            prefetch = config._PREFETCH_STAGED_MASTERS and executor is None and n_workers <= 1
+            task_function = process_merge_pair
+            list_of_task_args = [(j, group[0], queue_of_masters[group[0]], queue_of_masters[group[1]], curr_country, staging_backend,
+                                  tuple(queue_of_masters[k] for k in merge_groups[n+1]) if prefetch and n+1 < len(merge_groups) else ()) for n, group in enumerate(merge_groups)]
+        results = run_checkpointed_nodes(task_function, ['d{}_{}'.format(j, group[0]) for group in merge_groups], list_of_task_args, curr_country, staging_backend,
+                                         run_manifest = run_manifest, n_workers = n_workers, executor = executor, log_file = log_file)
+        for group in merge_groups:
+            for k in group:
+                staging_backend.discard(queue_of_masters[k])
+        # A master left over is carried over as it is, at the position of its group
+        iter_results = iter(results)
+        queue_of_masters = [next(iter_results)[0] if len(group) > 1 else queue_of_masters[group[0]] for group in groups]
+
+        if config._WRITE_DEPTH_CROSS_REFS:
+            write_df_to_csv(df = pd.concat([cross_ref_df for staged_master, cross_ref_df in results]), root_dir = config._STAGING_AREA_DIRECTORY, curr_country = curr_country, file_suffix = '_d{}_Raw_Cross_Ref.csv'.format(j), index_flag = False, background = True)
+        print('\n\nDepth[{}] processed successfully.'.format(j))
+        # Re-point the masters merged at this depth, together with their children
+        with stage('cross_ref_update', country = curr_country, depth = j, input_rows = sum(cross_ref_df.shape[0] for staged_master, cross_ref_df in results)) as stage_event:
+            n_merged_masters = sum(entire_country_cross_ref.repoint(cross_ref_df) for staged_master, cross_ref_df in results)
+            stage_event['OUTPUT_ROWS'] = n_merged_masters
+        print('{} masters got merged at depth[{}].'.format(n_merged_masters, j))
+
+
+    if len(queue_of_masters) > 1:
+        # Stopped at max_depth: the completed nodes stay checkpointed, and the next run resumes at the following depth
+        with stage('flush_writes', country = curr_country):
+            flush_background_writes()
+        print('\nStopped {} after depth[{}] of {}: {} staged masters remain. Re-run to resume from the checkpoints.'.format(curr_country, max_depth, d, len(queue_of_masters)))
+        return None
+
+    if len(queue_of_masters)  ==  1:
+        print('\n\n\n\nProcessed all {} levels. Generating the master and cross-reference at the final-layer...'.format(j))
+        master_df_1 = staging_backend.load(queue_of_masters[0])
+        staging_backend.discard(queue_of_masters[0])
+        # Get the unique set of master-record-ids
+        master_record_ids  =  master_df_1.index.values.astype(list)
+        entire_country_cross_ref_df  =  entire_country_cross_ref.to_dataframe()
+        if exact_cross_ref_df is not None and exact_cross_ref_df.shape[0] > 0:
+            # The cross-refs of the collapsed duplicates were appended last; they take their place by SR_NUM, as if they had been scored in their minibatch
+            entire_country_cross_ref_df  =  entire_country_cross_ref_df.sort_values(by = 'SR_NUM_1', kind = 'mergesort', ignore_index = True)
+        with stage('report_writing' if write_outputs else 'master_generation', country = curr_country, input_rows = entire_country_df.shape[0]):
+            # Get the country-master-df
+            country_master_df  =  generate_deduplicated_master(country_df = entire_country_df_copy, master_record_ids = master_record_ids, curr_country = curr_country, target_dir = config._MASTER_DATA_DIRECTORY, write_csv = write_outputs)
+            if write_outputs:
+                # Write the final raw-cross-ref to a csv
+                write_df_to_csv(df = entire_country_cross_ref_df, root_dir = config._MASTER_DATA_DIRECTORY, curr_country = curr_country, file_suffix = '_Raw_Cross_Ref.csv', index_flag = False, background = True)
+                # Create the csv for the cross-ref report
+                generate_cross_ref_report(cross_ref_df = entire_country_cross_ref_df, country_df = entire_country_df_copy.copy(), curr_country = curr_country, target_dir = config._MASTER_DATA_DIRECTORY)
+        # Barrier: the outputs are on disk before the checkpoints are gone
+        with stage('flush_writes', country = curr_country):
+            flush_background_writes()
+        if run_manifest is not None:
+            # The country is complete, hence a re-run starts afresh
+            run_manifest.clear()
+        return country_master_df, entire_country_cross_ref_df
+
+
+
+def load_persisted_master(curr_country, master_dir=config._MASTER_DATA_DIRECTORY):
+    """
+        DOCSTRING:  Loads the Master and Raw-Cross-Ref of a country published by an earlier run, if both exist.
+        INPUT:      country-name, Master-Data-directory
+        OUTPUT:     Master-Dataframe-indexed-by-SR_NUM, Dataframe-of-cross-references; or (None, None) if the country was never masterized.
+                    With _COMPACT_DTYPES, both get their schema back (the cells of the Master are re-read as strings, as after preprocess_dataframe()).
+    """
+    master_csv = os.path.join(master_dir, curr_country+'_Master.csv')
+    cross_ref_csv = os.path.join(master_dir, curr_country+'_Raw_Cross_Ref.csv')
+    if not (os.path.exists(master_csv) and os.path.exists(cross_ref_csv)):
+        return None, None
+    if config._COMPACT_DTYPES:
+        return apply_record_schema(pd.read_csv(master_csv, index_col = 0, dtype = str, keep_default_na = False)), apply_cross_ref_schema(pd.read_csv(cross_ref_csv))
+    return pd.read_csv(master_csv, index_col = 0), pd.read_csv(cross_ref_csv)
+
+
+
+def clean_master_score_columns(master_df, thresholds_dict=config._THRESHOLDS_DICT):
+    """
+        DOCSTRING:  A published Master holds the original-info, with CONCAT_ADDRESS already concatenated. Applies the same cleaning as clean_dataframe()
+                    to its match-score relevant columns (lowercase, without special-chars), so that it can be scored against freshly cleaned records.
+        INPUT:      Master-Dataframe, Dict-of-column-thresholds
+        OUTPUT:     Dataframe of the cleaned match-score relevant columns.
+    """
+    return clean_text_columns(master_df[list(thresholds_dict)].fillna('').astype(str), list(thresholds_dict))
+
+
+
+def masterize_country_incremental(curr_country, entire_country_df, entire_country_df_copy, n_workers=config._N_WORKERS, executor=None, log_file=None, master_dir=config._MASTER_DATA_DIRECTORY):
+    """
+        DOCSTRING:  Incremental mastering of the new records (delta) of a country against its published Master and Raw-Cross-Ref:
+                        a. Loads the existing master and cross-reference; without them, falls back to masterizing the delta from scratch.
+                        b. Deduplicates the delta among itself using the recursive-tree.
+                        c. Links the delta-masters only against the existing masters; a delta-master matching an existing master joins it together with its children.
+                        d. Appends the delta cross-refs and the unmatched delta-masters; already-mastered records are never modified.
+                    Writes the updated Master and Raw-Cross-Ref, and a Delta-Cross-Ref-Full-Report of the new records, in the Master-Data directory.
+        INPUT:      country-name, Cleaned-delta-dataframe, Delta-dataframe-with-original-info, Number-of-worker-processes, Shared-process-pool (optional),
+                    Abs-path-of-country-log-file (optional), Master-Data-directory
+        OUTPUT:     Updated-Master-Dataframe, Updated-Dataframe-of-cross-references.
+    """
+    existing_master_df, existing_cross_ref_df = load_persisted_master(curr_country, master_dir = master_dir)
+    if existing_master_df is None:
+        print('\nNo published master found for {}. Masterizing its records from scratch.'.format(curr_country))
+        return masterize_country(curr_country = curr_country, entire_country_df = entire_country_df, entire_country_df_copy = entire_country_df_copy, n_workers = n_workers, executor = executor, log_file = log_file)
+    if entire_country_df.shape[0]  ==  0:
+        print('\nNo new records found for {}. The published master is up to date.'.format(curr_country))
+        return existing_master_df, existing_cross_ref_df
+
+    # New records must not reuse the SR_NUMs of already-mastered records
+    max_existing_sr_num = max(existing_cross_ref_df['SR_NUM_1'].max(), existing_master_df.index.max())
+    if entire_country_df.index.min() <= max_existing_sr_num:
+        new_sr_nums = np.arange(max_existing_sr_num+1, max_existing_sr_num+1+entire_country_df.shape[0])
+        print('\nRenumbering the {} new records of {} to SR_NUM {}..{}'.format(entire_country_df.shape[0], curr_country, new_sr_nums[0], new_sr_nums[-1]))
+        entire_country_df = entire_country_df.set_axis(new_sr_nums, axis = 0)
+        entire_country_df_copy = entire_country_df_copy.set_axis(new_sr_nums, axis = 0)
+    entire_country_df.index.name = entire_country_df_copy.index.name = existing_master_df.index.name
+
+    # Deduplicate the delta among itself
+    print('\nDeduplicating {} new records of {} among themselves...'.format(entire_country_df.shape[0], curr_country))
+    delta_master_df, delta_cross_ref_df = masterize_country(curr_country = curr_country, entire_country_df = entire_country_df, entire_country_df_copy = entire_country_df_copy,
+                                                            n_workers = n_workers, executor = executor, log_file = log_file, write_outputs = False)
+
+    # Link the delta-masters against the existing masters only
+    print('\nLinking {} new masters against {} existing masters of {}...'.format(delta_master_df.shape[0], existing_master_df.shape[0], curr_country))
+    normalized_duplicates = score_and_normalize_duplicates(country_df = entire_country_df.loc[delta_master_df.index], country_df2 = clean_master_score_columns(existing_master_df),
+                                                           curr_country = curr_country, file_prefix = curr_country+'_delta', method = config._LINKAGE_METHOD)
+    delta_cross_ref_df = delta_cross_ref_df.set_index('SR_NUM_1')
+    if normalized_duplicates is not None and normalized_duplicates.shape[0] != 0:
+        linked_masters = normalized_duplicates.set_index('SR_NUM_1')
+        # The linked delta-master takes the score of its link to the existing master, and its children follow it
+        delta_cross_ref_df.update(linked_masters[delta_cross_ref_df.columns.drop('COUNTRY').intersection(linked_masters.columns)])
+        delta_cross_ref_df['SR_NUM_2'] = delta_cross_ref_df['SR_NUM_2'].replace(linked_masters['SR_NUM_2'].to_dict()).astype(np.int64)
+        print('{} new masters were linked to existing masters.'.format(linked_masters.shape[0]))
+        delta_master_df = delta_master_df.drop(linked_masters.index)
+    delta_cross_ref_df = delta_cross_ref_df.reset_index()
+
+    # The categoricals of both sides differ, hence the concatenation gets the schema again
+    country_master_df = apply_record_schema(pd.concat([existing_master_df, delta_master_df]))
+    country_cross_ref_df = apply_cross_ref_schema(pd.concat([existing_cross_ref_df, delta_cross_ref_df[existing_cross_ref_df.columns]], ignore_index = True))
+    with stage('report_writing', country = curr_country, input_rows = country_cross_ref_df.shape[0], incremental = True):
+        write_df_to_csv(df = country_master_df, root_dir = master_dir, curr_country = curr_country, file_suffix = '_Master.csv', index_flag = True, background = True)
+        write_df_to_csv(df = country_cross_ref_df, root_dir = master_dir, curr_country = curr_country, file_suffix = '_Raw_Cross_Ref.csv', index_flag = False, background = True)
+        # The original-info of the already-mastered children is not persisted, hence the report covers the new records and the masters they link to
+        generate_cross_ref_report(cross_ref_df = delta_cross_ref_df, country_df = pd.concat([existing_master_df, entire_country_df_copy]), curr_country = curr_country+'_Delta', target_dir = master_dir)
+        flush_background_writes()
+    print('{} records get merged into {} masters for {}'.format(country_cross_ref_df.shape[0], country_master_df.shape[0], curr_country))
+    return country_master_df, country_cross_ref_df
+
+
+
+def estimate_country_memory_mb(country_df, overhead_factor=config._MEMORY_OVERHEAD_FACTOR):
+    """
+        DOCSTRING:  Rough estimate of the peak memory needed to masterize a country, from the in-memory size of its records.
+        INPUT:      Dataframe-for-country, Overhead-factor
+        OUTPUT:     Estimated memory in MB.
+    """
+    return overhead_factor*country_df.memory_usage(index=True, deep=True).sum()/(1024*1024)
+
+
+
+def _masterize_country_with_budget(curr_country, country_df, memory_budget, reserved_mb, n_workers, executor, log_file, incremental=False, max_depth=None):
+    """
+        DOCSTRING:  Thread-target for one country: cleans its records and masterizes them (or only the new records, if incremental) with its prints
+                    routed to its own log-file, then releases its reservation of the memory-budget.
+        INPUT:      country-name, Dataframe-for-country, Shared-memory-budget, Reserved-memory-in-MB, Number-of-worker-processes, Shared-process-pool, Abs-path-of-log-file,
+                    Flag-for-incremental-mastering, Last-depth-to-run (optional, not incremental)
+        OUTPUT:     Master-Dataframe, Dataframe-of-cross-references; or None if the run stopped at max_depth.
+    """
+    try:
+        with sys.stdout.route_to(log_file):
+            with stage('clean', country = curr_country, input_rows = country_df.shape[0]):
+                entire_country_df, entire_country_df_copy = clean_dataframe_variants(country_df, columns_to_clean = config._COLUMNS_TO_CLEAN, fields_to_concat = config._FIELDS_TO_CONCAT)
+            masterize_function = masterize_country_incremental if incremental else masterize_country
+            depth_kwargs = dict() if incremental or max_depth is None else {'max_depth': max_depth}
+            with stage('masterize_country', country = curr_country, input_rows = country_df.shape[0], incremental = incremental) as stage_event:
+                country_result = masterize_function(curr_country = curr_country, entire_country_df = entire_country_df, entire_country_df_copy = entire_country_df_copy,
+                                                    n_workers = n_workers, executor = executor, log_file = log_file if executor is not None else None, **depth_kwargs)
+                stage_event['OUTPUT_ROWS'] = None if country_result is None else country_result[0].shape[0]
+            return country_result
+    finally:
+        memory_budget.release(reserved_mb)
+
+
+
+def masterize_countries(site_master_df, countries, n_workers=config._N_WORKERS, memory_budget_mb=config._MEMORY_BUDGET_MB, log_dir=config._LOGS_DIRECTORY, incremental=False, max_depth=None):
+    """
+        DOCSTRING:  Country-level scheduler: masterizes the countries concurrently, largest country first, under one global budget:
+                        a. CPU:     the minibatches and merge-pairs of all countries run on one shared process-pool of n_workers.
+                        b. Memory:  a country is started only once its estimated memory fits in the remaining memory-budget.
+                    The countries share no data or files, and each country's prints go to its own /Logs/<country>.log file.
+                    If incremental, the records are treated as new records to be mastered against each country's published Master.
+                    With max_depth, every country stops after that depth of its recursive-tree (see masterize_country()).
+        INPUT:      Preprocessed-dataframe-of-all-countries, List-of-country-names, Number-of-worker-processes, Memory-budget-in-MB, Logs-directory, Flag-for-incremental-mastering,
+                    Last-depth-to-run (optional)
+        OUTPUT:     Dict of country-name to (Master-Dataframe, Dataframe-of-cross-references), or None for the countries which failed or stopped at max_depth.
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    country_dfs = {curr_country: site_master_df[site_master_df['COUNTRY']  ==  curr_country] for curr_country in countries}
+    # Start with the largest country so that the wall-clock time approaches the time of the largest country
+    countries = sorted(countries, key = lambda curr_country: country_dfs[curr_country].shape[0], reverse = True)
+    # The R engine must process the nodes of a country one after another, but different countries can still run concurrently
+    n_workers_per_country = 1 if config._SCORING_ENGINE  ==  config._R_ENGINE else n_workers
+    memory_budget = MemoryBudget(memory_budget_mb)
+
+    original_stdout = sys.stdout
+    sys.stdout = ThreadLogRouter(original_stdout)
+    # Spawned (not forked) workers, since the pool is used from several country-threads
+    process_pool = ProcessPoolExecutor(max_workers = n_workers, mp_context = multiprocessing.get_context('spawn')) if n_workers > 1 else None
+    country_futures = dict()
+    try:
+        with ThreadPoolExecutor(max_workers = max(1, n_workers)) as country_pool:
+            for curr_country in countries:
+                reserved_mb = memory_budget.acquire(estimate_country_memory_mb(country_dfs[curr_country]))
+                log_file = os.path.join(log_dir, curr_country+'.log')
+                print('\nStarting {} ({} records, ~{:.0f} MB reserved). Logs at {}'.format(curr_country, country_dfs[curr_country].shape[0], reserved_mb, log_file))
+                country_futures[curr_country] = country_pool.submit(_masterize_country_with_budget, curr_country, country_dfs[curr_country], memory_budget, reserved_mb,
+                                                                   n_workers_per_country, process_pool, log_file, incremental, max_depth)
+    finally:
+        if process_pool is not None:
+            process_pool.shutdown()
+        sys.stdout = original_stdout
+
+    country_results = dict()
+    for curr_country, country_future in country_futures.items():
+        try:
+            country_results[curr_country] = country_future.result()
+            if country_results[curr_country] is None and max_depth is not None:
+                print('\n{} processed up to depth[{}].'.format(curr_country, max_depth))
+            else:
+                print('\n{} processed successfully.'.format(curr_country))
+        except Exception as e:
+            country_results[curr_country] = None
+            print('\nSomething went wrong while masterizing {}. Please check its log-file.'.format(curr_country))
+            print(e)
+    return country_results
@@ -0,0 +1,408 @@
+import numpy as np, pandas as pd, threading
+from collections import OrderedDict
+from config import *
+from utils.dtype_schema import apply_cross_ref_schema
+
+
+# bounded_levenshtein_distance() compacts its batch once less than this share of the pairs is still running,
+# and checks the cut-off every few rows only, since the check costs about as much as a row of the edit-distance matrix
+_COMPACTION_RATIO = 0.75
+_CUTOFF_CHECK_INTERVAL = 3
+_SCORE_FEATURES_COLUMNS = ['SR_NUM_1', 'SR_NUM_2', 'SITE_NAME_COMPARISON_SCORE', 'STATE_COMPARISON_SCORE', 'CITY_COMPARISON_SCORE',
+                           'POSTAL_CODE_COMPARISON_SCORE', 'CONCAT_ADDRESS_COMPARISON_SCORE', 'NUM_OF_MATCHES_FOUND']
+
+
+
+def _encode_strings(values):
+    """
+        DOCSTRING:  Converts an array of strings into a 2D array of unicode code-points, padded with zeros to the longest string.
+        INPUT:      Array-of-strings
+        OUTPUT:     2D-array-of-code-points (n_strings x max_length), Array-of-string-lengths
+    """
+    values=np.asarray(values, dtype=str)
+    lengths=np.char.str_len(values).astype(np.int32)
+    width=max(int(lengths.max()) if lengths.size else 0, 1)
+    codes=values.astype('<U{}'.format(width)).view(np.uint32).reshape(values.shape[0], width)
+    return codes, lengths
+
+
+
+def levenshtein_distance(strings_1, strings_2):
+    """
+        DOCSTRING:  Vectorized Levenshtein-Distance between two equally long arrays of strings, pair-wise.
+                    Walks the rows of the edit-distance matrix once for the whole batch of pairs. Within a row, the deletion-dependency
+                    on the left neighbour is resolved with a cumulative-minimum, so every row is a handful of NumPy operations.
+        INPUT:      Array-of-strings, Array-of-strings
+        OUTPUT:     Array of edit-distances for each pair.
+    """
+    codes_1, lengths_1=_encode_strings(strings_1)
+    codes_2, lengths_2=_encode_strings(strings_2)
+    n_pairs=codes_1.shape[0]
+    distances=lengths_2.copy()
+    if n_pairs==0:
+        return distances
+
+    columns=np.arange(codes_2.shape[1]+1, dtype=np.int32)
+    prev_row=np.broadcast_to(columns, (n_pairs, columns.shape[0])).copy()
+    curr_row=np.empty_like(prev_row)
+    all_pairs=np.arange(n_pairs)
+    for i in range(1, int(lengths_1.max())+1):
+        substitution_cost=(codes_1[:, i-1:i]!=codes_2).astype(np.int32)
+        curr_row[:, 0]=i
+        np.minimum(prev_row[:, 1:]+1, prev_row[:, :-1]+substitution_cost, out=curr_row[:, 1:])
+        curr_row=np.minimum.accumulate(curr_row-columns, axis=1)+columns
+        finished=(lengths_1==i)
+        distances[finished]=curr_row[all_pairs[finished], lengths_2[finished]]
+        prev_row, curr_row=curr_row, prev_row
+    return distances
+
+
+
+def levenshtein_similarity(strings_1, strings_2):
+    """
+        DOCSTRING:  Equivalent of levenshteinSim() in the R-code:   1 - levenshtein_distance / max(nchar(str1), nchar(str2)).
+                    Blank strings are NA in the R-code and their imputed score is 0, hence any pair with a blank string scores 0 here.
+        INPUT:      Array-of-strings, Array-of-strings
+        OUTPUT:     Array of similarity-scores in [0, 1] for each pair.
+    """
+    strings_1=np.asarray(strings_1, dtype=str)
+    strings_2=np.asarray(strings_2, dtype=str)
+    max_lengths=np.maximum(np.char.str_len(strings_1), np.char.str_len(strings_2))
+    blank_pairs=(strings_1=='') | (strings_2=='')
+    similarities=np.zeros(strings_1.shape[0], dtype=np.float64)
+    valid_pairs=~blank_pairs
+    if valid_pairs.any():
+        distances=levenshtein_distance(strings_1[valid_pairs], strings_2[valid_pairs])
+        similarities[valid_pairs]=1-distances/max_lengths[valid_pairs]
+    return similarities
+
+
+
+def bounded_levenshtein_distance(strings_1, strings_2, max_distances):
+    """
+        DOCSTRING:  Levenshtein-Distance bounded by a max-distance per pair (Ukkonen's cut-off): exact for every pair within its max-distance, else max-distance + 1.
+                    Walks the rows of the edit-distance matrix like levenshtein_distance(), but only for the pairs which can still end within their bound:
+                        a. A pair whose lengths differ by more than its max-distance never enters the matrix.
+                        b. A pair leaves once the lower-bound of its distance (checked every _CUTOFF_CHECK_INTERVAL rows), min over the row of
+                           D[i][j] + |chars left in string-1 - chars left in string-2|,
+                           exceeds its max-distance.
+                        c. The batch is compacted to the pairs still running, and trimmed to their longest string.
+        INPUT:      Array-of-strings, Array-of-strings, Array-of-max-distances
+        OUTPUT:     Array of bounded edit-distances for each pair.
+    """
+    codes_1, lengths_1=_encode_strings(strings_1)
+    codes_2, lengths_2=_encode_strings(strings_2)
+    max_distances=np.asarray(max_distances, dtype=np.int32)
+    distances=np.where(lengths_1==0, np.minimum(lengths_2, max_distances+1), max_distances+1).astype(np.int32)
+    running=np.flatnonzero((lengths_1>0) & (np.abs(lengths_1-lengths_2)<=max_distances))
+    if running.size==0:
+        return distances
+
+    codes_1, lengths_1, lengths_2, max_distances=codes_1[running], lengths_1[running], lengths_2[running], max_distances[running]
+    width=int(lengths_2.max())
+    codes_2=codes_2[running, :width]
+    columns=np.arange(width+1, dtype=np.int32)
+    prev_row=np.broadcast_to(columns, (running.shape[0], width+1)).copy()
+    active=np.ones(running.shape[0], dtype=bool)
+    # The lower-bound at row i is at most i + |len_1 - len_2|, hence no pair can leave before this row
+    first_cutoff_row=int((max_distances-np.abs(lengths_1-lengths_2)).min())
+    for i in range(1, int(lengths_1.max())+1):
+        curr_row=np.empty_like(prev_row)
+        curr_row[:, 0]=i
+        np.minimum(prev_row[:, 1:]+1, prev_row[:, :-1]+(codes_1[:, i-1:i]!=codes_2), out=curr_row[:, 1:])
+        curr_row=np.minimum.accumulate(curr_row-columns, axis=1)+columns
+
+        finished=(lengths_1==i)
+        if finished.any():
+            # A pair which left without being compacted yet ends beyond its max-distance anyway
+            distances[running[finished]]=np.minimum(curr_row[np.flatnonzero(finished), lengths_2[finished]], max_distances[finished]+1)
+        active&=~finished
+        if i>first_cutoff_row and i%_CUTOFF_CHECK_INTERVAL==0:
+            # Every alignment passes through row i at some column j <= len(string-2), and needs at least |(len_1-i) - (len_2-j)| edits after it
+            lower_bounds=curr_row+np.abs((lengths_1-i)[:, None]-(lengths_2[:, None]-columns))
+            lower_bounds[columns>lengths_2[:, None]]=np.iinfo(np.int32).max
+            active&=(lower_bounds.min(axis=1)<=max_distances)
+        n_active=int(active.sum())
+        if n_active==0:
+            break
+        if n_active<_COMPACTION_RATIO*active.shape[0]:
+            # Compacting copies the rows, hence only once enough pairs have left
+            running, codes_1, lengths_1, lengths_2, max_distances=running[active], codes_1[active], lengths_1[active], lengths_2[active], max_distances[active]
+            width=int(lengths_2.max())
+            codes_2, curr_row, columns=codes_2[active, :width], curr_row[active, :width+1], columns[:width+1]
+            active=np.ones(running.shape[0], dtype=bool)
+        prev_row=curr_row
+    return distances
+
+
+
+def levenshtein_similarity_at_least(strings_1, strings_2, threshold):
+    """
+        DOCSTRING:  Same decision as levenshtein_similarity() >= threshold, computing only the bounded distances which can decide it:
+                    a pair passes if its distance is within floor((1 - threshold) * max(nchar(str1), nchar(str2))), hence bounded_levenshtein_distance()
+                    gets that bound + 1, and the similarity of a pair beyond it is below the threshold by at least 1/max-length.
+                    Blank strings never pass, and identical strings always pass without any distance computation.
+        INPUT:      Array-of-strings, Array-of-strings, Similarity-threshold
+        OUTPUT:     Boolean-array of the pairs with similarity >= threshold.
+    """
+    strings_1=np.asarray(strings_1, dtype=str)
+    strings_2=np.asarray(strings_2, dtype=str)
+    max_lengths=np.maximum(np.char.str_len(strings_1), np.char.str_len(strings_2))
+    blank_pairs=(strings_1=='') | (strings_2=='')
+    passed=(strings_1==strings_2) & ~blank_pairs
+    pending=np.flatnonzero(~blank_pairs & ~passed)
+    if pending.shape[0]>0:
+        max_distances=np.floor((1-threshold)*max_lengths[pending]).astype(np.int32)+1
+        distances=bounded_levenshtein_distance(strings_1[pending], strings_2[pending], max_distances)
+        passed[pending]=(1-distances/max_lengths[pending])>=threshold
+    return passed
+
+
+
+class SimilarityCache(object):
+    """
+        DOCSTRING:  LRU-bounded memo of the Levenshtein-similarity of pairs of distinct values, shared by all the minibatches and depths
+                    scored in this process (and by the countries scored in its threads). The similarity is symmetric, hence a pair is keyed
+                    in sorted order, and it does not depend on the column, hence one cache serves every factorized column.
+                    The bound is read from _SIMILARITY_CACHE_SIZE on every insert, so that it follows the runtime config.
+    """
+    def __init__(self):
+        self.similarities=OrderedDict()
+        self.lock=threading.Lock()
+        self.n_hits=0
+        self.n_misses=0
+
+    def similarity(self, values_1, values_2):
+        """
+            DOCSTRING:  Similarities of the pairs of values, computing only the pairs not in the cache (in one vectorized batch).
+            INPUT:      Array-of-strings, Array-of-strings
+            OUTPUT:     Array of similarity-scores for each pair.
+        """
+        keys=[(value_1, value_2) if value_1<=value_2 else (value_2, value_1) for value_1, value_2 in zip(values_1, values_2)]
+        similarities=np.empty(len(keys), dtype=np.float64)
+        missing=list()
+        with self.lock:
+            for k, key in enumerate(keys):
+                similarity=self.similarities.get(key)
+                if similarity is None:
+                    missing.append(k)
+                else:
+                    self.similarities.move_to_end(key)
+                    similarities[k]=similarity
+            self.n_hits+=len(keys)-len(missing)
+            self.n_misses+=len(missing)
+        if len(missing)>0:
+            similarities[missing]=levenshtein_similarity(np.asarray(values_1)[missing], np.asarray(values_2)[missing])
+            with self.lock:
+                for k in missing:
+                    self.similarities[keys[k]]=similarities[k]
+                while len(self.similarities)>config._SIMILARITY_CACHE_SIZE:
+                    self.similarities.popitem(last=False)
+        return similarities
+
+
+
+_SIMILARITY_CACHE = SimilarityCache()
+
+
+
+def factorize_score_columns(columns_1, columns_2, max_distinct_share=config._FACTORIZE_MAX_DISTINCT_SHARE):
+    """
+        DOCSTRING:  Factorizes the low-cardinality score-columns (eg. STATE, CITY, POSTAL_CODE) of both datasets into shared integer-codes,
+                    so that a batch of pairs is scored once per distinct pair of values instead of once per pair.
+                    A column is factorized only if its distinct values are at most max_distinct_share of its values; SITE_NAME rarely is.
+        INPUT:      Dict-of-arrays-of-first-dataset, Dict-of-arrays-of-second-dataset, Max-share-of-distinct-values
+        OUTPUT:     Dict of column-name to (Codes-of-first-dataset, Codes-of-second-dataset, Array-of-distinct-values).
+    """
+    factorized_columns=dict()
+    for colname in columns_1:
+        values=columns_1[colname] if columns_2 is columns_1 else np.concatenate([columns_1[colname], columns_2[colname]])
+        codes, uniques=pd.factorize(values)
+        if uniques.shape[0]>max_distinct_share*max(values.shape[0], 1):
+            continue
+        n_rows_1=columns_1[colname].shape[0]
+        factorized_columns[colname]=(codes[:n_rows_1], codes if columns_2 is columns_1 else codes[n_rows_1:], np.asarray(uniques, dtype=str))
+    return factorized_columns
+
+
+
+def cached_similarity(codes_1, codes_2, uniques, similarity_cache=_SIMILARITY_CACHE):
+    """
+        DOCSTRING:  Levenshtein-similarity of a batch of pairs of factorized values: each distinct pair of codes is looked up (or computed) once
+                    in the similarity-cache, and the similarities are broadcast back to the pairs.
+        INPUT:      Codes-of-first-values, Codes-of-second-values, Array-of-distinct-values, SimilarityCache
+        OUTPUT:     Array of similarity-scores for each pair.
+    """
+    pair_keys=codes_1.astype(np.int64)*uniques.shape[0]+codes_2
+    distinct_keys, inverse=np.unique(pair_keys, return_inverse=True)
+    return similarity_cache.similarity(uniques[distinct_keys//uniques.shape[0]], uniques[distinct_keys%uniques.shape[0]])[inverse]
+
+
+
+def generate_dedup_pairs(n_rows):
+    """
+        DOCSTRING:  Generates the n(n-1)/2 candidate-pairs of a single dataset, as positional-indexes (i < j).
+        INPUT:      Number-of-records
+        OUTPUT:     Array-of-positions-of-first-record, Array-of-positions-of-second-record
+    """
+    return np.triu_indices(n_rows, k=1)
+
+
+
+def generate_linkage_pairs(n_rows_1, n_rows_2):
+    """
+        DOCSTRING:  Generates the m*n candidate-pairs between two datasets, as positional-indexes.
+        INPUT:      Number-of-records-in-first-dataset, Number-of-records-in-second-dataset
+        OUTPUT:     Array-of-positions-in-first-dataset, Array-of-positions-in-second-dataset
+    """
+    positions_1=np.repeat(np.arange(n_rows_1), n_rows_2)
+    positions_2=np.tile(np.arange(n_rows_2), n_rows_1)
+    return positions_1, positions_2
+
+
+
+def _get_score_columns(df, thresholds_dict):
+    """
+        DOCSTRING:  Extracts the match-score relevant columns as arrays of strings; blank-cells (NaN after a csv round-trip) become ''.
+        INPUT:      Dataframe, Dict-of-column-thresholds
+        OUTPUT:     Dict of column-name to array-of-strings.
+    """
+    return {colname: df[colname].fillna('').astype(str).str.strip().values for colname in thresholds_dict}
+
+
+
+def _order_columns_by_cost(columns_1, columns_2, col_scales, factorized_columns=None):
+    """
+        DOCSTRING:  Orders the columns by the cost of their edit-distances (the longest value, which every string is padded to) per point of score,
+                    so that the cheap columns and the columns worth more points prune the pairs before the expensive ones are scored.
+                    The factorized columns are mostly cache look-ups, hence they come first.
+        INPUT:      Dict-of-arrays-of-first-dataset, Dict-of-arrays-of-second-dataset, Dict of column-name to score-points, Dict-of-factorized-columns
+        OUTPUT:     List of column-names, cheapest first.
+    """
+    def cost(colname):
+        if factorized_columns is not None and colname in factorized_columns:
+            return 0
+        longest=max(max((len(value) for value in columns[colname]), default=0) for columns in (columns_1, columns_2))
+        return longest/col_scales[colname]
+    return sorted(col_scales, key=cost)
+
+
+
+def score_candidate_pairs(columns_1, columns_2, positions_1, positions_2, thresholds_dict=config._THRESHOLDS_DICT, scaling_factor=config._SCALING_FACTOR, scaled_columns=config._SCALED_COLUMNS,
+                          total_matches_threshold=None, factorized_columns=None):
+    """
+        DOCSTRING:  Computes the Levenshtein-similarity of every relevant column for a batch of candidate-pairs, and converts it to a binary score:
+                    1 if the column-threshold is crossed (scaled-up by the scaling-factor for the scaled columns), else 0.
+                    If a total_matches_threshold is passed, the scoring is threshold-aware and only decides what can still matter:
+                        a. The columns are scored cheapest first: by their longest value per point of score, eg. STATE, POSTAL_CODE and CITY before
+                           CONCAT_ADDRESS (worth _SCALING_FACTOR points) and SITE_NAME.
+                        b. A pair is abandoned as soon as its total-score plus the scores of its remaining columns cannot reach the total-threshold.
+                        c. Each column-threshold is checked with a bounded, early-exit edit-distance (levenshtein_similarity_at_least()).
+                    The pairs reaching the total-threshold get the same scores either way; an abandoned pair keeps the partial total-score below the threshold.
+                    The columns in factorized_columns (see factorize_score_columns()) are scored through the similarity-cache, once per distinct pair of values.
+        INPUT:      Dict-of-arrays-of-first-dataset, Dict-of-arrays-of-second-dataset, Positions-in-first-dataset, Positions-in-second-dataset,
+                    Dict-of-column-thresholds, Scaling-factor, Columns-to-scale, Total-matches-threshold (optional), Dict-of-factorized-columns (optional)
+        OUTPUT:     Dict of score-colname to array-of-scores, Array-of-total-scores (NUM_OF_MATCHES_FOUND)
+    """
+    scores=dict()
+    total_scores=np.zeros(len(positions_1), dtype=np.int64)
+    factorized_columns=factorized_columns or dict()
+    col_scales={colname: scaling_factor if colname in scaled_columns else 1 for colname in thresholds_dict}
+    if total_matches_threshold is None:
+        for colname, col_threshold in thresholds_dict.items():
+            if colname in factorized_columns:
+                codes_1, codes_2, uniques=factorized_columns[colname]
+                similarities=cached_similarity(codes_1[positions_1], codes_2[positions_2], uniques)
+            else:
+                similarities=levenshtein_similarity(columns_1[colname][positions_1], columns_2[colname][positions_2])
+            scores[colname+'_COMPARISON_SCORE']=np.where(similarities>=col_threshold, col_scales[colname], 0)
+            total_scores+=scores[colname+'_COMPARISON_SCORE']
+        return scores, total_scores
+
+    for colname in thresholds_dict:
+        scores[colname+'_COMPARISON_SCORE']=np.zeros(len(positions_1), dtype=np.int64)
+    ordered_columns=_order_columns_by_cost(columns_1, columns_2, col_scales, factorized_columns)
+    remaining_max_score=sum(col_scales.values())
+    alive=np.arange(len(positions_1))
+    for colname in ordered_columns:
+        remaining_max_score-=col_scales[colname]
+        if colname in factorized_columns:
+            codes_1, codes_2, uniques=factorized_columns[colname]
+            passed=alive[cached_similarity(codes_1[positions_1[alive]], codes_2[positions_2[alive]], uniques)>=thresholds_dict[colname]]
+        else:
+            passed=alive[levenshtein_similarity_at_least(columns_1[colname][positions_1[alive]], columns_2[colname][positions_2[alive]], thresholds_dict[colname])]
+        scores[colname+'_COMPARISON_SCORE'][passed]=col_scales[colname]
+        total_scores[passed]+=col_scales[colname]
+        alive=alive[total_scores[alive]+remaining_max_score>=total_matches_threshold]
+        if alive.shape[0]==0:
+            break
+    return scores, total_scores
+
+
+
+def compute_score_features(country_df, country_df2=None, method=config._DEDUP_METHOD, thresholds_dict=config._THRESHOLDS_DICT, scaling_factor=config._SCALING_FACTOR,
+                           total_matches_threshold=config._TOTAL_MATCHES_THRESHOLD, pair_batch_size=config._PAIR_BATCH_SIZE, candidate_pairs=None, bounded_scoring=config._BOUNDED_SCORING,
+                           top_match_reducer=None, factorize_columns=config._FACTORIZE_SCORE_COLUMNS):
+    """
+        DOCSTRING:  In-process replacement of the Rscript hop: scores the candidate-pairs of a minibatch (Dedup) or of two master-datasets (Linkage)
+                    in vectorized batches of pairs, and keeps only the candidate-pairs with total-score greater than or equal to the total-threshold.
+                        a. Dedup:   n(n-1)/2 pairs; the later record is 'SR_NUM_1' and the earlier record is 'SR_NUM_2', same as the R-output.
+                        b. Linkage: m*n pairs; 'SR_NUM_1' comes from the first dataset and 'SR_NUM_2' from the second dataset.
+                    If candidate_pairs are passed (eg. from the blocking-stage), only those positional-pairs are scored instead of all the pairs.
+                    With bounded_scoring, the pairs are scored threshold-aware (see score_candidate_pairs()), with the same score-features.
+                    If a top_match_reducer is passed, the potential matches of every batch of pairs are fed into it instead of being collected,
+                    hence only the top-match per record is ever held in memory; the reducer is returned instead of the score-features.
+                    With factorize_columns, the low-cardinality columns are scored once per distinct pair of values (see factorize_score_columns()).
+        INPUT:      Dataframe-indexed-by-SR_NUM, Second-dataframe-indexed-by-SR_NUM (Linkage only), Dedup/Linkage-method, Dict-of-column-thresholds,
+                    Scaling-factor, Total-matches-threshold, Number-of-pairs-per-batch, (Positions-1, Positions-2)-of-candidate-pairs (optional), Flag-for-threshold-aware-scoring,
+                    TopMatchReducer (optional), Flag-for-factorized-scoring
+        OUTPUT:     Dataframe of score-features in the same format as /Raw_Scores/country_Score_Features.csv, or empty-dataframe if no potential matches;
+                    or the TopMatchReducer they were fed into.
+    """
+    try:
+        if method==config._DEDUP_METHOD:
+            country_df2=country_df
+            positions_1, positions_2=generate_dedup_pairs(country_df.shape[0]) if candidate_pairs is None else candidate_pairs
+            positions_1, positions_2=positions_2, positions_1
+        else:
+            positions_1, positions_2=generate_linkage_pairs(country_df.shape[0], country_df2.shape[0]) if candidate_pairs is None else candidate_pairs
+        print('\n{} candidate-pairs will be scored for {} using the Python engine.'.format(len(positions_1), method))
+
+        columns_1=_get_score_columns(country_df, thresholds_dict)
+        columns_2=columns_1 if country_df2 is country_df else _get_score_columns(country_df2, thresholds_dict)
+        factorized_columns=factorize_score_columns(columns_1, columns_2) if factorize_columns else dict()
+        ids_1=country_df.index.values
+        ids_2=country_df2.index.values
+
+        score_batches=list()
+        for start in range(0, len(positions_1), pair_batch_size):
+            batch_1=positions_1[start : start+pair_batch_size]
+            batch_2=positions_2[start : start+pair_batch_size]
+            scores, total_scores=score_candidate_pairs(columns_1, columns_2, batch_1, batch_2, thresholds_dict=thresholds_dict, scaling_factor=scaling_factor,
+                                                       total_matches_threshold=total_matches_threshold if bounded_scoring else None, factorized_columns=factorized_columns)
+            is_potential_match=(total_scores>=total_matches_threshold)
+            if not is_potential_match.any():
+                continue
+            batch_df=pd.DataFrame({colname: col_scores[is_potential_match] for colname, col_scores in scores.items()})
+            batch_df['SR_NUM_1']=ids_1[batch_1[is_potential_match]]
+            batch_df['SR_NUM_2']=ids_2[batch_2[is_potential_match]]
+            batch_df['NUM_OF_MATCHES_FOUND']=total_scores[is_potential_match]
+            batch_df=apply_cross_ref_schema(batch_df)
+            if top_match_reducer is None:
+                score_batches.append(batch_df)
+            else:
+                top_match_reducer.add(batch_df[_SCORE_FEATURES_COLUMNS])
+
+        if top_match_reducer is not None:
+            print('{} candidate-pairs have total-score >= {}.'.format(top_match_reducer.n_pairs, total_matches_threshold))
+            return top_match_reducer
+
+        if len(score_batches)==0:
+            print('No potential matches found in the incoming dataset(s)!')
+            return pd.DataFrame(columns=_SCORE_FEATURES_COLUMNS)
+        score_features=pd.concat(score_batches, ignore_index=True)[_SCORE_FEATURES_COLUMNS]
+        print('{} candidate-pairs have total-score >= {}.'.format(score_features.shape[0], total_matches_threshold))
+        return score_features
+    except Exception as e:
+        print('\nSomething went wrong while computing the score-features using the Python engine for the {} method.'.format(method))
+        print(e)
@@ -0,0 +1,223 @@
+import numpy as np, pandas as pd, os
+from config import *
+from utils.util_functions import *
+from utils.blocking import compute_blocking_keys
+from utils.batch_sizing import choose_minibatch_size_for_widths
+from utils.instrumentation import *
+from utils.recursive_pipeline import score_and_normalize_duplicates
+
+
+# Columns of the cross-references in the order of generate_dummy_cross_refs_for_masters(), and their Spark types
+_CROSS_REF_COLUMNS = ['SR_NUM_1', 'SR_NUM_2'] + config._COLS_FOR_TOTAL_MATCH_CALC + ['COUNTRY', 'NUM_OF_MATCHES_FOUND']
+_SCORE_COLUMNS = config._COLS_FOR_TOTAL_MATCH_CALC + ['NUM_OF_MATCHES_FOUND']
+_CLEANED_SUFFIX = '_CLEANED' # The cleaned variant of a match-score relevant column travels next to its original-info
+
+
+
+def get_spark_session(spark_master=config._SPARK_MASTER, app_name=config._SPARK_APP_NAME):
+    """
+        DOCSTRING:  Spark-session of the partitioned execution mode; pyspark (and pyarrow, for the pandas-UDFs) are only imported here.
+        INPUT:      Spark-master-URL (eg. local[*], spark://host:7077 or yarn), Application-name
+        OUTPUT:     SparkSession.
+    """
+    from pyspark.sql import SparkSession
+    return SparkSession.builder.master(spark_master).appName(app_name).config('spark.sql.execution.arrow.pyspark.enabled', 'true').getOrCreate()
+
+
+
+def _config_values():
+    """
+        DOCSTRING:  Snapshot of the runtime config, shipped with the pandas-UDFs so that the executors score with the config of the driver.
+    """
+    return {config_name: getattr(config, config_name) for config_name in dir(config) if config_name.startswith('_') and not config_name.startswith('__')}
+
+
+
+def _apply_config_values(config_values):
+    for config_name, config_value in config_values.items():
+        setattr(config, config_name, config_value)
+    # The executors have no stage-trace of their own (the Spark UI times the tasks), nor a staging-area
+    config._STAGE_TRACE_FORMAT=None
+    config._SCORING_ENGINE=config._PYTHON_ENGINE
+
+
+
+def _display_columns(std_cols_order=config._STD_COLS_ORDER, fields_to_concat=config._FIELDS_TO_CONCAT):
+    """
+        DOCSTRING:  Columns of the original-info after concat_fields(), in the same order.
+    """
+    concatenated_fields=[field for cols_to_concat in fields_to_concat.values() for field in cols_to_concat]
+    return ['COUNTRY']+[colname for colname in std_cols_order if colname not in concatenated_fields]+list(fields_to_concat)
+
+
+
+def prepare_records_spark(spark, source_file_name, partition_pass=config._SPARK_PARTITION_PASS):
+    """
+        DOCSTRING:  Reads the standardized csv into Spark, and pre-processes and cleans it batch by batch on the executors (mapInPandas),
+                    with the same preprocess_dataframe() and clean_dataframe_variants() as the pandas pipeline.
+                    Every record keeps its original-info, the cleaned match-score relevant columns (suffixed _CLEANED) and its PARTITION_KEY:
+                    the key of partition_pass (a blocking-pass), '' without one or for a record with a blank key.
+        INPUT:      SparkSession, Abs-path-of-standardized-csv, Blocking-pass-partitioning-the-records (optional)
+        OUTPUT:     Spark-Dataframe of the prepared records.
+    """
+    from pyspark.sql import functions as F, types as T
+    display_columns=_display_columns()
+    schema=T.StructType([T.StructField('SR_NUM', T.LongType())]+[T.StructField(colname, T.StringType()) for colname in display_columns]
+                        +[T.StructField(colname+_CLEANED_SUFFIX, T.StringType()) for colname in config._THRESHOLDS_DICT]+[T.StructField('PARTITION_KEY', T.StringType())])
+    config_values=_config_values()
+
+    def prepare_batches(batches):
+        _apply_config_values(config_values)
+        for batch_df in batches:
+            batch_df=preprocess_dataframe(batch_df.set_index('SR_NUM'))
+            cleaned_df, display_df=clean_dataframe_variants(batch_df, columns_to_clean=config._COLUMNS_TO_CLEAN, fields_to_concat=config._FIELDS_TO_CONCAT)
+            # Spark-strings from the categoricals and arrow-strings of the record-schema
+            prepared_df=display_df[display_columns].astype(str)
+            for colname in config._THRESHOLDS_DICT:
+                prepared_df[colname+_CLEANED_SUFFIX]=cleaned_df[colname].values
+            prepared_df['PARTITION_KEY']='' if partition_pass is None else compute_blocking_keys(cleaned_df, partition_pass).fillna('').values
+            yield prepared_df.reset_index()
+
+    raw_sdf=spark.read.options(header=True, inferSchema=False).csv(source_file_name)
+    raw_sdf=raw_sdf.withColumn('SR_NUM', F.col(raw_sdf.columns[0]).cast('long')).select(['SR_NUM', 'COUNTRY']+config._STD_COLS_ORDER)
+    return raw_sdf.mapInPandas(prepare_batches, schema=schema)
+
+
+
+def _score_dtype():
+    return config._SCORE_DTYPE if config._COMPACT_DTYPES else 'float64'
+
+
+
+def _cross_ref_schema():
+    from pyspark.sql import types as T
+    score_type={'int8': T.ByteType(), 'int16': T.ShortType(), 'int32': T.IntegerType(), 'float32': T.FloatType()}.get(_score_dtype(), T.DoubleType())
+    return T.StructType([T.StructField(colname, T.LongType() if colname in ('SR_NUM_1', 'SR_NUM_2') else T.StringType() if colname=='COUNTRY' else score_type)
+                         for colname in _CROSS_REF_COLUMNS]+[T.StructField('GROUP', T.StringType()), T.StructField('NODE', T.LongType())])
+
+
+
+def masterize_spark_node(node_df, depth, thresholds_dict=config._THRESHOLDS_DICT):
+    """
+        DOCSTRING:  One node of the recursive-tree on a Spark executor: the records of one (GROUP, NODE), with the cleaned match-score relevant columns.
+                        a. Depth-zero:  deduplicates the minibatch.
+                        b. Depth-j:     links the masters of its two children (SIDE 0 and 1); a node with a single child carries it over.
+                    Scores through the same score_and_normalize_duplicates() as the pandas pipeline, but builds the cross-references without any report-files.
+        INPUT:      Dataframe of SR_NUM, COUNTRY, GROUP, NODE, SIDE and the cleaned match-score relevant columns, Depth, Dict-of-column-thresholds
+        OUTPUT:     Dataframe-of-cross-references of the node (_CROSS_REF_COLUMNS, GROUP, NODE), a row per record; the masters point to themselves.
+    """
+    curr_country, group, node=node_df['COUNTRY'].iloc[0], node_df['GROUP'].iloc[0], int(node_df['NODE'].iloc[0])
+    file_prefix='{}_d{}_{}'.format(group.replace('|', '_').strip('_'), depth, node)
+    country_df=node_df.set_index('SR_NUM')[list(thresholds_dict)]
+    normalized_duplicates=None
+    if depth==0 and country_df.shape[0]>1:
+        normalized_duplicates=score_and_normalize_duplicates(country_df=country_df, curr_country=curr_country, file_prefix=file_prefix, method=config._DEDUP_METHOD)
+    elif depth>0 and node_df['SIDE'].nunique()>1:
+        is_second=(node_df['SIDE'].values==1)
+        normalized_duplicates=score_and_normalize_duplicates(country_df=country_df[~is_second], country_df2=country_df[is_second], curr_country=curr_country, file_prefix=file_prefix,
+                                                             method=config._LINKAGE_METHOD)
+
+    if normalized_duplicates is not None and normalized_duplicates.shape[0]!=0:
+        master_record_ids=get_deduplicated_master_records(normalized_duplicates=normalized_duplicates, country_df=country_df)
+        cross_ref_df=generate_dummy_cross_refs_for_masters(master_record_ids=master_record_ids, curr_country=curr_country)
+        cross_ref_df=generate_final_cross_refs(cross_ref_df=cross_ref_df, normalized_duplicates=normalized_duplicates, curr_country=curr_country, write_csv=False)
+    else:
+        cross_ref_df=generate_dummy_cross_refs_for_masters(master_record_ids=country_df.index.values, curr_country=curr_country)
+    cross_ref_df=cross_ref_df[_CROSS_REF_COLUMNS].copy()
+    cross_ref_df[_SCORE_COLUMNS]=cross_ref_df[_SCORE_COLUMNS].astype(_score_dtype())
+    cross_ref_df['COUNTRY']=cross_ref_df['COUNTRY'].astype(str)
+    cross_ref_df['GROUP']=group
+    cross_ref_df['NODE']=node
+    return cross_ref_df
+
+
+
+def _node_function(config_values, depth):
+    """
+        DOCSTRING:  The pandas-UDF of one depth; it takes the node-dataframe only, since Spark passes the group-key too to a function of two arguments.
+    """
+    def masterize_node(node_df):
+        _apply_config_values(config_values)
+        return masterize_spark_node(node_df, depth)
+    return masterize_node
+
+
+
+def repoint_cross_refs_spark(entire_cross_ref_sdf, depth_cross_ref_sdf):
+    """
+        DOCSTRING:  Spark equivalent of CrossRefStore.repoint(): every master merged at this depth takes the cross-ref of its link to the new master,
+                    and its children are re-pointed to the new master, keeping their own scores.
+        INPUT:      Spark-Dataframe-of-entire-cross-references, Spark-Dataframe-of-cross-references-at-new-depth
+        OUTPUT:     Spark-Dataframe of the updated entire cross-references.
+    """
+    from pyspark.sql import functions as F
+    merged_sdf=depth_cross_ref_sdf.filter(F.col('SR_NUM_1')!=F.col('SR_NUM_2')).select(_CROSS_REF_COLUMNS)
+    merged_links=merged_sdf.select([F.col(colname).alias('MERGED_'+colname) for colname in _CROSS_REF_COLUMNS if colname!='COUNTRY'])
+    new_masters=merged_sdf.select(F.col('SR_NUM_1').alias('OLD_MASTER'), F.col('SR_NUM_2').alias('NEW_MASTER'))
+    joined_sdf=entire_cross_ref_sdf.join(merged_links, entire_cross_ref_sdf['SR_NUM_1']==merged_links['MERGED_SR_NUM_1'], 'left') \
+                                   .join(new_masters, F.col('SR_NUM_2')==F.col('OLD_MASTER'), 'left')
+    return joined_sdf.select(['SR_NUM_1', F.coalesce('MERGED_SR_NUM_2', 'NEW_MASTER', 'SR_NUM_2').alias('SR_NUM_2')]
+                             +[F.coalesce('MERGED_'+colname, colname).alias(colname) for colname in config._COLS_FOR_TOTAL_MATCH_CALC]
+                             +['COUNTRY', F.coalesce('MERGED_NUM_OF_MATCHES_FOUND', 'NUM_OF_MATCHES_FOUND').alias('NUM_OF_MATCHES_FOUND'), 'GROUP'])
+
+
+
+def masterize_countries_spark(spark, records_sdf, output_dir=config._SPARK_OUTPUT_DIRECTORY):
+    """
+        DOCSTRING:  Partitioned execution of the recursive-tree on Spark, for all countries at once; the records never leave Spark:
+                        a. The records are grouped by COUNTRY and PARTITION_KEY (see prepare_records_spark()), and every group is cut into minibatches
+                           (NODE) of _MAXSIZE records, or with _ADAPTIVE_BATCH_SIZING as many as fit in _NODE_MEMORY_BUDGET_MB for the widest fields.
+                           With _USE_LSH and _LSH_SINGLE_PASS, every group is one minibatch.
+                        b. Depth-zero deduplicates every (GROUP, NODE) as a grouped pandas-UDF task (masterize_spark_node()).
+                        c. Every following depth links the masters of the nodes 2k and 2k+1 of each group, until every group has a single node.
+                           The merges are applied to the entire cross-references with joins (repoint_cross_refs_spark()).
+                        d. Writes the Master (original-info) and the Raw-Cross-Ref as Parquet, partitioned by COUNTRY, into output_dir.
+                    Each depth is checkpointed locally, so that the query-plan does not grow with the depth.
+        INPUT:      SparkSession, Spark-Dataframe-of-prepared-records, Output-directory (any path Spark can write to, eg. hdfs:// or s3a://)
+        OUTPUT:     Spark-Dataframe-of-masters, Spark-Dataframe-of-cross-references.
+    """
+    from pyspark.sql import functions as F, Window
+    config_values=_config_values()
+    cleaned_columns=[F.col(colname+_CLEANED_SUFFIX).alias(colname) for colname in config._THRESHOLDS_DICT]
+    records_sdf=records_sdf.withColumn('GROUP', F.concat_ws('|', 'COUNTRY', 'PARTITION_KEY')).persist()
+
+    if config._USE_LSH and config._LSH_SINGLE_PASS:
+        maxsize=None
+    elif config._ADAPTIVE_BATCH_SIZING:
+        field_widths=records_sdf.agg(*[F.max(F.length(colname+_CLEANED_SUFFIX)).alias(colname) for colname in config._THRESHOLDS_DICT]).first().asDict()
+        maxsize, sizing_report=choose_minibatch_size_for_widths({colname: width or 0 for colname, width in field_widths.items()}, np.iinfo(np.int64).max,
+                                                                node_memory_budget_mb=config._NODE_MEMORY_BUDGET_MB, min_maxsize=config._MIN_ADAPTIVE_MAXSIZE,
+                                                                max_maxsize=config._MAX_ADAPTIVE_MAXSIZE)
+        print('\nAdaptive batch-sizing within {} MB per node: {}'.format(config._NODE_MEMORY_BUDGET_MB, sizing_report))
+    else:
+        maxsize=config._MAXSIZE
+    node_column=F.lit(0).cast('long') if maxsize is None else ((F.row_number().over(Window.partitionBy('GROUP').orderBy('SR_NUM'))-1)/maxsize).cast('long')
+    nodes_sdf=records_sdf.select(['SR_NUM', 'COUNTRY', 'GROUP']+cleaned_columns).withColumn('NODE', node_column).withColumn('SIDE', F.lit(0))
+
+    depth=0
+    while True:
+        with stage('spark_depth', depth=depth) as stage_event:
+            depth_cross_ref_sdf=nodes_sdf.groupBy('GROUP', 'NODE').applyInPandas(_node_function(config_values, depth), schema=_cross_ref_schema()).localCheckpoint(eager=True)
+            if depth==0:
+                entire_cross_ref_sdf=depth_cross_ref_sdf.drop('NODE')
+            else:
+                entire_cross_ref_sdf=repoint_cross_refs_spark(entire_cross_ref_sdf, depth_cross_ref_sdf).localCheckpoint(eager=True)
+            masters_sdf=depth_cross_ref_sdf.filter(F.col('SR_NUM_1')==F.col('SR_NUM_2')).select(F.col('SR_NUM_1').alias('SR_NUM'), 'GROUP', 'NODE')
+            max_node=masters_sdf.agg(F.max('NODE')).first()[0]
+            stage_event['OUTPUT_ROWS']=masters_sdf.count()
+        print('\nDepth[{}] processed on Spark: {} masters remain, in up to {} nodes per group.'.format(depth, stage_event['OUTPUT_ROWS'], (max_node or 0)+1))
+        if max_node is None or max_node==0:
+            break
+        depth+=1
+        # The nodes 2k and 2k+1 of a group become the sides of node k at the next depth
+        nodes_sdf=masters_sdf.join(records_sdf.select(['SR_NUM', 'COUNTRY']+cleaned_columns), on='SR_NUM') \
+                             .withColumn('SIDE', (F.col('NODE')%2).cast('int')).withColumn('NODE', (F.col('NODE')/2).cast('long'))
+
+    with stage('report_writing', backend='Parquet'):
+        country_master_sdf=records_sdf.join(masters_sdf.select('SR_NUM'), on='SR_NUM').select(['SR_NUM']+_display_columns())
+        entire_cross_ref_sdf=entire_cross_ref_sdf.select(_CROSS_REF_COLUMNS)
+        country_master_sdf.write.mode('overwrite').partitionBy('COUNTRY').parquet(os.path.join(output_dir, 'Master'))
+        entire_cross_ref_sdf.write.mode('overwrite').partitionBy('COUNTRY').parquet(os.path.join(output_dir, 'Raw_Cross_Ref'))
+    print('\nWrote the Master and Raw-Cross-Ref of all countries as Parquet into {}'.format(output_dir))
+    records_sdf.unpersist()
+    return country_master_sdf, entire_cross_ref_sdf
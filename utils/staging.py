@@ -0,0 +1,175 @@
+import pandas as pd, os, threading
+from concurrent.futures import ThreadPoolExecutor
+from config import *
+from utils.util_functions import write_df_to_csv
+from utils.dtype_schema import apply_record_schema
+from utils.background_io import submit_background_write, wait_for_background_write, fsync_file
+
+
+
+class StagedMaster(object):
+    """
+        DOCSTRING:  Handle of a master-dataset held in memory by the InMemoryStagingBackend. It travels with the dataframe between the worker-processes,
+                    and prints as its staging-name so that the queue of staged masters stays readable in the logs.
+    """
+    def __init__(self, name, df):
+        self.name=name
+        self.df=df
+
+    def __repr__(self):
+        return self.name
+
+
+
+class InMemoryStagingBackend(object):
+    """
+        DOCSTRING:  Keeps the intermediate master-datasets of the recursive-tree in memory with their dtypes; nothing is written to the staging-area.
+    """
+    def stage(self, df, curr_country, file_suffix):
+        return StagedMaster(curr_country+file_suffix, df)
+
+    def load(self, handle):
+        return handle.df
+
+    def row_count(self, handle):
+        return handle.df.shape[0]
+
+    def prefetch(self, handle):
+        pass
+
+    def discard(self, handle):
+        handle.df=None
+
+
+
+class CsvStagingBackend(object):
+    """
+        DOCSTRING:  Writes the intermediate master-datasets as csv files into the staging-area, and re-reads them at the next depth.
+                    Slowest backend, but the files can be inspected; required by the R scoring-engine.
+                    The files are written by the BackgroundWriter, and load() waits for its file; prefetch() starts reading a staged master in a
+                    background-thread (eg. the next merge-pair's, while the current one is scored), and load() picks it up from there.
+                    With _COMPACT_DTYPES, the cells are re-read as strings (keeping eg. the leading zeros of POSTAL_CODE) and get the record-schema back.
+    """
+    file_extension='.csv'
+
+    def __init__(self, root_dir=config._STAGING_AREA_DIRECTORY):
+        self.root_dir=root_dir
+
+    def abs_path(self, handle):
+        return os.path.join(self.root_dir, handle)
+
+    def stage(self, df, curr_country, file_suffix):
+        write_df_to_csv(df=df, root_dir=self.root_dir, curr_country=curr_country, file_suffix=file_suffix+self.file_extension, index_flag=True, background=True)
+        return curr_country+file_suffix+self.file_extension
+
+    def prefetch(self, handle):
+        if not hasattr(self, 'prefetched'):
+            self.prefetched, self.prefetch_lock, self.prefetch_executor=dict(), threading.Lock(), ThreadPoolExecutor(max_workers=1, thread_name_prefix='StagingPrefetch')
+        with self.prefetch_lock:
+            if handle not in self.prefetched:
+                self.prefetched[handle]=self.prefetch_executor.submit(self._read, handle)
+
+    def load(self, handle):
+        future=None
+        if hasattr(self, 'prefetched'):
+            with self.prefetch_lock:
+                future=self.prefetched.pop(handle, None)
+        return self._read(handle) if future is None else future.result()
+
+    def _read(self, handle):
+        wait_for_background_write(self.abs_path(handle))
+        if config._COMPACT_DTYPES:
+            return apply_record_schema(pd.read_csv(self.abs_path(handle), index_col=0, dtype=str, keep_default_na=False))
+        return pd.read_csv(self.abs_path(handle), index_col=0)
+
+    def row_count(self, handle):
+        # Parses the SR_NUM column only, since the merge-schedule counts the rows of every staged master at each depth
+        wait_for_background_write(self.abs_path(handle))
+        return pd.read_csv(self.abs_path(handle), usecols=[0]).shape[0]
+
+    def discard(self, handle):
+        if hasattr(self, 'prefetched'):
+            with self.prefetch_lock:
+                self.prefetched.pop(handle, None)
+
+    def __getstate__(self):
+        # The backend travels to the worker-processes, but its prefetch-thread and prefetched masters stay in this process
+        return {name: value for name, value in self.__dict__.items() if name not in ('prefetched', 'prefetch_lock', 'prefetch_executor')}
+
+
+
+class ArrowStagingBackend(CsvStagingBackend):
+    """
+        DOCSTRING:  Spills the intermediate master-datasets to the staging-area in a columnar binary format, preserving their dtypes:
+                        a. 'feather':   uncompressed Arrow IPC files, read back through a memory-map without parsing.
+                        b. 'parquet':   compressed Parquet files, smaller on disk for very large masters.
+                    Requires the optional pyarrow package.
+    """
+    def __init__(self, root_dir=config._STAGING_AREA_DIRECTORY, file_format='feather'):
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError('The {} staging-backend requires the pyarrow package: pip install pyarrow'.format(file_format))
+        self.root_dir=root_dir
+        self.file_format=file_format
+        self.file_extension='.arrow' if file_format=='feather' else '.parquet'
+
+    def stage(self, df, curr_country, file_suffix):
+        abs_path=os.path.join(self.root_dir, curr_country+file_suffix+self.file_extension)
+        submit_background_write(abs_path, self._write, df, abs_path)
+        return curr_country+file_suffix+self.file_extension
+
+    def _write(self, df, abs_path):
+        from pyarrow import feather
+        # Arrow files need a default index, hence SR_NUM is stored as a regular column
+        df=df.reset_index()
+        with open(abs_path, 'wb') as arrow_file:
+            if self.file_format=='feather':
+                feather.write_feather(df, arrow_file, compression='uncompressed')
+            else:
+                df.to_parquet(arrow_file, index=False)
+            fsync_file(arrow_file)
+        print('\nSuccessfully created \\{}!'.format(abs_path))
+
+    def _read(self, handle):
+        from pyarrow import feather, parquet
+        wait_for_background_write(self.abs_path(handle))
+        if self.file_format=='feather':
+            table=feather.read_table(self.abs_path(handle), memory_map=True)
+        else:
+            table=parquet.read_table(self.abs_path(handle), memory_map=True)
+        df=table.to_pandas()
+        # Arrow keeps the categoricals, but its strings come back as python-objects
+        return apply_record_schema(df.set_index(df.columns[0]))
+
+    def row_count(self, handle):
+        from pyarrow import ipc, parquet
+        wait_for_background_write(self.abs_path(handle))
+        if self.file_format=='feather':
+            with ipc.open_file(self.abs_path(handle)) as reader:
+                return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+        return parquet.ParquetFile(self.abs_path(handle)).metadata.num_rows
+
+    def discard(self, handle):
+        super(ArrowStagingBackend, self).discard(handle)
+        wait_for_background_write(self.abs_path(handle))
+        if os.path.exists(self.abs_path(handle)):
+            os.remove(self.abs_path(handle))
+
+
+
+def get_staging_backend(backend_name=config._STAGING_BACKEND, root_dir=config._STAGING_AREA_DIRECTORY):
+    """
+        DOCSTRING:  Factory for the staging-backend of the intermediate master-datasets in the recursive-tree.
+        INPUT:      Name-of-backend (_MEMORY_STAGING, _ARROW_STAGING, _PARQUET_STAGING or _CSV_STAGING), Staging-directory
+        OUTPUT:     Staging-backend object with stage(), load(), prefetch(), row_count() and discard() methods.
+    """
+    if backend_name==config._MEMORY_STAGING:
+        return InMemoryStagingBackend()
+    elif backend_name==config._ARROW_STAGING:
+        return ArrowStagingBackend(root_dir=root_dir, file_format='feather')
+    elif backend_name==config._PARQUET_STAGING:
+        return ArrowStagingBackend(root_dir=root_dir, file_format='parquet')
+    elif backend_name==config._CSV_STAGING:
+        return CsvStagingBackend(root_dir=root_dir)
+    raise ValueError('Unknown staging-backend: {}'.format(backend_name))
@@ -1,31 +1,50 @@
 import numpy as np, pandas as pd, re, string, os
-from pyspark.sql import SparkSession
 from subprocess import Popen, PIPE
 from config import *
+from utils.dtype_schema import *
+from utils.background_io import *
 
 
-def write_df_to_csv(df, root_dir='', curr_country='', file_suffix='_temp.csv', index_flag=False):
+# Translate-table deleting the special-chars, equivalent to the regex-replace of [string.punctuation] but without the regex-engine
+_PUNCTUATION_TRANSLATE_TABLE = str.maketrans('', '', string.punctuation)
+
+
+def write_df_to_csv(df, root_dir='', curr_country='', file_suffix='_temp.csv', index_flag=False, background=False):
     """
-        DOCSTRING:  Writes the dataframe to a csv file and throw error if it fails.
-        INPUT:      Dataframe, Target-Directory, Country-name, Suffix-of-csv-file, Index-Flag
+        DOCSTRING:  Writes the dataframe to a csv file (fsync-ed with _FSYNC_WRITES) and throw error if it fails.
+                    With background, the write is queued on the BackgroundWriter and the error is raised by its next submit, wait or flush instead.
+        INPUT:      Dataframe, Target-Directory, Country-name, Suffix-of-csv-file, Index-Flag, Flag-for-background-write
         OUTPUT:     Dataframe csv at target-directory, or error.
     """
+    abs_path=os.path.join(root_dir, curr_country+file_suffix)
+    if background:
+        submit_background_write(abs_path, _write_csv_file, df, abs_path, index_flag)
+    else:
+        _write_csv_file(df, abs_path, index_flag)
+
+
+
+def _write_csv_file(df, abs_path, index_flag):
     try:
-        abs_path=os.path.join(root_dir, curr_country+file_suffix)
-        df.to_csv(abs_path, index=index_flag)
-        print('\nSuccessfully created \{}!'.format(abs_path))
-    except:
-        print('\nSomething went wrong while writing the file. Please check if it is currently in use.')
+        with open(abs_path, 'w', newline='') as csv_file:
+            df.to_csv(csv_file, index=index_flag)
+            fsync_file(csv_file)
+        print('\nSuccessfully created \\{}!'.format(abs_path))
+    except Exception:
+        print('\nSomething went wrong while writing {}. Please check if it is currently in use.'.format(abs_path))
+        raise
 
 
 
 def preformat_input_using_sparksql():
     """
         DOCSTRING:  Reads the raw csv of open-source data and wrangles it to a standardized format as per the algorithm's required structure.
+                    Requires the optional pyspark package; preformat_input_natively() produces the same file without a Spark JVM.
         INPUT:      
-        OUTPUT:     Dataframe csv at target-directory, or error.
+        OUTPUT:     Dataframe csv at target-directory. Re-raises any error, so that a caller never goes on with a stale file.
     """
     try:
+        from pyspark.sql import SparkSession
         spark = SparkSession.builder.master('local[1]').appName('TempSession.com').getOrCreate()
         df = spark.read.options(header=True, inferSchema=True).csv(config._RAW_STATIC_FILE_NAME)
         sparksql_view = 'DM_TEMP'
@@ -36,7 +55,7 @@ def preformat_input_using_sparksql():
         query = query[:-1] + ' from {}'.format(sparksql_view)
         df = spark.sql(query)
         df.createOrReplaceTempView(sparksql_view)
-        query = 'SELECT 100001+ROW_NUMBER() OVER (ORDER BY  POSTAL_CODE, STATE, CITY, SITE_NAME, ADDRESS_LINE_1) SR_NUM, "{}" as COUNTRY,'.format(config._RAW_COUNTRY)
+        query = 'SELECT 100001+ROW_NUMBER() OVER (ORDER BY  {}) SR_NUM, "{}" as COUNTRY,'.format(', '.join(config._PREFORMAT_SORT_KEYS), config._RAW_COUNTRY)
         for col_name in config._STD_COLS_ORDER:
             query += ' {},'.format(col_name)
         query = query[:-1] + ' from {}'.format(sparksql_view)
@@ -44,34 +63,78 @@ def preformat_input_using_sparksql():
         df = df.toPandas()
         write_df_to_csv(df=df, file_suffix=config._STATIC_FILE_NAME)
         spark.stop()
-    except Exception as e:
+    except Exception:
         print('\nSomething went wrong while pre-formatting the input data. Please check if the file is currently in use.')
-        print(e)
-    finally:
+        raise
+    else:
         print('\nStandardized the input data columns, and sorted them to ensure better compression-statistics!\n{} is now ready to be processed by the algorithm.'.format(config._STATIC_FILE_NAME))
 
 
 
+def map_unique_values(series, function, na_value=np.nan):
+    """
+        DOCSTRING:  Applies a python-function once per distinct value of a column, and broadcasts the results back with the factorized codes.
+                    Location-columns (STATE, CITY, POSTAL_CODE, COUNTRY, ...) repeat heavily, hence most cells are never touched by the python-function.
+        INPUT:      Series, Function-of-one-value, Value-for-missing-cells
+        OUTPUT:     Series of mapped values, with the same index.
+    """
+    codes, uniques=pd.factorize(series)
+    mapped_values=np.array([function(value) for value in uniques]+[na_value], dtype=object)
+    return pd.Series(mapped_values[codes], index=series.index, name=series.name)
+
+
+
 def preprocess_dataframe(df):
     """
         DOCSTRING:  Imputes blank cells with '', replaces whitespace with underscore in country-name, and strips whitespace in cells.
+                    Each distinct value of a column is processed once, see map_unique_values().
+                    The columns then get the compact record-schema, see apply_record_schema().
         INPUT:      Dataframe
         OUTPUT:     Imputed and cleaned dataframe.
     """
     try:
         df_copy=df.copy(deep=True)
-        df_copy.replace(np.nan, '', inplace=True)
         for colname in df_copy.columns.values:
             if colname=='COUNTRY':
-                df_copy[colname]=df_copy[colname].apply(lambda x: x.replace(' ','_'))            
-            df_copy[colname]=df_copy[colname].astype(str).apply(lambda x: x.strip())
-        return df_copy
+                df_copy[colname]=map_unique_values(df_copy[colname], lambda value: str(value.replace(' ','_')).strip(), na_value='')
+            else:
+                df_copy[colname]=map_unique_values(df_copy[colname], lambda value: str(value).strip(), na_value='')
+        return apply_record_schema(df_copy)
     except Exception as e:
         print('\nSomething went wrong while pre-processing the input data.')
         print(e)
 
 
 
+def clean_text_columns(df, columns_to_clean):
+    """
+        DOCSTRING:  Deletes the special-chars and lowercases the cells of the given columns, once per distinct value of each column.
+        INPUT:      Dataframe, columns-to-clean
+        OUTPUT:     Dataframe with the cleaned columns.
+    """
+    cleaned_df=df.copy()
+    for colname in columns_to_clean:
+        if colname in cleaned_df.columns:
+            cleaned_df[colname]=map_unique_values(cleaned_df[colname], lambda value: value.translate(_PUNCTUATION_TRANSLATE_TABLE).lower())
+    return cleaned_df
+
+
+
+def concat_fields(df, fields_to_concat):
+    """
+        DOCSTRING:  Generates the concatenated fields (eg. CONCAT_ADDRESS) by adding whole string-columns, instead of a row-wise join, and drops the individual ones.
+        INPUT:      Dataframe, address-fields-to-concat
+        OUTPUT:     Dataframe with the concatenated fields.
+    """
+    concat_df=df.copy()
+    for colname, cols_to_concat in fields_to_concat.items():
+        concat_series=concat_df[cols_to_concat[0]].astype(str)
+        for field in cols_to_concat[1:]:
+            concat_series=concat_series+concat_df[field].astype(str)
+        concat_df[colname]=concat_series
+    return concat_df.drop(labels=[field for cols_to_concat in fields_to_concat.values() for field in cols_to_concat], axis=1)
+
+
 
 def clean_dataframe(df, columns_to_clean=config._COLUMNS_TO_CLEAN, fields_to_concat=config._FIELDS_TO_CONCAT, replace_punctuations=True):
     """
@@ -82,18 +145,36 @@ def clean_dataframe(df, columns_to_clean=config._COLUMNS_TO_CLEAN, fields_to_con
         OUTPUT:     Imputed and cleaned dataframe.
     """
     try:
-        copy_df=df.copy(deep=True)
         # Added another special character which was causing Italy CSV file read to fail in R
         if replace_punctuations:
-            special_chars=re.escape(string.punctuation)+''
-            print('\nSpecial Character that will be replaced are:  {}'.format(special_chars))
-        for colname in copy_df.columns.values:
-            if colname in columns_to_clean and replace_punctuations:
-                copy_df[colname]=copy_df[colname].replace(r'['+special_chars+']', '', regex=True).str.lower()
+            print('\nSpecial Character that will be replaced are:  {}'.format(re.escape(string.punctuation)))
+            df=clean_text_columns(df, columns_to_clean)
+        return concat_fields(df, fields_to_concat)
+    except Exception as e:
+        print('\nSomething went wrong while cleaning the input dataframe.')
+        print(e)
+
+
+
+def clean_dataframe_variants(df, columns_to_clean=config._COLUMNS_TO_CLEAN, fields_to_concat=config._FIELDS_TO_CONCAT):
+    """
+        DOCSTRING:  Single-pass equivalent of calling clean_dataframe() with and without replace_punctuations:
+                    the display-variant (original-info) is concatenated once, and the cleaned-variant cleans the columns-to-clean of it.
+                    Cleaning commutes with concatenation, hence a concatenated field made only of columns-to-clean is cleaned as a whole.
+                    Both variants keep the compact record-schema.
+        INPUT:      Dataframe, columns-to-clean, address-fields-to-concat
+        OUTPUT:     Cleaned-dataframe for the match-scores, Dataframe-with-original-info for the reports and masters.
+    """
+    try:
+        print('\nSpecial Character that will be replaced are:  {}'.format(re.escape(string.punctuation)))
+        display_df=concat_fields(df, fields_to_concat)
+        cleaned_columns=[colname for colname in columns_to_clean if colname in display_df.columns]
+        cleaned_columns+=[colname for colname, cols_to_concat in fields_to_concat.items() if set(cols_to_concat)<=set(columns_to_clean)]
+        cleaned_df=clean_text_columns(display_df, cleaned_columns)
         for colname, cols_to_concat in fields_to_concat.items():
-            copy_df[colname]=copy_df[cols_to_concat].apply(lambda single_row: ''.join(single_row.values), axis=1)
-        copy_df.drop(labels=fields_to_concat['CONCAT_ADDRESS'], axis=1, inplace=True)
-        return copy_df
+            if colname not in cleaned_columns:
+                cleaned_df[colname]=concat_fields(clean_text_columns(df[cols_to_concat], columns_to_clean), {colname: cols_to_concat})[colname]
+        return apply_record_schema(cleaned_df), apply_record_schema(display_df)
     except Exception as e:
         print('\nSomething went wrong while cleaning the input dataframe.')
         print(e)
@@ -106,6 +187,7 @@ def deduplicate_dataset_R(rscript_command, script_name, args):
                     Uses the Python subprocess module to create a new Pipe.
         INPUT:      Abs-path-of-32bit-Rscript-command, Script-to-invoke, Args-for-script
         OUTPUT:     Prints R-console output based on return-code. Rscript command generates a csv of the score_features, or errors out.
+                    Returns True if the Rscript succeeded, else False.
     """
     try:
         cmd = [rscript_command, script_name, args]
@@ -120,9 +202,11 @@ def deduplicate_dataset_R(rscript_command, script_name, args):
             print(output.decode())
             print('R ERROR:\n')
             print(error.decode())
+        return pipe.returncode==0
     except Exception as e:
         print('\nSomething went wrong while deduplicating the dataset for the R-Script {}.'.format(script_name))
         print(e)
+        return False
 
 
 
@@ -133,13 +217,53 @@ def scale_up_comparison_score(df, colname='SITE_NAME_COMPARISON_SCORE', scaling_
         OUTPUT:     Scaled up dataframe.
     """
     try:
-        df[colname]=df[colname].apply(lambda x: x*scaling_factor)
+        df[colname]=df[colname]*scaling_factor
     except Exception as e:
         print('\nSomething went wrong while scaling up the binary-scores for {}.'.format(colname))
         print(e)
 
 
 
+class TopMatchReducer(object):
+    """
+        DOCSTRING:  Streaming equivalent of return_top_match(): the score-features are fed in chunks as they are scored (or read), and only the best match
+                    per child-col is kept, hence the memory scales with the number of records instead of the number of potential-matches.
+                    Ties keep the earliest pair fed in, same as the stable sort of return_top_match(). The top-matches are all that the
+                    cyclic-dependency step (replace_cyclic_dependencies()) needs, as every record links to its master through its top-match only.
+    """
+    def __init__(self, child_column='SR_NUM_1', score_key_column='NUM_OF_MATCHES_FOUND', columns=None):
+        self.child_column=child_column
+        self.score_key_column=score_key_column
+        self.columns=columns
+        self.top_matches_df=None
+        self.n_pairs=0
+
+    def add(self, df):
+        if df.shape[0]==0:
+            return
+        self.n_pairs+=df.shape[0]
+        # Best pair of every child within the chunk; the stable sort keeps the earliest of equal scores
+        chunk_top=df.sort_values(by=self.score_key_column, ascending=False, kind='mergesort').drop_duplicates(subset=self.child_column)
+        chunk_top.index=chunk_top[self.child_column].values
+        if self.top_matches_df is None:
+            self.top_matches_df=chunk_top
+            return
+        kept_scores=self.top_matches_df[self.score_key_column].reindex(chunk_top.index).values
+        # Replaces the kept match only on a strictly higher score (the missing kept-scores compare False, hence are replaced)
+        improved=chunk_top[~(kept_scores>=chunk_top[self.score_key_column].values)]
+        if improved.shape[0]>0:
+            self.top_matches_df=pd.concat([self.top_matches_df.drop(improved.index, errors='ignore'), improved])
+
+    def top_matches(self):
+        """
+            DOCSTRING:  The top-match per child-col, ordered by child-col like return_top_match(); an empty dataframe of the columns if nothing was fed in.
+        """
+        if self.top_matches_df is None:
+            return pd.DataFrame(columns=self.columns)
+        return self.top_matches_df.sort_index().reset_index(drop=True)
+
+
+
 def return_top_match(df, child_column, score_key_column):
     """
         DOCSTRING:  Input Dataframe has SR_NUM_1 (child-col) matching against multiple SR_NUM_2.
@@ -179,36 +303,87 @@ def replace_cyclic_dependencies_backup(df, child_indicator, master_indicator, ve
 
 
 
-def replace_cyclic_dependencies(df, country_df, child_indicator='SR_NUM_1', master_indicator='SR_NUM_2', verbose=True):
+def resolve_match_clusters(child_codes, master_codes, link_scores, site_names, collapsed_child_scores=None):
+    """
+        DOCSTRING:  Disjoint-set (union-find) resolution of the transitive match-chains:  Record67 -> Record45 -> Record44  becomes  Record67 -> Record44.
+                    Every record has at most one link to its master (the top-match), so the links form a forest; root[x] is the compressed pointer
+                    from record x to the master of its cluster, filled in once per record by walking up to the first already-resolved ancestor.
+                    A record which is itself linked to a master keeps its own children (i.e. the link to its master is broken) if
+                    its best child-link scores higher than its own link, and its SITE_NAME differs from the SITE_NAME of the master it would merge into.
+                    The child-links of the exact duplicates collapsed before the scoring (see collapse_exact_duplicates()) count towards the best child-link too.
+        INPUT:      Array-of-child-codes, Array-of-master-codes, Array-of-link-scores (NUM_OF_MATCHES_FOUND), Array-of-site-names-per-code,
+                    Array-of-best-collapsed-child-score-per-code (optional, -inf for none)
+        OUTPUT:     Array-of-resolved-master-code-per-code, Boolean-array-of-codes-whose-link-is-broken.
+    """
+    n_codes=len(site_names)
+    link=np.full(n_codes, -1, dtype=np.int64)
+    link[child_codes]=master_codes
+    link_score=np.zeros(n_codes, dtype=np.float64)
+    link_score[child_codes]=link_scores
+    best_child_score=np.full(n_codes, -np.inf)
+    np.maximum.at(best_child_score, master_codes, link_scores)
+    if collapsed_child_scores is not None:
+        best_child_score=np.maximum(best_child_score, collapsed_child_scores)
+
+    root=np.full(n_codes, -1, dtype=np.int64)
+    is_broken=np.zeros(n_codes, dtype=bool)
+    for code in range(n_codes):
+        # Walk up the chain until an already-resolved record, or a record that is not linked to any master
+        path, codes_on_path=list(), set()
+        curr_code=code
+        while root[curr_code]==-1:
+            path.append(curr_code)
+            codes_on_path.add(curr_code)
+            if link[curr_code]==-1 or link[curr_code] in codes_on_path:
+                # A record pointing back into its own chain would be a true cycle; it is treated as the master of the chain
+                link[curr_code]=-1
+                break
+            curr_code=link[curr_code]
+        # Resolve the chain top-down, so that every record points directly to the master of its cluster
+        for curr_code in reversed(path):
+            if link[curr_code]==-1:
+                root[curr_code]=curr_code
+                continue
+            parent_root=root[link[curr_code]]
+            if best_child_score[curr_code]>link_score[curr_code] and site_names[curr_code]!=site_names[parent_root]:
+                is_broken[curr_code]=True
+                root[curr_code]=curr_code
+            else:
+                root[curr_code]=parent_root
+    return root, is_broken
+
+
+
+def replace_cyclic_dependencies(df, country_df, child_indicator='SR_NUM_1', master_indicator='SR_NUM_2', verbose=True, collapsed_child_scores=None):
     """
         DOCSTRING:  Input Dataframe has cases like-     Record45 matches with Record44, and Record67 matches with Record45.
                     In this case we should maintain-    Record67 matches with Record44.
-                    Applies a for-loop and replaces values in master-column whenever such a cyclic-occurence observed.
-        INPUT:      Dataframe-of-score-features-with-cyclic-indexes, child-column, master-column
+                    Resolves all such chains at once in near-linear time using resolve_match_clusters(), instead of scanning the columns per master-id.
+                    A link is dropped when the record has a higher-scoring link of its own child, and a different SITE_NAME than its resolved master.
+                    The collapsed exact duplicates are not scored, hence the score of their link to their representative is passed in separately.
+        INPUT:      Dataframe-of-score-features-with-cyclic-indexes, Dataframe-for-country, child-column, master-column, Verbose-flag,
+                    Series-of-best-collapsed-child-score-by-representative-SR_NUM (optional)
         OUTPUT:     Dataframe of normalized-score-features.
     """
     try:
         df.sort_values(by=[master_indicator, 'NUM_OF_MATCHES_FOUND'], ascending=[True, False], inplace=True)
-        arr1=set(df[child_indicator].array)
-        arr2=set(df[master_indicator].array)
-        for val in arr2:
-            if val in arr1:
-                replace_val=df.loc[df[child_indicator]==val, master_indicator].values[0]
-                score_for_original=df.loc[df[master_indicator]==val, 'NUM_OF_MATCHES_FOUND'].values[0]
-                score_for_replacement=df.loc[df[child_indicator]==val, 'NUM_OF_MATCHES_FOUND'].values[0]
-                original_sitename=country_df.loc[val, 'SITE_NAME']
-                replacement_sitename=country_df.loc[replace_val, 'SITE_NAME']
-                if score_for_original>score_for_replacement and original_sitename!=replacement_sitename:
-                    df.loc[df[child_indicator]==val, 'COUNTRY']='To be deleted'
-                    if verbose: print("Delete from df where {}={} and {}}={}".format(child_indicator,val,master_indicator,replace_val))
-                else:
-                    df[master_indicator].replace(val, replace_val, inplace=True)
-                    if verbose: print("{} [{}] will be replaced with {} [{}]".format(val,score_for_original,replace_val,score_for_replacement))
-
-        indexes_to_delete=df[df['COUNTRY']=='To be deleted'].index
+        codes, sr_nums=pd.factorize(pd.concat([df[child_indicator], df[master_indicator]], ignore_index=True))
+        child_codes, master_codes=codes[:df.shape[0]], codes[df.shape[0]:]
+        site_names=country_df['SITE_NAME'].reindex(sr_nums).to_numpy(dtype=object, na_value=np.nan)
+
+        if collapsed_child_scores is not None:
+            collapsed_child_scores=collapsed_child_scores.reindex(sr_nums).to_numpy(dtype=np.float64, na_value=-np.inf)
+        root, is_broken=resolve_match_clusters(child_codes, master_codes, df['NUM_OF_MATCHES_FOUND'].values, site_names, collapsed_child_scores)
+        resolved_masters=sr_nums.values[root[child_codes]]
+        if verbose:
+            for val, original_master, resolved_master in zip(df[child_indicator].values, df[master_indicator].values, resolved_masters):
+                if original_master!=resolved_master:
+                    print("{} will be replaced with {} for {}".format(original_master, resolved_master, val))
+        df[master_indicator]=resolved_masters
+
+        indexes_to_delete=df.index[is_broken[child_codes]]
         print("\n\n{} raw-score pairs will be deleted off as their cyclic dependecies have lower score than existing.".format(len(indexes_to_delete)))
         df.drop(indexes_to_delete, inplace=True)
-        df.sort_values(by=child_indicator)
         return df
     except Exception as e:
         print('\nSomething went wrong while replacing the cyclic-dependencies.')
@@ -253,24 +428,45 @@ def replace_cyclic_dependencies_bkp(df, child_indicator='SR_NUM_1', master_indic
 
 
 
-def clean_score_features(curr_country, country_df, source_dir=config._RAW_SCORES_DIRECTORY, target_dir=config._CLEANED_SCORES_DIRECTORY, verbose=True):
+def clean_score_features(curr_country, country_df, source_dir=config._RAW_SCORES_DIRECTORY, target_dir=config._CLEANED_SCORES_DIRECTORY, verbose=True, score_features=None, file_prefix=None,
+                         top_match_reducer=None, streaming_top_match=config._STREAMING_TOP_MATCH, collapsed_child_scores=None):
     """
         DOCSTRING:  Reads the output of the Rscript command that is a csv of score_features having total-score greater than a total-threshold.
+                    If the score_features were computed in-process by the Python engine, uses that dataframe directly instead,
+                    or the top-matches of the TopMatchReducer they were streamed into.
+                    With streaming_top_match, the csv is read in chunks of _SCORE_FEATURES_CHUNK_ROWS into a TopMatchReducer instead of all at once.
                     Invokes the top-match function, and the replace-cyclic-occurences function to get a set of clean-score-features.
                     Writes the dataframe in the Cleaned-Scores directory.
-        INPUT:      country-name
+        INPUT:      country-name, Dataframe-for-country, Source-directory, Target-directory, Verbose-flag, Dataframe-of-score-features (optional),
+                    Prefix-of-cleaned-scores-csv (defaults to country-name), TopMatchReducer-fed-by-the-scoring (optional), Flag-for-chunked-csv-reading,
+                    Series-of-best-collapsed-child-score-by-representative-SR_NUM (optional, see replace_cyclic_dependencies())
         OUTPUT:     Dataframe of cleaned-normalized-score-features.
     """
     try:
-        duplicates=pd.read_csv(os.path.join(source_dir, curr_country+'_Score_Features.csv'))
+        if top_match_reducer is None and score_features is None and streaming_top_match:
+            top_match_reducer=TopMatchReducer(child_column='SR_NUM_1', score_key_column='NUM_OF_MATCHES_FOUND')
+            with pd.read_csv(os.path.join(source_dir, curr_country+'_Score_Features.csv'), chunksize=config._SCORE_FEATURES_CHUNK_ROWS) as score_features_chunks:
+                for score_features_chunk in score_features_chunks:
+                    top_match_reducer.add(score_features_chunk)
+        if top_match_reducer is not None:
+            duplicates=top_match_reducer.top_matches()
+        elif score_features is None:
+            duplicates=pd.read_csv(os.path.join(source_dir, curr_country+'_Score_Features.csv'))
+        else:
+            duplicates=score_features.copy()
         # if no potential duplicates found, return an empty df
+        if duplicates.shape[0]==0:
+            return duplicates
         if duplicates.shape[0]==1 and duplicates['SR_NUM_1'][0]==0 and duplicates['SR_NUM_2'][0]==0:
             return duplicates.head(0)
 
         duplicates['COUNTRY']=curr_country
-        duplicates=return_top_match(df=duplicates, child_column='SR_NUM_1', score_key_column='NUM_OF_MATCHES_FOUND')
-        duplicates=replace_cyclic_dependencies(df=duplicates, country_df=country_df, child_indicator='SR_NUM_1', master_indicator='SR_NUM_2', verbose=verbose)
-        write_df_to_csv(df=duplicates, root_dir=target_dir, curr_country=curr_country, file_suffix='_Cleaned_Feature_Scores.csv')
+        if top_match_reducer is None:
+            duplicates=return_top_match(df=duplicates, child_column='SR_NUM_1', score_key_column='NUM_OF_MATCHES_FOUND')
+        duplicates=replace_cyclic_dependencies(df=duplicates, country_df=country_df, child_indicator='SR_NUM_1', master_indicator='SR_NUM_2', verbose=verbose,
+                                            collapsed_child_scores=collapsed_child_scores)
+        duplicates=apply_cross_ref_schema(duplicates)
+        write_df_to_csv(df=duplicates, root_dir=target_dir, curr_country=curr_country if file_prefix is None else file_prefix, file_suffix='_Cleaned_Feature_Scores.csv', background=True)
         print('\n"SR_NUM_2" will be the master record')
         return duplicates
     except Exception as e:
@@ -319,7 +515,7 @@ def generate_deduplicated_master(country_df, master_record_ids, curr_country, ta
     try:
         country_master_df=country_df.loc[master_record_ids]
         if write_csv:
-            write_df_to_csv(df=country_master_df, root_dir=target_dir, curr_country=curr_country, index_flag=True, file_suffix='_Master.csv')
+            write_df_to_csv(df=country_master_df, root_dir=target_dir, curr_country=curr_country, index_flag=True, file_suffix='_Master.csv', background=True)
         print('{} records get merged into {}'.format(country_df.shape[0],len(master_record_ids)))
         return country_master_df
     except Exception as e:
@@ -330,25 +526,21 @@ def generate_deduplicated_master(country_df, master_record_ids, curr_country, ta
 def generate_dummy_cross_refs_for_masters(master_record_ids, curr_country):
     """
         DOCSTRING:  Create a dummy cross-reference dataframe for master-records; Record45 matches with Record45 having a total match-score of maximum.
+                    The columns are built as arrays of the cross-ref-schema (see apply_cross_ref_schema()), instead of python-lists of floats.
         INPUT:      Unique set of master-record-ids (SR_NUM)
         OUTPUT:     Dataframe-of-dummy-entries-for-master-cross-references.
     """
     try:
-        master_record_score_array=[1.0]*len(master_record_ids)
-        master_record_df_dict={
-            'SR_NUM_1': list(master_record_ids),
-            'SR_NUM_2': list(master_record_ids),
-            'SITE_NAME_COMPARISON_SCORE': master_record_score_array,
-            'STATE_COMPARISON_SCORE': master_record_score_array,
-            'CITY_COMPARISON_SCORE': master_record_score_array,
-            'CONCAT_ADDRESS_COMPARISON_SCORE': master_record_score_array,
-            'POSTAL_CODE_COMPARISON_SCORE': master_record_score_array }
+        master_record_ids=np.fromiter(master_record_ids, dtype=np.int64, count=len(master_record_ids))
+        master_record_df_dict={'SR_NUM_1': master_record_ids, 'SR_NUM_2': master_record_ids.copy()}
+        for colname in ['SITE_NAME_COMPARISON_SCORE', 'STATE_COMPARISON_SCORE', 'CITY_COMPARISON_SCORE', 'CONCAT_ADDRESS_COMPARISON_SCORE', 'POSTAL_CODE_COMPARISON_SCORE']:
+            master_record_df_dict[colname]=np.ones(len(master_record_ids), dtype=np.int64)
 
         cross_ref_df=pd.DataFrame(master_record_df_dict)
         cross_ref_df['COUNTRY']=curr_country
         scale_up_comparison_score(cross_ref_df,'CONCAT_ADDRESS_COMPARISON_SCORE',config._SCALING_FACTOR)
         cross_ref_df['NUM_OF_MATCHES_FOUND']=cross_ref_df[config._COLS_FOR_TOTAL_MATCH_CALC].sum(axis=1)
-        return cross_ref_df
+        return apply_cross_ref_schema(cross_ref_df)
     except Exception as e:
         print('\nSomething went wrong while generating the dummy export of cross-references for the unique master-records.')
         print(e)
@@ -362,10 +554,10 @@ def generate_final_cross_refs(cross_ref_df, normalized_duplicates, curr_country,
         OUTPUT:     Dataframe-of-cross-references.
     """
     try:
-        cross_ref_df=cross_ref_df.append(normalized_duplicates)
+        cross_ref_df=apply_cross_ref_schema(pd.concat([cross_ref_df, normalized_duplicates]))
         cross_ref_df.sort_values(by=['SR_NUM_1'], axis=0, inplace=True)
         if write_csv:
-            write_df_to_csv(df=cross_ref_df, root_dir=target_dir, curr_country=curr_country, file_suffix='_Raw_Cross_Ref.csv')
+            write_df_to_csv(df=cross_ref_df, root_dir=target_dir, curr_country=curr_country, file_suffix='_Raw_Cross_Ref.csv', background=True)
         return cross_ref_df
     except Exception as e:
         print('\nSomething went wrong while generating the final cross-reference export.')
@@ -415,7 +607,7 @@ def generate_cross_ref_report(cross_ref_df, country_df, curr_country, target_dir
 
         columns_in_report_format=['SR_NUM_1', 'SR_NUM_2', 'SITE_NAME_1','SITE_NAME_2','SITE_NAME_COMPARISON_SCORE','STATE_1','STATE_2','STATE_COMPARISON_SCORE', 'CITY_1', 'CITY_2','CITY_COMPARISON_SCORE','CONCAT_ADDRESS_1','CONCAT_ADDRESS_2','CONCAT_ADDRESS_COMPARISON_SCORE', 'POSTAL_CODE_1','POSTAL_CODE_2',   'POSTAL_CODE_COMPARISON_SCORE','NUM_OF_MATCHES_FOUND']
         cross_ref_df=cross_ref_df[columns_in_report_format]
-        write_df_to_csv(df=cross_ref_df, root_dir=target_dir, curr_country=curr_country, file_suffix='_Cross_Ref_Full_Report.csv')
+        write_df_to_csv(df=cross_ref_df, root_dir=target_dir, curr_country=curr_country, file_suffix='_Cross_Ref_Full_Report.csv', background=True)
     except Exception as e:
         print('\nSomething went wrong while generating the final cross-reference report for ease of inspection.')
         print(e)
\ No newline at end of file